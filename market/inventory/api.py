@@ -0,0 +1,164 @@
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from .filters import SORT_COLUMNS, ProductFilter
+from .history import RESOLUTIONS, range_query
+from .models import Cart, Product
+from .pagination import KeysetPaginator, OffsetCursorPaginator
+from .reservations import line_available
+
+API_PAGE_SIZE = 50
+# Relevance-ranked results are paged by offset, so they stop after this many rows.
+API_RANKED_MAX_RESULTS = 1000
+HISTORY_DEFAULT_RANGE = timedelta(days=30)
+PRODUCT_FIELDS = ('id', 'name', 'unit_price', 'unit', 'quantity', 'rating_sum', 'rating_count', 'updated_at')
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')})
+
+
+def _serialize_product(row):
+    rating_sum, rating_count = row.pop('rating_sum'), row['rating_count']
+    row['avg_rating'] = round(rating_sum / rating_count, 2) if rating_count else None
+    return row
+
+
+def _conditional(request, rows, extra=''):
+    """
+    Strong ETag and Last-Modified from the rows' ids and updated_at. Returns
+    (not_modified_response_or_None, etag, last_modified).
+    """
+    digest = hashlib.sha1(extra.encode(), usedforsecurity=False)
+    last_modified = None
+    for row in rows:
+        digest.update(f"{row['id']}:{row['updated_at'].timestamp()};".encode())
+        if last_modified is None or row['updated_at'] > last_modified:
+            last_modified = row['updated_at']
+    etag = f'"{digest.hexdigest()}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return response, etag, timestamp
+
+
+def _with_validators(response, etag, timestamp):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+def product_list_api(request):
+    product_filter = ProductFilter(request.GET, queryset=Product.objects.all())
+    products = product_filter.qs
+    sort = product_filter.form.cleaned_data.get('sort')
+    if sort:
+        # Leaderboard sorts page on (score, id), which their indexes serve; rows carry the score.
+        column = SORT_COLUMNS[sort]
+        paginator = KeysetPaginator(products.values(*PRODUCT_FIELDS, column), API_PAGE_SIZE, score=column)
+    elif 'search_rank' in products.query.annotations:
+        # KeysetPaginator would re-order by id and lose the relevance order.
+        paginator = OffsetCursorPaginator(products.values(*PRODUCT_FIELDS), API_PAGE_SIZE, API_RANKED_MAX_RESULTS)
+    else:
+        paginator = KeysetPaginator(products.values(*PRODUCT_FIELDS), API_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('cursor'))
+    rows = page.object_list
+    not_modified, etag, timestamp = _conditional(
+        request, rows, extra=f'{page.next_cursor}|{page.previous_cursor}'
+    )
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, timestamp)
+    data = {
+        'results': [_serialize_product(row) for row in rows],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+    return _with_validators(_json(data), etag, timestamp)
+
+
+@require_GET
+def product_detail_api(request, pk):
+    row = Product.objects.filter(pk=pk).values(*PRODUCT_FIELDS, 'owner_id').first()
+    if row is None:
+        raise Http404("No product matches the given query.")
+    not_modified, etag, timestamp = _conditional(request, [row])
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, timestamp)
+    return _with_validators(_json(_serialize_product(row)), etag, timestamp)
+
+
+def _parse_moment(value):
+    """An ISO datetime, or a date meaning its midnight, in the current timezone unless given."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+@require_GET
+def product_history_api(request, pk):
+    """
+    Price and stock of one product over [since, until) (default: the last 30 days).
+    `resolution` is raw, hour or day; left out, the finest one kept for the range is used.
+    """
+    current = Product.objects.filter(pk=pk).values('unit_price', 'quantity', 'updated_at').first()
+    if current is None:
+        raise Http404("No product matches the given query.")
+    resolution = request.GET.get('resolution') or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return _json({'detail': f"resolution must be one of {', '.join(RESOLUTIONS)}."}, status=400)
+    try:
+        until = _parse_moment(request.GET['until']) if 'until' in request.GET else timezone.now()
+        since = _parse_moment(request.GET['since']) if 'since' in request.GET else until - HISTORY_DEFAULT_RANGE
+    except ValueError as exc:
+        return _json({'detail': f"Invalid date: {exc}"}, status=400)
+    if since >= until:
+        return _json({'detail': "since must be before until."}, status=400)
+
+    resolution, points, truncated = range_query(pk, since, until, resolution)
+    return _json({
+        'product': pk,
+        'since': since,
+        'until': until,
+        'resolution': resolution,
+        'points': points,
+        'truncated': truncated,
+        'current': current,
+    })
+
+
+@require_GET
+def cart_api(request):
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Authentication required.'}, status=401)
+    subtotal = ExpressionWrapper(F('product__unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=4))
+    lines = list(
+        Cart.objects.filter(user=request.user, status=Cart.Status.IN_CART)
+        .annotate(subtotal=subtotal, total=Window(Sum(subtotal)))
+        .order_by('added_at', 'pk')
+        .values(
+            'id', 'product_id', 'quantity', 'held_until', 'subtotal', 'total',
+            name=F('product__name'), unit_price=F('product__unit_price'), unit=F('product__unit'),
+            available=line_available(),
+        )
+    )
+    total = lines[0]['total'] if lines else 0
+    for line in lines:
+        del line['total']
+    response = _json({'items': lines, 'total': total})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,133 @@
+"""
+Async-native versions of the read-heavy views, routed instead of their sync
+counterparts when settings.ASYNC_VIEWS is on (the default under market/asgi.py).
+
+Templates only see data that is already loaded: `request.user` is resolved with
+`auser()` and foreign keys used by the templates are fetched with select_related,
+because a lazy query inside an async view raises SynchronousOnlyOperation.
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import BooleanField, DecimalField, ExpressionWrapper, F, Q, Sum, Window
+from django.shortcuts import aget_object_or_404, render
+
+from .cache import acart_summary, aget_listing_page, aget_products, alisting_cache_key, aset_listing_page
+from .catalog_io import aiterate, astream_csv
+from .facets import aget_facets
+from .filters import ProductFilter
+from .leaderboards import BOARDS, top_products
+from .models import Cart, Product, Rating
+from .reservations import line_available
+from .views import (
+    EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, PAGE_NUMBERS_MAX_RESULTS, PRODUCTS_PER_PAGE, _cursor_listing, _export_response,
+    _export_rows, _keyset_paginator, _label_unit_choices, _listing_page, _similar_products, _style_filter_form,
+)
+
+
+async def _resolve_user(request):
+    request.user = await request.auser()
+    if request.user.is_authenticated:
+        # For inventory.context_processors.cart, which can't query from here.
+        request.cart_summary = await acart_summary(request.user.pk)
+    return request.user
+
+
+async def products_view(request):
+    await _resolve_user(request)
+    product_filter = ProductFilter(request.GET, queryset=Product.objects.all().order_by('-id'))
+    products = product_filter.qs
+    _style_filter_form(product_filter.form)
+
+    cursor = request.GET.get('cursor')
+    page_number = request.GET.get('page', 1)
+    position = ('cursor', cursor) if cursor is not None else ('page', str(page_number))
+    cache_key = await alisting_cache_key(product_filter, position)
+    listing = await aget_listing_page(cache_key)
+    if listing is None:
+        listing = await _abuild_listing(products, cursor, page_number)
+        await aset_listing_page(cache_key, listing)
+    facets = await aget_facets(product_filter)
+    _label_unit_choices(product_filter.form, facets)
+
+    page_obj, page_numbers = _listing_page(products, listing, await aget_products(listing['ids']))
+    leaderboards = {board: await sync_to_async(top_products)(board) for board in BOARDS}
+    return render(request, 'inventory/products.html', {
+        'products': page_obj, 'filter': product_filter, 'page_numbers': page_numbers, 'form_key': uuid.uuid4().hex,
+        'leaderboards': leaderboards, 'facets': facets,
+    })
+
+
+async def _apage_ids(products, count, page_number):
+    paginator = Paginator(products, PRODUCTS_PER_PAGE)
+    paginator.count = count
+    number = paginator.get_page(page_number).number
+    bottom = (number - 1) * PRODUCTS_PER_PAGE
+    ids = [pk async for pk in products[bottom:bottom + PRODUCTS_PER_PAGE].values_list('pk', flat=True)]
+    return {'ids': ids, 'count': count, 'number': number}
+
+
+async def _abuild_listing(products, cursor, page_number):
+    """Async twin of views._build_listing; produces the same cacheable structure."""
+    if 'search_rank' in products.query.annotations:
+        return await _apage_ids(products, await products.acount(), page_number)
+    if cursor is None:
+        bounded_count = await products[:PAGE_NUMBERS_MAX_RESULTS + 1].acount()
+        if bounded_count <= PAGE_NUMBERS_MAX_RESULTS:
+            return await _apage_ids(products, bounded_count, page_number)
+    return _cursor_listing(await _keyset_paginator(products).aget_page(cursor))
+
+
+async def export_products_csv_view(request):
+    # An async iterator: under ASGI a sync one would be read into memory before sending.
+    rows = aiterate(_export_rows(request).iterator(chunk_size=EXPORT_CHUNK_SIZE), EXPORT_CHUNK_SIZE)
+    return _export_response(astream_csv(EXPORT_COLUMNS, rows))
+
+
+async def product_detail_view(request, pk):
+    user = await _resolve_user(request)
+    products = Product.objects.select_related('owner')
+    user_rating = None
+    if request.method == 'POST' and user.is_authenticated:
+        product = await aget_object_or_404(products, pk=pk)
+        rating_value = int(request.POST.get('rating'))
+        if 1 <= rating_value <= 5:
+            user_rating, _ = await Rating.objects.aupdate_or_create(product=product, user=user, defaults={'value': rating_value})
+            await product.arefresh_from_db(fields=['rating_sum', 'rating_count'])
+        else:
+            user_rating = await Rating.objects.filter(product=product, user=user).afirst()
+    elif user.is_authenticated:
+        # Awaited one after the other: ORM calls share one thread per request
+        # (thread-sensitive sync_to_async), so gathering them would not overlap them.
+        product = await aget_object_or_404(products, pk=pk)
+        user_rating = await Rating.objects.filter(product_id=pk, user=user).afirst()
+    else:
+        product = await aget_object_or_404(products, pk=pk)
+    similar = [entry async for entry in _similar_products(pk)]
+
+    return render(request, 'inventory/product_detail.html', {
+        'product': product, 'avg_rating': product.avg_rating, 'user_rating': user_rating, 'similar': similar,
+    })
+
+
+@login_required
+async def cart_view(request):
+    await _resolve_user(request)
+    line_subtotal = ExpressionWrapper(F('product__unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=4))
+    cart_items = [
+        item async for item in
+        Cart.objects.filter(user=request.user, status=Cart.Status.IN_CART)
+        .select_related('product')
+        .annotate(
+            subtotal=line_subtotal,
+            total=Window(Sum(line_subtotal)),
+            available=line_available(),
+            over_stock=ExpressionWrapper(Q(quantity__gt=line_available()), output_field=BooleanField()),
+        )
+        .order_by('added_at', 'pk')
+    ]
+    total = cart_items[0].total if cart_items else 0
+    has_over_stock = any(item.over_stock for item in cart_items)
+    return render(request, 'inventory/cart.html', {'cart_items': cart_items, 'total': total, 'has_over_stock': has_over_stock})
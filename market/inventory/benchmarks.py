@@ -0,0 +1,255 @@
+"""
+Synthetic catalog data and request scenarios for `manage.py benchmark`, and the
+per-object vs bulk comparison for `manage.py benchmark_bulk`.
+
+Scenarios go through the Django test client, so they cover URL routing, middleware,
+views and templates, but not a real server; use `benchmark_servers` for that.
+"""
+from decimal import Decimal
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from users.models import CustomUser
+from .bulk import delete_products, price_change, update_products
+from .management.commands.rebuild_rating_counters import rebuild_rating_counters
+from .models import Cart, Product, Rating
+from .seller_stats import rebuild as rebuild_seller_stats
+
+WORDS = [
+    'apple', 'green', 'red', 'organic', 'fresh', 'milk', 'cheese', 'bread', 'flour', 'sugar',
+    'paint', 'white', 'tile', 'ceramic', 'board', 'oak', 'pine', 'cement', 'sand', 'glue',
+    'juice', 'water', 'oil', 'olive', 'salt', 'pepper', 'rice', 'pasta', 'coffee', 'tea',
+]
+BENCHMARK_EMAIL_DOMAIN = 'benchmark.invalid'
+
+
+class Dataset:
+    def __init__(self, users, products, buyer):
+        self.users = users
+        self.products = products
+        self.buyer = buyer
+
+
+def generate_dataset(users=100, products=1000, ratings_per_product=5, carts=20, items_per_cart=3,
+                     seed=0, batch_size=5000):
+    """
+    Bulk-insert users, products, ratings and in-cart rows. Signals don't fire for
+    bulk_create, so rating counters are rebuilt once at the end and no cart
+    notifications are queued.
+    """
+    rng = random.Random(seed)
+    password = make_password('benchmark')
+    CustomUser.objects.bulk_create(
+        [
+            CustomUser(email=f'user{i}-{seed}@{BENCHMARK_EMAIL_DOMAIN}', name='Bench', surname=str(i), password=password, is_active=True)
+            for i in range(max(users, 1))
+        ],
+        batch_size=batch_size,
+    )
+    user_ids = list(
+        CustomUser.objects.filter(email__endswith=f'-{seed}@{BENCHMARK_EMAIL_DOMAIN}').order_by('pk').values_list('pk', flat=True)
+    )
+    units = [choice for choice, _ in Product.Unit.choices]
+    Product.objects.bulk_create(
+        [
+            Product(
+                owner_id=rng.choice(user_ids),
+                name=' '.join(rng.sample(WORDS, 3)),
+                unit_price=Decimal(rng.randint(50, 50_000)) / 100,
+                unit=rng.choice(units),
+                quantity=rng.randint(0, 1000),
+            )
+            for _ in range(products)
+        ],
+        batch_size=batch_size,
+    )
+    product_ids = list(Product.objects.filter(owner_id__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+    raters = min(ratings_per_product, len(user_ids))
+    Rating.objects.bulk_create(
+        [
+            Rating(product_id=product_id, user_id=user_id, value=rng.randint(1, 5))
+            for product_id in product_ids
+            for user_id in rng.sample(user_ids, raters)
+        ],
+        batch_size=batch_size,
+    )
+    rebuild_rating_counters()
+    rebuild_seller_stats(owner_ids=user_ids)
+
+    per_cart = min(items_per_cart, len(product_ids))
+    Cart.objects.bulk_create(
+        [
+            Cart(user_id=user_id, product_id=product_id, quantity=1, status=Cart.Status.IN_CART)
+            for user_id in user_ids[:carts]
+            for product_id in rng.sample(product_ids, per_cart)
+        ],
+        batch_size=batch_size,
+    )
+    # The buyer's cart starts empty; the scenarios fill it themselves.
+    buyer = CustomUser.objects.get(pk=user_ids[-1])
+    Cart.objects.filter(user=buyer).delete()
+    return Dataset(user_ids, product_ids, buyer)
+
+
+class Scenario:
+    """One request shape; `prepare(i)` runs untimed before iteration i and returns (method, path, data)."""
+
+    def __init__(self, name, prepare, login=False, expected_status=(200,)):
+        self.name = name
+        self.prepare = prepare
+        self.login = login
+        self.expected_status = expected_status
+
+
+def build_scenarios(dataset, rng):
+    products_url = reverse('inventory:products')
+    in_stock = list(
+        Product.objects.filter(pk__in=dataset.products, quantity__gte=100).values_list('pk', flat=True)
+    ) or dataset.products
+
+    def listing(query):
+        return lambda i: ('get', products_url, query)
+
+    def detail(i):
+        return 'get', reverse('inventory:product_detail', args=[rng.choice(dataset.products)]), None
+
+    def add_to_cart(i):
+        return 'post', reverse('inventory:add_to_cart', args=[in_stock[i % len(in_stock)]]), {}
+
+    def cart(i):
+        return 'get', reverse('inventory:cart'), None
+
+    def purchase(i):
+        for product_id in rng.sample(in_stock, min(3, len(in_stock))):
+            Cart.objects.update_or_create(
+                user=dataset.buyer, product_id=product_id, status=Cart.Status.IN_CART, defaults={'quantity': 1}
+            )
+        return 'post', reverse('inventory:purchase'), {}
+
+    redirect = (302,)
+    return [
+        Scenario('products', listing({})),
+        Scenario('products_page_2', listing({'page': 2})),
+        Scenario('products_name', listing({'name': 'olive'})),
+        Scenario('products_unit', listing({'unit': Product.Unit.KILOGRAM})),
+        Scenario('products_price', listing({'min_price': 10, 'max_price': 100})),
+        Scenario('products_quantity', listing({'min_quantity': 100, 'max_quantity': 500})),
+        Scenario('products_combined', listing({'name': 'oil', 'unit': Product.Unit.LITRE, 'min_price': 5, 'min_quantity': 1})),
+        Scenario('product_detail', detail),
+        Scenario('add_to_cart', add_to_cart, login=True, expected_status=redirect),
+        Scenario('cart', cart, login=True),
+        Scenario('purchase', purchase, login=True, expected_status=redirect),
+    ]
+
+
+def run_scenario(scenario, dataset, iterations, warmup=2, cold_cache=False):
+    client = Client()
+    if scenario.login:
+        client.force_login(dataset.buyer)
+
+    query_counts, latencies, errors = [], [], 0
+
+    def count_query(execute, sql, params, many, context):
+        query_counts[-1] += 1
+        return execute(sql, params, many, context)
+
+    # `manage.py benchmark` runs inside one transaction that is rolled back, so
+    # on_commit hooks (cache eviction, listing version, cart cache) would never fire.
+    # Each request's run right after it, timed and counted as on a real commit; the
+    # setup's run untimed.
+    for i in range(warmup + iterations):
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            method, path, data = scenario.prepare(i)
+        if cold_cache:
+            cache.clear()
+        query_counts.append(0)
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query), TestCase.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(path, data)
+        elapsed = time.perf_counter() - start
+        if i < warmup:
+            query_counts.pop()
+            continue
+        latencies.append(elapsed)
+        errors += response.status_code not in scenario.expected_status
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'rps': len(latencies) / sum(latencies),
+        'queries_median': statistics.median(query_counts),
+        'queries_max': max(query_counts),
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Return (scenario, metric, baseline, current) for every regression: p50 latency
+    worse by more than `tolerance` (a fraction), or any increase in query count.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append((name, 'p50_ms', previous['p50_ms'], current['p50_ms']))
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append((name, 'queries_max', previous['queries_max'], current['queries_max']))
+    return regressions
+
+
+def measure(operation):
+    """Run `operation()` once; returns its wall time in ms and the number of queries it sent."""
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        operation()
+    return {'ms': (time.perf_counter() - start) * 1000, 'queries': queries}
+
+
+def compare_bulk_operations(product_ids, percent=10):
+    """
+    Raise prices by `percent` and then delete, once through save()/delete() per object
+    for the first half of `product_ids` and once through inventory.bulk for the second.
+    """
+    half = len(product_ids) // 2
+    per_object = Product.objects.filter(pk__in=product_ids[:half])
+    bulk = Product.objects.filter(pk__in=product_ids[half:])
+    new_price = price_change(percent=percent)
+
+    def save_each():
+        for product in per_object:
+            product.unit_price = new_price(product.unit_price)
+            product.save()
+
+    def delete_each():
+        for product in per_object:
+            product.delete()
+
+    results = {}
+    for name, one_by_one, in_bulk in (
+        ('price_update', save_each, lambda: update_products(bulk, price=new_price)),
+        ('delete', delete_each, lambda: delete_products(bulk)),
+    ):
+        results[name] = {'products': half, 'per_object': measure(one_by_one), 'bulk': measure(in_bulk)}
+        results[name]['speedup'] = results[name]['per_object']['ms'] / max(results[name]['bulk']['ms'], 1e-9)
+    return results
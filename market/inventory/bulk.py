@@ -0,0 +1,185 @@
+"""
+Bulk price, stock and delete operations over a selection of products.
+
+A selection (any Product queryset, e.g. a ProductFilter's, or ids) is walked in
+primary-key chunks, each handled in its own transaction with a fixed number of
+statements whatever the chunk size: lock and read the rows, one UPDATE (or one
+DELETE per dependent table, after a SELECT for dependents with dependents of their
+own), one INSERT of price/stock history, one UPDATE of the seller stats.
+save()/delete() and their signals are bypassed, so what those receivers maintain
+one object at a time is done here for the whole chunk.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .cache import bump_listing_version, evict_product
+from .history import record
+from .leaderboards import BOARDS, refresh_entries
+from .models import Product
+from .reservations import _per_product
+from .seller_stats import apply_many as apply_seller_stats
+
+CHUNK_SIZE = 500
+CENT = Decimal('0.01')
+
+ACTIONS = [
+    ('price_percent', 'Change price by %'),
+    ('price_amount', 'Change price by amount'),
+    ('stock_amount', 'Change stock by'),
+    ('stock_set', 'Set stock to'),
+    ('delete', 'Delete'),
+]
+
+
+def _chunks(selection, chunk_size):
+    """Primary keys of `selection` in ascending chunks (keyset, so deletes don't shift pages)."""
+    ids = selection.order_by().values_list('pk', flat=True)
+    after = 0
+    while True:
+        chunk = list(ids.filter(pk__gt=after).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def _run(selection, handle_chunk, chunk_size, progress):
+    total = selection.count() if progress else None
+    done = changed = 0
+    for ids in _chunks(selection, chunk_size):
+        with transaction.atomic():
+            changed += handle_chunk(ids)
+            transaction.on_commit(lambda ids=ids: ([evict_product(pk) for pk in ids], bump_listing_version()))
+        done += len(ids)
+        if progress:
+            progress(done, total)
+    return changed
+
+
+def price_change(percent=None, amount=None):
+    """New-price function: scale by `percent` or add `amount`, rounded to cents, never below zero."""
+    factor = 1 + Decimal(percent or 0) / 100
+    amount = Decimal(amount or 0)
+    return lambda price: max((price * factor + amount).quantize(CENT, rounding=ROUND_HALF_UP), Decimal(0))
+
+
+def stock_change(amount=None, set_to=None):
+    """New-stock function: add `amount` or set to `set_to`. Held stock (reserved) can't be taken away."""
+    def change(quantity, reserved):
+        new = Decimal(set_to) if set_to is not None else quantity + Decimal(amount or 0)
+        return max(new.quantize(CENT, rounding=ROUND_HALF_UP), reserved, Decimal(0))
+    return change
+
+
+def update_products(selection, price=None, stock=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Apply `price(unit_price)` and/or `stock(quantity, reserved)` (see price_change and
+    stock_change) to every product in `selection`. Returns how many changed.
+    """
+    def handle_chunk(ids):
+        rows = (
+            Product.objects.select_for_update().filter(pk__in=ids)
+            .values_list('pk', 'owner_id', 'unit', 'unit_price', 'quantity', 'reserved', named=True)
+        )
+        new_prices, new_quantities, points = {}, {}, []
+        stock_value = defaultdict(Decimal)
+        for row in rows:
+            unit_price = price(row.unit_price) if price else row.unit_price
+            quantity = stock(row.quantity, row.reserved) if stock else row.quantity
+            if (unit_price, quantity) == (row.unit_price, row.quantity):
+                continue
+            new_prices[row.pk], new_quantities[row.pk] = unit_price, quantity
+            points.append((row.pk, unit_price, quantity))
+            stock_value[row.owner_id, row.unit] += unit_price * quantity - row.unit_price * row.quantity
+        if not points:
+            return 0
+        Product.objects.filter(pk__in=new_prices).update(
+            unit_price=_per_product(new_prices), quantity=_per_product(new_quantities), updated_at=timezone.now(),
+        )
+        record(points)
+        apply_seller_stats({seller: {'stock_value': delta} for seller, delta in stock_value.items()})
+        return len(points)
+
+    return _run(selection, handle_chunk, chunk_size, progress)
+
+
+def _delete_where(model, field, ids):
+    """DELETE without loading rows or sending signals."""
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.get_field(field).column)} IN ({placeholders})',
+            ids,
+        )
+        return cursor.rowcount
+
+
+def _relations(model):
+    # Reverse foreign keys, including the related_name='+' ones related_objects leaves out.
+    return [f for f in model._meta.get_fields(include_hidden=True) if f.auto_created and not f.concrete]
+
+
+def _delete_dependents(model, ids):
+    """
+    The same on_delete handling as the ORM's for the rows of `model` with `ids`,
+    minus loading rows: SET_NULL relations are cleared, cascaded rows deleted with
+    one statement per table. Rows that have dependents of their own are cascaded
+    recursively, which costs a SELECT of their keys first.
+    """
+    for relation in _relations(model):
+        related, field = relation.related_model, relation.field.name
+        if relation.on_delete is models.SET_NULL:
+            related.objects.filter(**{f'{field}__in': ids}).update(**{field: None})
+        elif _relations(related):
+            child_ids = list(related.objects.filter(**{f'{field}__in': ids}).values_list('pk', flat=True))
+            if child_ids:
+                _delete_dependents(related, child_ids)
+                _delete_where(related, related._meta.pk.name, child_ids)
+        else:
+            _delete_where(related, field, ids)
+
+
+def delete_products(selection, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Delete every product in `selection` with its ratings, cart lines and other
+    dependent rows; order lines keep their snapshot and lose the link, as with
+    product.delete(). Returns how many products were deleted.
+    """
+    def handle_chunk(ids):
+        rows = list(
+            Product.objects.select_for_update().filter(pk__in=ids)
+            .values_list('owner_id', 'unit', 'unit_price', 'quantity', 'rating_sum', 'rating_count', 'units_sold')
+        )
+        totals = defaultdict(lambda: dict.fromkeys(('products', 'stock_value', 'rating_sum', 'rating_count', 'units_sold'), 0))
+        for owner_id, unit, unit_price, quantity, rating_sum, rating_count, units_sold in rows:
+            seller = totals[owner_id, unit]
+            seller['products'] -= 1
+            seller['stock_value'] -= unit_price * quantity
+            seller['rating_sum'] -= rating_sum
+            seller['rating_count'] -= rating_count
+            seller['units_sold'] -= units_sold
+        apply_seller_stats(totals)
+
+        _delete_dependents(Product, ids)
+        deleted = _delete_where(Product, 'id', ids)
+        transaction.on_commit(lambda: [refresh_entries(board, ids) for board in BOARDS])
+        return deleted
+
+    return _run(selection, handle_chunk, chunk_size, progress)
+
+
+def run_action(action, value, selection, chunk_size=CHUNK_SIZE, progress=None):
+    """Run one of ACTIONS with `value` over `selection`; returns how many products it changed or deleted."""
+    if action == 'delete':
+        return delete_products(selection, chunk_size, progress)
+    changes = {
+        'price_percent': {'price': price_change(percent=value)},
+        'price_amount': {'price': price_change(amount=value)},
+        'stock_amount': {'stock': stock_change(amount=value)},
+        'stock_set': {'stock': stock_change(set_to=value)},
+    }[action]
+    return update_products(selection, chunk_size=chunk_size, progress=progress, **changes)
@@ -0,0 +1,230 @@
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+from .models import Cart, Product
+
+LISTING_VERSION_KEY = 'inventory:listing:version'
+LISTING_HITS_KEY = 'inventory:listing:hits'
+LISTING_MISSES_KEY = 'inventory:listing:misses'
+LISTING_TIMEOUT = 5 * 60
+PRODUCT_TIMEOUT = 15 * 60
+CART_TIMEOUT = 60 * 60
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Missing key: seed it. add() loses to a concurrent seed, so retry the incr once.
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+async def _aincr(key, delta=1):
+    try:
+        return await cache.aincr(key, delta)
+    except ValueError:
+        if await cache.aadd(key, delta, timeout=None):
+            return delta
+        return await cache.aincr(key, delta)
+
+
+def get_listing_version():
+    version = cache.get(LISTING_VERSION_KEY)
+    if version is None:
+        cache.add(LISTING_VERSION_KEY, 1, timeout=None)
+        version = cache.get(LISTING_VERSION_KEY, 1)
+    return version
+
+
+async def aget_listing_version():
+    version = await cache.aget(LISTING_VERSION_KEY)
+    if version is None:
+        await cache.aadd(LISTING_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(LISTING_VERSION_KEY, 1)
+    return version
+
+
+def bump_listing_version():
+    """Invalidate every cached listing page. Old entries simply stop being addressed."""
+    _incr(LISTING_VERSION_KEY)
+
+
+def normalize_filter_params(product_filter):
+    """Return a canonical, ordered tuple of the filter values that actually apply."""
+    product_filter.errors
+    params = []
+    for name in sorted(product_filter.filters):
+        value = product_filter.form.cleaned_data.get(name)
+        if value in (None, ''):
+            continue
+        if isinstance(value, Decimal):
+            value = format(value.normalize(), 'f')
+        params.append((name, str(value)))
+    return tuple(params)
+
+
+def _listing_digest(product_filter, position):
+    query = urlencode(normalize_filter_params(product_filter) + (tuple(position),))
+    return hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+
+
+def listing_cache_key(product_filter, position):
+    """`position` identifies the page within the result set, e.g. ('page', '2')."""
+    return f'inventory:listing:{get_listing_version()}:{_listing_digest(product_filter, position)}'
+
+
+async def alisting_cache_key(product_filter, position):
+    return f'inventory:listing:{await aget_listing_version()}:{_listing_digest(product_filter, position)}'
+
+
+def get_listing_page(key):
+    page = cache.get(key)
+    _incr(LISTING_HITS_KEY if page is not None else LISTING_MISSES_KEY)
+    return page
+
+
+async def aget_listing_page(key):
+    page = await cache.aget(key)
+    await _aincr(LISTING_HITS_KEY if page is not None else LISTING_MISSES_KEY)
+    return page
+
+
+def set_listing_page(key, page):
+    cache.set(key, page, LISTING_TIMEOUT)
+
+
+async def aset_listing_page(key, page):
+    await cache.aset(key, page, LISTING_TIMEOUT)
+
+
+def product_cache_key(pk):
+    return f'inventory:product:{pk}'
+
+
+def get_products(ids):
+    """Return products for `ids` in order, reading the DB only for cache misses."""
+    keys = {product_cache_key(pk): pk for pk in ids}
+    cached = {keys[key]: product for key, product in cache.get_many(keys).items()}
+    missing = [pk for pk in ids if pk not in cached]
+    if missing:
+        fetched = Product.objects.in_bulk(missing)
+        cache.set_many({product_cache_key(pk): product for pk, product in fetched.items()}, PRODUCT_TIMEOUT)
+        cached.update(fetched)
+    return [cached[pk] for pk in ids if pk in cached]
+
+
+async def aget_products(ids):
+    keys = {product_cache_key(pk): pk for pk in ids}
+    cached = {keys[key]: product for key, product in (await cache.aget_many(keys)).items()}
+    missing = [pk for pk in ids if pk not in cached]
+    if missing:
+        fetched = await Product.objects.ain_bulk(missing)
+        await cache.aset_many({product_cache_key(pk): product for pk, product in fetched.items()}, PRODUCT_TIMEOUT)
+        cached.update(fetched)
+    return [cached[pk] for pk in ids if pk in cached]
+
+
+def evict_product(pk):
+    cache.delete(product_cache_key(pk))
+
+
+def cart_cache_key(user_id):
+    return f'inventory:cart:{user_id}'
+
+
+def _in_cart(user_id):
+    return Cart.objects.filter(user_id=user_id, status=Cart.Status.IN_CART).values_list('product_id', 'quantity')
+
+
+def get_cart_lines(user_id):
+    """{product_id: quantity} of the user's open cart lines, read from the DB only when not cached."""
+    key = cart_cache_key(user_id)
+    lines = cache.get(key)
+    if lines is None:
+        lines = dict(_in_cart(user_id))
+        cache.set(key, lines, CART_TIMEOUT)
+    return lines
+
+
+async def aget_cart_lines(user_id):
+    key = cart_cache_key(user_id)
+    lines = await cache.aget(key)
+    if lines is None:
+        lines = {product_id: quantity async for product_id, quantity in _in_cart(user_id)}
+        await cache.aset(key, lines, CART_TIMEOUT)
+    return lines
+
+
+def _update_cart(user_id, change):
+    # Only an entry that is already cached is changed; a missing one is rebuilt on read.
+    # Two concurrent changes for one user can race here; the entry expires, so a lost
+    # update lasts at most CART_TIMEOUT.
+    key = cart_cache_key(user_id)
+    lines = cache.get(key)
+    if lines is None:
+        return
+    if change(lines) is False:
+        cache.delete(key)
+    else:
+        cache.set(key, lines, CART_TIMEOUT)
+
+
+def set_cart_line(user_id, product_id, quantity):
+    """Record a line's new quantity, or its removal with `quantity` None. Call after commit."""
+    def change(lines):
+        if quantity is None:
+            lines.pop(product_id, None)
+        else:
+            lines[product_id] = quantity
+    _update_cart(user_id, change)
+
+
+def add_to_cart_line(user_id, product_id, by):
+    def change(lines):
+        if product_id not in lines:
+            # The entry missed the line being created, so it can't be patched.
+            return False
+        lines[product_id] += by
+    _update_cart(user_id, change)
+
+
+def clear_cart(user_id):
+    """After checkout: every open line was just purchased."""
+    cache.set(cart_cache_key(user_id), {}, CART_TIMEOUT)
+
+
+def forget_cart(user_id):
+    cache.delete(cart_cache_key(user_id))
+
+
+def _summarize_cart(lines, products):
+    # Prices come from the product cache, so they are as current as the listing's. Lines
+    # whose product has gone (e.g. bulk deleted) no longer count.
+    return {
+        'count': len(products),
+        'total': sum((product.unit_price * lines[product.pk] for product in products), Decimal(0)),
+    }
+
+
+def cart_summary(user_id):
+    """{'count': open lines, 'total': their value at current prices}."""
+    lines = get_cart_lines(user_id)
+    return _summarize_cart(lines, get_products(list(lines)))
+
+
+async def acart_summary(user_id):
+    lines = await aget_cart_lines(user_id)
+    return _summarize_cart(lines, await aget_products(list(lines)))
+
+
+def listing_cache_stats():
+    stats = cache.get_many([LISTING_HITS_KEY, LISTING_MISSES_KEY])
+    hits = stats.get(LISTING_HITS_KEY, 0)
+    misses = stats.get(LISTING_MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
@@ -0,0 +1,166 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+
+from .forms import ProductForm
+from .models import Product
+
+PRODUCT_COLUMNS = ['id', 'name', 'unit_price', 'unit', 'quantity', 'owner']
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _parse_json_row(line):
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError as e:
+        return ValidationError(f'Invalid JSON: {e.msg}.')
+    if not isinstance(row, dict):
+        return ValidationError(f'Expected a JSON object, got {type(row).__name__}.')
+    return row
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line_number, dict) pairs without loading the file into memory. A JSONL
+    line that isn't an object comes back as a ValidationError in place of the dict,
+    so it is rejected like any other invalid row instead of ending the import.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_number, _parse_json_row(line)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ProductRowValidator:
+    """
+    Clean import rows with ProductForm's fields and then the model's own validators,
+    as ProductForm does, but resolve owners for a whole chunk in one query instead
+    of one per row.
+    """
+
+    fields = ['name', 'unit_price', 'unit', 'quantity']
+
+    def __init__(self, owner_model, default_owner=None):
+        self.form_fields = ProductForm.base_fields
+        self.owner_model = owner_model
+        self.default_owner = default_owner
+
+    def clean_chunk(self, rows):
+        owner_ids = {_as_int(row.get('owner')) for _, row in rows if isinstance(row, dict)} - {None}
+        valid_owner_ids = set()
+        if owner_ids:
+            valid_owner_ids = set(self.owner_model.objects.filter(pk__in=owner_ids).values_list('pk', flat=True))
+        products, errors = [], []
+        for line_number, row in rows:
+            try:
+                if isinstance(row, ValidationError):
+                    raise row
+                products.append(self.clean_row(row, valid_owner_ids))
+            except ValidationError as e:
+                errors.append((line_number, '; '.join(e.messages)))
+        # An upsert may touch each row once per statement: the last occurrence of an id wins.
+        by_pk = {p.pk: p for p in products if p.pk is not None}
+        products = [p for p in products if p.pk is None] + list(by_pk.values())
+        return products, errors
+
+    def clean_row(self, row, valid_owner_ids):
+        cleaned = {}
+        messages = []
+        for name in self.fields:
+            try:
+                cleaned[name] = self.form_fields[name].clean(row.get(name))
+            except ValidationError as e:
+                messages.extend(f'{name}: {m}' for m in e.messages)
+
+        owner = row.get('owner')
+        if owner in (None, ''):
+            if self.default_owner is None:
+                messages.append('owner: This field is required.')
+            else:
+                cleaned['owner_id'] = self.default_owner.pk
+        else:
+            owner = _as_int(owner)
+            if owner not in valid_owner_ids:
+                messages.append(f"owner: Unknown user {row.get('owner')!r}.")
+            cleaned['owner_id'] = owner
+
+        pk = row.get('id')
+        if pk not in (None, ''):
+            cleaned['pk'] = _as_int(pk)
+            if cleaned['pk'] is None:
+                messages.append(f'id: {pk!r} is not an integer.')
+        if messages:
+            raise ValidationError(messages)
+        product = Product(**cleaned)
+        # Form fields don't run model validators (e.g. MinValueValidator); owners were checked above.
+        try:
+            product.clean_fields(exclude=[f.name for f in Product._meta.fields if f.name not in self.fields])
+        except ValidationError as e:
+            raise ValidationError([f'{name}: {m}' for name, errors in e.message_dict.items() for m in errors])
+        return product
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def aiterate(rows, chunk_size):
+    """
+    Async iterator over a sync one (e.g. QuerySet.iterator()), a chunk at a time in
+    the sync thread. Stands in for QuerySet.aiterator(), which on Django 5.2 runs a
+    values_list() query in the event loop and raises SynchronousOnlyOperation.
+    """
+    rows = iter(rows)
+    while chunk := await sync_to_async(list)(islice(rows, chunk_size)):
+        for row in chunk:
+            yield row
+
+
+async def astream_csv(header, rows):
+    """stream_csv over an async iterator, so ASGI servers stream it instead of buffering it."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    async for row in rows:
+        yield writer.writerow(row)
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Yield product rows as dicts straight from a server-side cursor."""
+    columns = ['id', 'name', 'unit_price', 'unit', 'quantity', 'owner_id']
+    for values in queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size):
+        yield dict(zip(PRODUCT_COLUMNS, values))
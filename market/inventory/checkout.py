@@ -0,0 +1,116 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_listing_version, clear_cart, evict_product
+from .history import record
+from .leaderboards import refresh_entries
+from .models import Cart, Order, OrderLine, Product
+from .reservations import _per_product, release_expired_holds
+from .seller_stats import products_sold
+
+Shortfall = namedtuple('Shortfall', ['product_id', 'name', 'requested', 'available'])
+PurchasedLine = namedtuple('PurchasedLine', ['cart_id', 'product_id', 'quantity'])
+
+
+class CheckoutConflict(Exception):
+    pass
+
+
+class CheckoutResult:
+    def __init__(self, purchased=(), shortfalls=(), order=None):
+        self.purchased = list(purchased)
+        self.shortfalls = list(shortfalls)
+        self.order = order
+
+    @property
+    def ok(self):
+        return bool(self.purchased) and not self.shortfalls
+
+
+def checkout(user):
+    """
+    Buy everything in `user`'s cart in one transaction, or nothing.
+
+    Cart rows are locked first, then products in primary-key order so concurrent
+    checkouts can't deadlock. Stock is taken with a single conditional UPDATE that also
+    turns the buyer's holds (see inventory.reservations) into the sale, and the
+    purchase is recorded as an Order whose lines snapshot name, price and unit.
+    """
+    # Expired holds on these products must not count against the buyer. Released in
+    # their own transaction, before any of this one's locks are taken.
+    cart_products = Cart.objects.filter(user=user, status=Cart.Status.IN_CART).values('product_id')
+    release_expired_holds(product_ids=cart_products)
+
+    with transaction.atomic():
+        lines = list(
+            Cart.objects.select_for_update()
+            .filter(user=user, status=Cart.Status.IN_CART)
+            .order_by('product_id')
+            .values_list('pk', 'product_id', 'quantity', 'held', named=True)
+        )
+        if not lines:
+            return CheckoutResult()
+
+        requested, held = {}, {}
+        for line in lines:
+            requested[line.product_id] = requested.get(line.product_id, Decimal(0)) + line.quantity
+            held[line.product_id] = held.get(line.product_id, Decimal(0)) + line.held
+        products = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=requested)
+            .order_by('pk')
+            .values_list('pk', 'owner_id', 'name', 'unit_price', 'unit', 'quantity', 'reserved', named=True)
+        )
+        # Our own holds count as available to us; everyone else's don't. A line for
+        # nothing (or less) is never bought: it would give stock back and pay the buyer.
+        available = {p.pk: p.quantity - p.reserved + held[p.pk] for p in products}
+        shortfalls = [
+            Shortfall(p.pk, p.name, requested[p.pk], max(available[p.pk], 0))
+            for p in products if requested[p.pk] <= 0 or available[p.pk] < requested[p.pk]
+        ]
+        if shortfalls:
+            return CheckoutResult(shortfalls=shortfalls)
+
+        needed, own_holds = _per_product(requested), _per_product(held)
+        now = timezone.now()
+        updated = Product.objects.filter(pk__in=requested, quantity__gte=F('reserved') - own_holds + needed).update(
+            quantity=F('quantity') - needed,
+            reserved=F('reserved') - own_holds,
+            units_sold=F('units_sold') + needed,
+            updated_at=now,
+        )
+        if updated != len(products):
+            # Only reachable without row locks (e.g. SQLite); never leave a partial sale.
+            raise CheckoutConflict("Stock changed during checkout")
+        # The rows are locked, so the new stock is known without reading it back.
+        record(((p.pk, p.unit_price, p.quantity - requested[p.pk]) for p in products), now)
+        products_sold((p.owner_id, p.unit, p.unit_price, requested[p.pk]) for p in products)
+
+        order_lines = [
+            OrderLine(product_id=p.pk, product_name=p.name, unit_price=p.unit_price, unit=p.unit, quantity=requested[p.pk])
+            for p in products
+        ]
+        order = Order.objects.create(user=user, total=sum(line.subtotal for line in order_lines))
+        for line in order_lines:
+            line.order = order
+        OrderLine.objects.bulk_create(order_lines)
+        Cart.objects.filter(pk__in=[line.pk for line in lines]).update(
+            status=Cart.Status.PURCHASED, held=0, held_until=None
+        )
+
+        product_ids = list(requested)
+        transaction.on_commit(lambda: (
+            [evict_product(pk) for pk in product_ids],
+            bump_listing_version(),
+            refresh_entries('best_selling', product_ids),
+            clear_cart(user.pk),
+        ))
+
+    return CheckoutResult(
+        purchased=[PurchasedLine(line.pk, line.product_id, line.quantity) for line in lines],
+        order=order,
+    )
@@ -0,0 +1,16 @@
+from .cache import cart_summary
+
+
+def cart(request):
+    """
+    `cart_summary` ({'count', 'total'}) for the navbar's cart badge. Served from the
+    per-user cart cache, so a page render costs no queries once it is warm. Async
+    views load it beforehand (request.cart_summary): the ORM can't run from here there.
+    """
+    summary = getattr(request, 'cart_summary', None)
+    if summary is None:
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return {}
+        summary = cart_summary(user.pk)
+    return {'cart_summary': summary}
@@ -0,0 +1,115 @@
+"""
+Facet metadata for the product listing: how many products of each unit there are,
+and the price and quantity range on offer, for the current filter.
+
+Each facet ignores its own filter, as facets do: the unit counts ignore the unit
+filter, and the price range ignores the price bounds, so a slider bounded by it can
+still be widened again. Everything comes from one GROUP BY unit query with the
+other filters as conditional aggregates; the overall ranges are the min/max of the
+per-unit ones. Results are cached like listing pages, under the listing version and
+the normalized filter values, so any product change retires them.
+"""
+import hashlib
+from functools import reduce
+from operator import and_
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+from django.utils.http import urlencode
+
+from .cache import LISTING_TIMEOUT, aget_listing_version, get_listing_version, normalize_filter_params
+from .models import Product
+
+# Filters that order the results without changing which products match.
+ORDER_ONLY = {'sort'}
+# The filters behind each facet; each facet is computed without its own.
+FACET_FILTERS = {
+    'unit': ('unit',),
+    'price': ('min_price', 'max_price'),
+    'quantity': ('min_quantity', 'max_quantity'),
+}
+
+
+def _digest(product_filter):
+    params = [(name, value) for name, value in normalize_filter_params(product_filter) if name not in ORDER_ONLY]
+    return hashlib.md5(urlencode(params).encode(), usedforsecurity=False).hexdigest()
+
+
+def facets_cache_key(product_filter):
+    return f'inventory:facets:{get_listing_version()}:{_digest(product_filter)}'
+
+
+async def afacets_cache_key(product_filter):
+    return f'inventory:facets:{await aget_listing_version()}:{_digest(product_filter)}'
+
+
+def _grouped(product_filter):
+    """One row per unit: its counts and ranges, each facet under every filter but its own."""
+    if not product_filter.is_valid():
+        return product_filter.queryset.none().values('unit')
+    products = product_filter.queryset
+    conditions = dict.fromkeys(FACET_FILTERS, Q())
+    facet_of = {name: facet for facet, names in FACET_FILTERS.items() for name in names}
+    for name, value in product_filter.form.cleaned_data.items():
+        if value in (None, ''):
+            continue
+        filter_ = product_filter.filters[name]
+        if name in facet_of:
+            conditions[facet_of[name]] &= Q(**{f'{filter_.field_name}__{filter_.lookup_expr}': value})
+        else:
+            # Search and the like narrow every facet alike.
+            products = filter_.filter(products, value)
+
+    def others(facet):
+        return reduce(and_, (q for name, q in conditions.items() if name != facet), Q())
+
+    return (
+        products.order_by().values('unit')
+        .annotate(
+            count=Count('pk', filter=others('unit')),
+            matched=Count('pk', filter=reduce(and_, conditions.values())),
+            min_price=Min('unit_price', filter=others('price')), max_price=Max('unit_price', filter=others('price')),
+            min_quantity=Min('quantity', filter=others('quantity')),
+            max_quantity=Max('quantity', filter=others('quantity')),
+        )
+    )
+
+
+def _summarize(rows):
+    """
+    {'units': [(value, label, count), ...] for every Product.Unit, 'count' of products
+    matching the whole filter, and 'min_price'/'max_price'/'min_quantity'/'max_quantity'
+    (None when nothing is in range)}.
+    """
+    counts = {row['unit']: row['count'] for row in rows}
+    facets = {
+        'units': [(value, label, counts.get(value, 0)) for value, label in Product.Unit.choices],
+        'count': sum(row['matched'] for row in rows),
+    }
+    for bound, pick in (('min', min), ('max', max)):
+        for field in ('price', 'quantity'):
+            name = f'{bound}_{field}'
+            facets[name] = pick((row[name] for row in rows if row[name] is not None), default=None)
+    return facets
+
+
+def compute_facets(product_filter):
+    return _summarize(list(_grouped(product_filter)))
+
+
+def get_facets(product_filter):
+    key = facets_cache_key(product_filter)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(product_filter)
+        cache.set(key, facets, LISTING_TIMEOUT)
+    return facets
+
+
+async def aget_facets(product_filter):
+    key = await afacets_cache_key(product_filter)
+    facets = await cache.aget(key)
+    if facets is None:
+        facets = _summarize([row async for row in _grouped(product_filter)])
+        await cache.aset(key, facets, LISTING_TIMEOUT)
+    return facets
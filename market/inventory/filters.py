@@ -1,12 +1,24 @@
 import django_filters
 from .models import Product
+from .search import get_search_backend
+
+
+SORT_CHOICES = [('top_rated', 'Top rated'), ('best_selling', 'Best selling')]
+SORT_COLUMNS = {'top_rated': 'rating_score', 'best_selling': 'units_sold'}
 
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name', lookup_expr='icontains', label='Name contains')
+    name = django_filters.CharFilter(field_name='name', method='search_name', label='Name contains')
     unit = django_filters.ChoiceFilter(field_name='unit', choices=Product.Unit.choices, label='Unit')
     min_price = django_filters.NumberFilter(field_name='unit_price', lookup_expr='gte', label='Min price')
     max_price = django_filters.NumberFilter(field_name='unit_price', lookup_expr='lte', label='Max price')
     min_quantity = django_filters.NumberFilter(field_name='quantity', lookup_expr='gte', label='Min quantity')
     max_quantity = django_filters.NumberFilter(field_name='quantity', lookup_expr='lte', label='Max quantity')
+    sort = django_filters.ChoiceFilter(choices=SORT_CHOICES, method='sort_by', empty_label='Newest', label='Sort')
+
+    def sort_by(self, queryset, name, value):
+        # Declared last, so an explicit sort takes precedence over search rank.
+        return queryset.order_by(f'-{SORT_COLUMNS[value]}', '-id')
 
+    def search_name(self, queryset, name, value):
+        return get_search_backend().search(queryset, value)
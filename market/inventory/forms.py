@@ -1,8 +1,40 @@
 from django import forms
+from .bulk import ACTIONS
 from .models import Product
 
 
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'unit_price', 'unit', 'quantity', 'owner']
\ No newline at end of file
+        fields = ['name', 'unit_price', 'unit', 'quantity', 'owner']
+
+    def clean_quantity(self):
+        # Stock held by carts can't be taken away, as in bulk.update_products.
+        quantity = self.cleaned_data['quantity']
+        if quantity is not None and quantity < self.instance.reserved:
+            raise forms.ValidationError(f"{self.instance.reserved} are held in carts; stock can't go below that.")
+        return quantity
+
+
+class BulkEditForm(forms.Form):
+    action = forms.ChoiceField(choices=ACTIONS)
+    value = forms.DecimalField(max_digits=12, decimal_places=2, required=False)
+    ids = forms.CharField(
+        required=False, label='Product ids',
+        help_text='Comma-separated. Leave empty to apply to every product matching the filter.',
+    )
+
+    def clean_ids(self):
+        raw = self.cleaned_data['ids'].replace(' ', '')
+        if not raw:
+            return None
+        try:
+            return [int(pk) for pk in raw.split(',') if pk]
+        except ValueError:
+            raise forms.ValidationError('Enter product ids separated by commas.')
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('action') not in (None, 'delete') and cleaned.get('value') is None:
+            self.add_error('value', 'This action needs a value.')
+        return cleaned
@@ -0,0 +1,193 @@
+"""
+Price and stock history.
+
+Product.unit_price and Product.quantity are overwritten in place, so every change
+is also appended to ProductHistory with both values as they are after it. Writes
+are batched: record() is one INSERT for any number of products, and the paths that
+change many products at once (checkout, import) call it once per transaction.
+
+Raw points are kept PRODUCT_HISTORY_RAW_RETENTION seconds. `manage.py
+compact_product_history` folds them into hourly rollups and hours into days, then
+drops raw points and hourly rollups past their retention, so a year of a busy
+product is a few hundred daily rows. range_query() reads the finest resolution
+still kept for the requested range.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ProductHistory, ProductHistoryRollup
+
+RAW = 'raw'
+HOUR = ProductHistoryRollup.Resolution.HOUR
+DAY = ProductHistoryRollup.Resolution.DAY
+RESOLUTIONS = (RAW, HOUR, DAY)
+
+# Longest range served from raw points when the resolution is chosen automatically.
+RAW_MAX_SPAN = timedelta(days=2)
+
+ROLLUP_FIELDS = (
+    'price_open', 'price_low', 'price_high', 'price_close',
+    'quantity_low', 'quantity_high', 'quantity_close', 'changes',
+)
+
+
+def record(points, now=None):
+    """Append (product_id, unit_price, quantity) `points` with one INSERT; returns how many."""
+    now = now or timezone.now()
+    rows = [
+        ProductHistory(product_id=pk, recorded_at=now, unit_price=unit_price, quantity=quantity)
+        for pk, unit_price, quantity in points
+    ]
+    if rows:
+        ProductHistory.objects.bulk_create(rows)
+    return len(rows)
+
+
+def truncate(moment, resolution):
+    """Start of the UTC hour or day containing `moment`."""
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if resolution == DAY else moment
+
+
+def _raw_points(start, stop):
+    rows = (
+        ProductHistory.objects.filter(recorded_at__gte=start, recorded_at__lt=stop)
+        .order_by('recorded_at', 'pk')
+        .values_list('product_id', 'recorded_at', 'unit_price', 'quantity')
+    )
+    # A raw point is a rollup of one change.
+    for pk, moment, price, quantity in rows.iterator(chunk_size=5000):
+        yield pk, moment, price, price, price, price, quantity, quantity, quantity, 1
+
+
+def _hourly_rollups(start, stop):
+    return (
+        ProductHistoryRollup.objects.filter(resolution=HOUR, bucket__gte=start, bucket__lt=stop)
+        .order_by('bucket', 'pk')
+        .values_list('product_id', 'bucket', *ROLLUP_FIELDS)
+        .iterator(chunk_size=5000)
+    )
+
+
+def _fold(rows, resolution):
+    """Merge time-ordered rollup tuples into one ProductHistoryRollup per product and bucket."""
+    buckets = {}
+    for product_id, moment, *values in rows:
+        key = (product_id, truncate(moment, resolution))
+        merged = buckets.get(key)
+        if merged is None:
+            buckets[key] = values
+            continue
+        _, price_low, price_high, price_close, quantity_low, quantity_high, quantity_close, changes = values
+        merged[1] = min(merged[1], price_low)
+        merged[2] = max(merged[2], price_high)
+        merged[3] = price_close
+        merged[4] = min(merged[4], quantity_low)
+        merged[5] = max(merged[5], quantity_high)
+        merged[6] = quantity_close
+        merged[7] += changes
+    return [
+        ProductHistoryRollup(product_id=pk, resolution=resolution, bucket=bucket, **dict(zip(ROLLUP_FIELDS, values)))
+        for (pk, bucket), values in buckets.items()
+    ]
+
+
+def _roll_up(source, resolution, start, end, window, batch_size):
+    """Upsert `resolution` rollups of `source` rows in [start, end), a `window` of time at a time."""
+    written = 0
+    while start < end:
+        stop = min(start + window, end)
+        rollups = _fold(source(start, stop), resolution)
+        for offset in range(0, len(rollups), batch_size):
+            ProductHistoryRollup.objects.bulk_create(
+                rollups[offset:offset + batch_size],
+                update_conflicts=True,
+                unique_fields=['product', 'resolution', 'bucket'],
+                update_fields=ROLLUP_FIELDS,
+            )
+        written += len(rollups)
+        start = stop
+    return written
+
+
+def _resume_from(resolution, first_source_time):
+    # The newest bucket may have been written before it was complete, so it is redone.
+    last = ProductHistoryRollup.objects.filter(resolution=resolution).aggregate(last=Max('bucket'))['last']
+    first = last or first_source_time
+    return truncate(first, resolution) if first else None
+
+
+def _delete_before(queryset, field, cutoff, batch_size):
+    deleted = 0
+    while True:
+        pks = list(queryset.filter(**{f'{field}__lt': cutoff}).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def compact(now=None, batch_size=1000):
+    """
+    Roll complete hours of raw points into hourly rollups and complete days of those
+    into daily ones, then delete what is past retention and already rolled up.
+    Safe to rerun: rollups are upserted. Returns counts by step.
+    """
+    now = now or timezone.now()
+    hour_end, day_end = truncate(now, HOUR), truncate(now, DAY)
+    result = dict.fromkeys(('hourly', 'daily', 'raw_deleted', 'hourly_deleted'), 0)
+
+    start = _resume_from(HOUR, ProductHistory.objects.aggregate(first=Min('recorded_at'))['first'])
+    if start is not None:
+        result['hourly'] = _roll_up(_raw_points, HOUR, start, hour_end, timedelta(days=1), batch_size)
+    hourly = ProductHistoryRollup.objects.filter(resolution=HOUR)
+    start = _resume_from(DAY, hourly.aggregate(first=Min('bucket'))['first'])
+    if start is not None:
+        result['daily'] = _roll_up(_hourly_rollups, DAY, start, day_end, timedelta(days=30), batch_size)
+
+    raw_cutoff = min(now - timedelta(seconds=settings.PRODUCT_HISTORY_RAW_RETENTION), hour_end)
+    result['raw_deleted'] = _delete_before(ProductHistory.objects.all(), 'recorded_at', raw_cutoff, batch_size)
+    hourly_cutoff = min(now - timedelta(seconds=settings.PRODUCT_HISTORY_HOURLY_RETENTION), day_end)
+    result['hourly_deleted'] = _delete_before(hourly, 'bucket', hourly_cutoff, batch_size)
+    return result
+
+
+def choose_resolution(since, until, now=None):
+    """The finest resolution that is still kept for `since` and gives a chartable number of points."""
+    now = now or timezone.now()
+    if until - since <= RAW_MAX_SPAN and since >= now - timedelta(seconds=settings.PRODUCT_HISTORY_RAW_RETENTION):
+        return RAW
+    if (
+        until - since <= timedelta(hours=settings.PRODUCT_HISTORY_MAX_POINTS)
+        and since >= now - timedelta(seconds=settings.PRODUCT_HISTORY_HOURLY_RETENTION)
+    ):
+        return HOUR
+    return DAY
+
+
+def range_query(product_id, since, until, resolution=None):
+    """
+    One product's history in [since, until), oldest first, as (resolution, rows,
+    truncated). Rows are dicts: recorded_at, unit_price and quantity for raw points,
+    bucket and ROLLUP_FIELDS for rollups. At most PRODUCT_HISTORY_MAX_POINTS rows.
+    """
+    resolution = resolution or choose_resolution(since, until)
+    if resolution == RAW:
+        rows = (
+            ProductHistory.objects.filter(product_id=product_id, recorded_at__gte=since, recorded_at__lt=until)
+            .order_by('recorded_at', 'pk')
+            .values('recorded_at', 'unit_price', 'quantity')
+        )
+    else:
+        rows = (
+            ProductHistoryRollup.objects.filter(
+                product_id=product_id, resolution=resolution, bucket__gte=truncate(since, resolution), bucket__lt=until,
+            )
+            .order_by('bucket')
+            .values('bucket', *ROLLUP_FIELDS)
+        )
+    limit = settings.PRODUCT_HISTORY_MAX_POINTS
+    rows = list(rows[:limit + 1])
+    return resolution, rows[:limit], len(rows) > limit
@@ -0,0 +1,149 @@
+"""
+"Top rated" and "best selling" leaderboards.
+
+The ranking scores live on Product (rating_score, units_sold), kept current by the
+same UPDATEs that change ratings and stock, and indexed, so the database can always
+answer a leaderboard or a sorted listing without grouping Rating or OrderLine rows.
+
+With the Redis cache backend the top LEADERBOARD_SIZE products of each board are
+also kept in a sorted set, updated after every commit that changes a score. The
+set expires LEADERBOARD_MAX_STALENESS seconds after it was loaded from the database
+and is then reloaded, so an update lost to a Redis hiccup is corrected within that
+bound. Without Redis (or while it is down) the top ids are read from the database
+and cached for the same interval.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .cache import get_products
+from .models import OrderLine, Product
+
+logger = logging.getLogger(__name__)
+
+BOARDS = {
+    'top_rated': ('rating_score', Q(rating_count__gt=0)),
+    'best_selling': ('units_sold', Q(units_sold__gt=0)),
+}
+
+# ARGV: size, then (product id, score) pairs; an empty score removes the product.
+# Does nothing when the set has expired, so it is never left holding a partial board.
+_UPDATE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then return 0 end
+for i = 2, #ARGV - 1, 2 do
+    if ARGV[i + 1] == '' then
+        redis.call('zrem', KEYS[1], ARGV[i])
+    else
+        redis.call('zadd', KEYS[1], ARGV[i + 1], ARGV[i])
+    end
+end
+redis.call('zremrangebyrank', KEYS[1], 0, -(tonumber(ARGV[1]) + 1))
+return 1
+"""
+
+
+def rating_score(sum_delta=0, count_delta=0):
+    """The top-rated score as an UPDATE expression, after adding the deltas to the counters."""
+    votes = F('rating_count') + count_delta + Product.RATING_PRIOR_WEIGHT
+    points = F('rating_sum') + sum_delta + Product.RATING_PRIOR_MEAN * Product.RATING_PRIOR_WEIGHT
+    return Cast(points, FloatField()) / Cast(votes, FloatField())
+
+
+def _redis():
+    if not settings.CACHES['default']['BACKEND'].startswith('django_redis.'):
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _redis_key(board):
+    return f'inventory:leaderboard:{board}'
+
+
+def _ranked(board, limit):
+    column, condition = BOARDS[board]
+    return list(
+        Product.objects.filter(condition).order_by(f'-{column}', '-id').values_list('pk', column)[:limit]
+    )
+
+
+def _load_redis(client, board):
+    entries = _ranked(board, settings.LEADERBOARD_SIZE)
+    key, staging = _redis_key(board), _redis_key(board) + ':loading'
+    pipe = client.pipeline()
+    pipe.delete(staging)
+    if entries:
+        pipe.zadd(staging, {str(pk): float(score) for pk, score in entries})
+        pipe.expire(staging, settings.LEADERBOARD_MAX_STALENESS)
+        pipe.rename(staging, key)
+    else:
+        pipe.delete(key)
+    pipe.execute()
+    return [pk for pk, _ in entries]
+
+
+def top_product_ids(board, limit):
+    client = _redis()
+    if client is not None:
+        try:
+            ids = client.zrevrange(_redis_key(board), 0, limit - 1)
+            if ids or client.exists(_redis_key(board)):
+                return [int(pk) for pk in ids]
+            ids = _load_redis(client, board)
+            if ids:
+                return ids[:limit]
+            # An empty board has no sorted set; cache that below instead of reloading per request.
+        except Exception:
+            logger.warning("Leaderboard %s: Redis unavailable, reading the database", board, exc_info=True)
+    ids = cache.get(_redis_key(board))
+    if ids is None:
+        ids = [pk for pk, _ in _ranked(board, settings.LEADERBOARD_SIZE)]
+        cache.set(_redis_key(board), ids, settings.LEADERBOARD_MAX_STALENESS)
+    return ids[:limit]
+
+
+def top_products(board, limit=5):
+    return get_products(top_product_ids(board, limit))
+
+
+def refresh_entries(board, product_ids):
+    """Copy the current scores of `product_ids` into the Redis board, if it is loaded. Call after commit."""
+    client = _redis()
+    if client is None:
+        return
+    column, condition = BOARDS[board]
+    scores = dict(Product.objects.filter(condition, pk__in=product_ids).values_list('pk', column))
+    args = [settings.LEADERBOARD_SIZE]
+    for pk in product_ids:
+        args += [pk, float(scores[pk]) if pk in scores else '']
+    try:
+        client.eval(_UPDATE_SCRIPT, 1, _redis_key(board), *args)
+    except Exception:
+        logger.warning("Leaderboard %s: Redis update failed; it reloads within %ss", board, settings.LEADERBOARD_MAX_STALENESS, exc_info=True)
+
+
+def rebuild_scores():
+    """Recompute units_sold from order history and rating_score from the rating counters."""
+    sold = OrderLine.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    units = DecimalField(max_digits=12, decimal_places=2)
+    return Product.objects.update(
+        rating_score=rating_score(),
+        units_sold=Coalesce(Subquery(sold.annotate(total=Sum('quantity')).values('total'), output_field=units), 0, output_field=units),
+        updated_at=timezone.now(),
+    )
+
+
+def invalidate():
+    """Drop every cached copy of the boards; the next read reloads them from the database."""
+    client = _redis()
+    for board in BOARDS:
+        cache.delete(_redis_key(board))
+        if client is not None:
+            try:
+                client.delete(_redis_key(board))
+            except Exception:
+                logger.warning("Leaderboard %s: Redis unavailable", board, exc_info=True)
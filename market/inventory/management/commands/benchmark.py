@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from inventory.benchmarks import build_scenarios, compare_to_baseline, generate_dataset, run_scenario
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+# Pages cached against rolled-back rows must not leak into the configured cache.
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'inventory-benchmark'}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic catalog and time the inventory pages through the test client. "
+        "Prints JSON results; compares them with a stored baseline when one exists. "
+        "All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--ratings-per-product', type=int, default=5)
+        parser.add_argument('--carts', type=int, default=50, help="Users that get an in-cart basket.")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="Run only these scenarios (repeatable).")
+        parser.add_argument('--cold-cache', action='store_true', help="Clear the cache before every request.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p50 slowdown as a fraction of the baseline.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = {}
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        # The add-to-cart throttle would turn most of that scenario into 429s.
+        unthrottled = {'ADD_TO_CART_BURST': 10**9, 'ADD_TO_CART_RATE': 10**9}
+        with override_settings(CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=allowed_hosts, **unthrottled), transaction.atomic():
+            dataset = generate_dataset(
+                users=options['users'],
+                products=options['products'],
+                ratings_per_product=options['ratings_per_product'],
+                carts=options['carts'],
+                seed=options['seed'],
+            )
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            for scenario in build_scenarios(dataset, rng):
+                if options['scenarios'] and scenario.name not in options['scenarios']:
+                    continue
+                results[scenario.name] = run_scenario(scenario, dataset, options['iterations'], cold_cache=options['cold_cache'])
+                self.stderr.write(
+                    f"{scenario.name:<20} p50 {results[scenario.name]['p50_ms']:>8.2f} ms  "
+                    f"queries {results[scenario.name]['queries_max']:>3}  errors {results[scenario.name]['errors']}"
+                )
+            transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'users': options['users'],
+                'products': options['products'],
+                'ratings_per_product': options['ratings_per_product'],
+                'carts': options['carts'],
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+                'cold_cache': options['cold_cache'],
+            },
+            'scenarios': results,
+        }
+        baseline_path = Path(options['baseline'])
+        regressions = []
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+            self.stderr.write(f"Baseline saved to {baseline_path}")
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            if baseline['meta'] != report['meta']:
+                self.stderr.write(self.style.WARNING("Baseline was recorded with different parameters; comparison is approximate."))
+            regressions = compare_to_baseline(results, baseline['scenarios'], options['tolerance'])
+            report['regressions'] = [
+                {'scenario': name, 'metric': metric, 'baseline': before, 'current': after}
+                for name, metric, before, after in regressions
+            ]
+            for name, metric, before, after in regressions:
+                self.stderr.write(self.style.ERROR(f"Regression in {name}: {metric} {before:.2f} -> {after:.2f}"))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n')
+        else:
+            self.stdout.write(output)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} regression(s) against {baseline_path}")
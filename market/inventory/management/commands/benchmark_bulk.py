@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from inventory.benchmarks import compare_bulk_operations, generate_dataset
+from inventory.management.commands.benchmark import BENCHMARK_CACHES
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a price change and a delete over N products through save()/delete() per object "
+        "and through the chunked bulk operations. Prints JSON; all generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help="Products per path.")
+        parser.add_argument('--ratings-per-product', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with override_settings(CACHES=BENCHMARK_CACHES), transaction.atomic():
+            dataset = generate_dataset(
+                users=50, products=options['products'] * 2, ratings_per_product=options['ratings_per_product'],
+                carts=20, seed=options['seed'],
+            )
+            results = compare_bulk_operations(dataset.products)
+            transaction.set_rollback(True)
+
+        for name, result in results.items():
+            self.stderr.write(
+                f"{name:<13} per-object {result['per_object']['ms']:>9.1f} ms {result['per_object']['queries']:>6} queries  "
+                f"bulk {result['bulk']['ms']:>8.1f} ms {result['bulk']['queries']:>4} queries  x{result['speedup']:.1f}"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
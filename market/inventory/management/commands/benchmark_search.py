@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from inventory.benchmarks import WORDS
+from inventory.models import Product
+from inventory.search import get_search_backend
+from users.models import CustomUser
+
+QUERIES = ['apple', 'oliv', 'ceramic tile', 'pine']
+
+
+class Command(BaseCommand):
+    help = (
+        "Time product name search against the old icontains filter at several catalog sizes. "
+        "Rows are generated inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        backend = get_search_backend()
+        self.stdout.write(f"backend={type(backend).__name__} vendor={connection.vendor}")
+        self.stdout.write(f"{'rows':>10} {'query':<14} {'icontains ms':>13} {'search ms':>10} {'hits':>8}")
+
+        with transaction.atomic():
+            owner = CustomUser.objects.create_user('search-benchmark@example.com', None, name='Bench', surname='Mark')
+            created = 0
+            for size in sorted(options['sizes']):
+                while created < size:
+                    batch = min(options['batch_size'], size - created)
+                    Product.objects.bulk_create(
+                        [
+                            Product(
+                                owner=owner,
+                                name=' '.join(rng.sample(WORDS, 3)),
+                                unit_price=1,
+                                unit=Product.Unit.PIECE,
+                            )
+                            for _ in range(batch)
+                        ],
+                        batch_size=batch,
+                    )
+                    created += batch
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE inventory_product')
+
+                for query in QUERIES:
+                    baseline = self.measure(
+                        lambda: Product.objects.filter(name__icontains=query).order_by('-id')[:20], options['repeat']
+                    )
+                    searched = self.measure(
+                        lambda: backend.search(Product.objects.all(), query)[:20], options['repeat']
+                    )
+                    hits = backend.search(Product.objects.all(), query).count()
+                    self.stdout.write(f"{size:>10} {query:<14} {baseline:>13.2f} {searched:>10.2f} {hits:>8}")
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(make_queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(make_queryset())
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Product
+
+DEFAULT_WSGI_CMD = "gunicorn market.wsgi:application --workers {workers} --threads 4 --bind 127.0.0.1:{port}"
+DEFAULT_ASGI_CMD = "uvicorn market.asgi:application --workers {workers} --host 127.0.0.1 --port {port} --no-access-log"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the catalog and product detail pages under a WSGI and an ASGI server "
+        "started locally (gunicorn and uvicorn by default; install them to run this)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-cmd', default=DEFAULT_WSGI_CMD)
+        parser.add_argument('--asgi-cmd', default=DEFAULT_ASGI_CMD)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per path per deployment.")
+
+    def handle(self, *args, **options):
+        product_id = Product.objects.order_by('-id').values_list('pk', flat=True).first()
+        if product_id is None:
+            raise CommandError("The catalog is empty; load some products first.")
+        paths = ['/inventory/', '/inventory/?unit=kg', f'/inventory/{product_id}/']
+
+        self.stdout.write(f"{'server':<6} {'path':<24} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for label, template, async_views in (('wsgi', options['wsgi_cmd'], 'False'), ('asgi', options['asgi_cmd'], 'True')):
+            command = shlex.split(template.format(workers=options['workers'], port=options['port']))
+            if shutil.which(command[0]) is None:
+                raise CommandError(f"{command[0]} is not installed; pass --{label}-cmd to use another server.")
+            env = {**os.environ, 'ASYNC_VIEWS': async_views, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'market.settings')}
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                base_url = f"http://127.0.0.1:{options['port']}"
+                self.wait_until_up(base_url + paths[0])
+                for path in paths:
+                    result = self.load(base_url + path, options['requests'], options['concurrency'])
+                    self.stdout.write(
+                        f"{label:<6} {path:<24} {result['rps']:>9.1f} {result['p50']:>8.1f} "
+                        f"{result['p95']:>8.1f} {result['errors']:>7}"
+                    )
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    @staticmethod
+    def fetch(url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    def wait_until_up(self, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.fetch(url)[1]:
+                return
+            time.sleep(0.25)
+        raise CommandError(f"Server did not answer {url} within {timeout}s")
+
+    def load(self, url, count, concurrency):
+        # Warm caches and connections before measuring.
+        for _ in range(concurrency):
+            self.fetch(url)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(self.fetch, [url] * count))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(ms for ms, ok in results if ok)
+        return {
+            'rps': len(latencies) / elapsed if elapsed else 0,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if latencies else 0,
+            'errors': sum(1 for _, ok in results if not ok),
+        }
@@ -0,0 +1,48 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bulk import ACTIONS, CHUNK_SIZE, run_action
+from inventory.filters import ProductFilter
+from inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Change prices or stock of, or delete, many products with chunked UPDATE/DELETE statements. "
+        "Select products by --ids or by ProductFilter parameters (--filter unit=kg --filter max_price=10)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=[action for action, _ in ACTIONS])
+        parser.add_argument('value', nargs='?', help="Percent, amount or stock level; not used by delete.")
+        parser.add_argument('--ids', help="Comma-separated product ids.")
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE')
+        parser.add_argument('--owner', type=int, help="Only products of this owner id.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        value = None
+        if options['action'] != 'delete':
+            try:
+                value = Decimal(options['value'])
+            except (TypeError, InvalidOperation):
+                raise CommandError(f"{options['action']} needs a numeric value")
+
+        products = Product.objects.all()
+        if options['owner'] is not None:
+            products = products.filter(owner_id=options['owner'])
+        if options['ids']:
+            products = products.filter(pk__in=[int(pk) for pk in options['ids'].split(',') if pk])
+        params = dict(item.split('=', 1) for item in options['filter'])
+        product_filter = ProductFilter(params, queryset=products)
+        if not product_filter.is_valid():
+            raise CommandError(f"Invalid filter: {product_filter.errors.as_text()}")
+
+        def progress(done, total):
+            self.stderr.write(f"\r{done}/{total} products", ending='')
+
+        count = run_action(options['action'], value, product_filter.qs, options['chunk_size'], progress)
+        self.stderr.write('')
+        verb = 'Deleted' if options['action'] == 'delete' else 'Changed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} products"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from inventory.history import compact
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll price and stock history up into hourly and daily rows and drop raw points and "
+        "hourly rollups past their retention. Run from cron hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = compact(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            "Wrote {hourly} hourly and {daily} daily rollups; deleted {raw_deleted} raw points "
+            "and {hourly_deleted} hourly rollups".format(**result)
+        ))
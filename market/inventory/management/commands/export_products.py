@@ -0,0 +1,43 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inventory.catalog_io import PRODUCT_COLUMNS, detect_format, export_rows
+from inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog to a CSV or JSONL file (or stdout) at constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Output file; omit to write to stdout.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension, else csv.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'] or '', options['format'])
+        start = time.perf_counter()
+        stream = open(options['path'], 'w', newline='', encoding='utf-8') if options['path'] else sys.stdout
+        exported = 0
+        try:
+            if fmt == 'csv':
+                writer = csv.DictWriter(stream, fieldnames=PRODUCT_COLUMNS)
+                writer.writeheader()
+                for row in export_rows(Product.objects.all(), options['chunk_size']):
+                    writer.writerow(row)
+                    exported += 1
+            else:
+                for row in export_rows(Product.objects.all(), options['chunk_size']):
+                    stream.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                    exported += 1
+        finally:
+            if options['path']:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        rate = exported / elapsed if elapsed else 0
+        self.stderr.write(f"Exported {exported} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
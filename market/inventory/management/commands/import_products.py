@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from inventory.cache import bump_listing_version, evict_product
+from inventory.catalog_io import ProductRowValidator, chunked, detect_format, read_rows
+from inventory.history import record
+from inventory.models import Product
+from inventory.seller_stats import rebuild as rebuild_seller_stats
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV or JSONL file into the catalog in batches. "
+        "Rows with an `id` update that product, other rows are inserted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--owner', help="Email of the owner for rows without an `owner` column.")
+        parser.add_argument('--max-errors', type=int, default=20, help="Invalid rows to print before going quiet.")
+
+    def handle(self, *args, **options):
+        default_owner = None
+        if options['owner']:
+            try:
+                default_owner = CustomUser.objects.get(email=options['owner'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"No user with email {options['owner']}")
+
+        validator = ProductRowValidator(CustomUser, default_owner)
+        fmt = detect_format(options['path'], options['format'])
+        imported = rejected = 0
+        explicit_ids = False
+        owner_ids = set()
+        start = time.perf_counter()
+
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            for chunk in chunked(read_rows(stream, fmt), options['batch_size']):
+                products, errors = validator.clean_chunk(chunk)
+                for line_number, message in errors:
+                    if rejected < options['max_errors']:
+                        self.stderr.write(f"line {line_number}: {message}")
+                    rejected += 1
+                if not products:
+                    continue
+                explicit_ids = explicit_ids or any(p.pk is not None for p in products)
+                with transaction.atomic():
+                    existing = {
+                        pk: (owner_id, unit_price, quantity)
+                        for pk, owner_id, unit_price, quantity in Product.objects.filter(
+                            pk__in=[p.pk for p in products if p.pk is not None]
+                        ).values_list('pk', 'owner_id', 'unit_price', 'quantity')
+                    }
+                    # Seller stats of the old and new owners are rebuilt once at the end.
+                    owner_ids.update(p.owner_id for p in products)
+                    owner_ids.update(owner_id for owner_id, _, _ in existing.values())
+                    Product.objects.bulk_create(
+                        products,
+                        batch_size=options['batch_size'],
+                        update_conflicts=True,
+                        unique_fields=['id'],
+                        update_fields=['name', 'unit_price', 'unit', 'quantity', 'owner', 'updated_at'],
+                    )
+                    # New rows and rows whose price or stock changed; unchanged rows add no history.
+                    record(
+                        (p.pk, p.unit_price, p.quantity) for p in products
+                        if p.pk is not None and (p.pk not in existing or existing[p.pk][1:] != (p.unit_price, p.quantity))
+                    )
+                    # Cached instances of updated products would otherwise outlive the import.
+                    transaction.on_commit(lambda pks=list(existing): [evict_product(pk) for pk in pks])
+                imported += len(products)
+
+        if explicit_ids:
+            # Rows that carried their own id didn't advance the id sequence.
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                    cursor.execute(sql)
+        if imported:
+            bump_listing_version()
+            rebuild_seller_stats(owner_ids=owner_ids if len(owner_ids) <= 1000 else None)
+
+        elapsed = time.perf_counter() - start
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} rows, rejected {rejected} in {elapsed:.1f}s ({rate:,.0f} rows/s)"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from inventory.cache import listing_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the product listing cache."
+
+    def handle(self, *args, **options):
+        stats = listing_cache_stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']:.2%}"
+        )
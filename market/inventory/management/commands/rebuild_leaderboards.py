@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.cache import bump_listing_version
+from inventory.leaderboards import invalidate, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the top-rated and best-selling scores on Product from ratings and order "
+        "history, and drop the cached boards so they reload from the database."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_scores()
+            transaction.on_commit(lambda: (invalidate(), bump_listing_version()))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt leaderboard scores for {updated} products"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from inventory.leaderboards import rating_score
+from inventory.models import Product, Rating
+
+
+def rebuild_rating_counters():
+    """Recompute Product.rating_sum/rating_count from the Rating table, then the top-rated score."""
+    ratings = Rating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    updated = Product.objects.update(
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(total=Sum('value')).values('total'), output_field=IntegerField()), 0
+        ),
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), 0
+        ),
+        updated_at=timezone.now(),
+    )
+    Product.objects.update(rating_score=rating_score())
+    return updated
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating counters on Product from the Rating table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_rating_counters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating counters for {updated} products"))
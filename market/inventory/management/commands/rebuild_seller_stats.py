@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.seller_stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the seller dashboard totals from the catalogue with one INSERT ... SELECT."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', type=int, action='append', dest='owner_ids', help="Only this owner id (repeatable).")
+
+    def handle(self, *args, **options):
+        written = rebuild(owner_ids=options['owner_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} seller stats rows"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the 'similar products' neighbour lists from ratings (needs NumPy). "
+        "Run --incremental often and a full rebuild nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help="Only products whose ratings changed since the last run.")
+        parser.add_argument('--top-k', type=int, default=None, help="Neighbours kept per product (default: SIMILAR_PRODUCTS_K).")
+        parser.add_argument('--max-pairs', type=int, default=2_000_000, help="Co-rating pairs scored at once; bounds memory.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            from inventory.recommendations import rebuild
+        except ImportError as exc:
+            raise CommandError(f'{exc}. Install the extra: pip install "marketplace[recommendations]"')
+
+        run = rebuild(
+            incremental=options['incremental'],
+            k=options['top_k'],
+            max_pairs=options['max_pairs'],
+            batch_size=options['batch_size'],
+        )
+        kind = "incremental" if run.incremental else "full"
+        seconds = (run.finished_at - run.started_at).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt similar products ({kind}) for {run.products} products from {run.ratings} ratings in {seconds:.1f}s"
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.notifications import send_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Send queued cart notification emails as per-user digests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Maximum users per batch.")
+        parser.add_argument('--loop', action='store_true', help="Keep draining the queue until interrupted.")
+        parser.add_argument('--interval', type=float, default=10, help="Seconds to sleep between empty polls.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_pending_notifications(batch_size=options['batch_size'])
+            if any(result.values()):
+                self.stdout.write(
+                    f"sent={result['sent']} failed={result['failed']} skipped={result['skipped']}"
+                )
+            if not options['loop']:
+                break
+            if not any(result.values()):
+                time.sleep(options['interval'])
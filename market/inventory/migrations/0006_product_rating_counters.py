@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    Rating = apps.get_model('inventory', 'Rating')
+    ratings = Rating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(total=Sum('value')).values('total'), output_field=IntegerField()), 0
+        ),
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_remove_product_rate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'status'], name='inventory_c_user_id_c46463_idx'),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
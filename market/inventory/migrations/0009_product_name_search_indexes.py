@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# PostgreSQL only: other backends use SimpleSearchBackend and keep a plain scan.
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS inventory_product_name_tsv_idx ON inventory_product "
+    "USING gin (to_tsvector('simple'::regconfig, COALESCE(name, '')))",
+    "CREATE INDEX IF NOT EXISTS inventory_product_name_trgm_idx ON inventory_product "
+    "USING gin (UPPER(name::text) gin_trgm_ops)",
+]
+DROP_SQL = [
+    "DROP INDEX IF EXISTS inventory_product_name_trgm_idx",
+    "DROP INDEX IF EXISTS inventory_product_name_tsv_idx",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_order_orderline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
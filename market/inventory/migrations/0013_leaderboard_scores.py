@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_scores(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    OrderLine = apps.get_model('inventory', 'OrderLine')
+    sold = OrderLine.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    # Prior of 5 votes of 3 stars (Product.RATING_PRIOR_WEIGHT / RATING_PRIOR_MEAN).
+    Product.objects.update(
+        rating_score=Cast(F('rating_sum') + 15, FloatField()) / Cast(F('rating_count') + 5, FloatField()),
+        units_sold=Coalesce(
+            Subquery(sold.annotate(total=Sum('quantity')).values('total'), output_field=DecimalField(max_digits=12, decimal_places=2)), 0,
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stock_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_score',
+            field=models.FloatField(default=3, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_score', '-id'], name='product_rating_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-units_sold', '-id'], name='product_units_sold_idx'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
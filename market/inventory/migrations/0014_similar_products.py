@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_leaderboard_scores'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('incremental', models.BooleanField(default=False)),
+                ('products', models.PositiveIntegerField(default=0)),
+                ('ratings', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_changed_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['ratings_changed_at'], name='product_ratings_changed_idx'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_products', to='inventory.product'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='similar',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product'),
+        ),
+        migrations.AddIndex(
+            model_name='similarproduct',
+            index=models.Index(fields=['similar'], name='similar_product_similar_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='similar_product_rank_unique'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def record_current_values(apps, schema_editor):
+    # Every product's history starts from its price and stock at migration time.
+    Product = apps.get_model('inventory', 'Product')
+    ProductHistory = apps.get_model('inventory', 'ProductHistory')
+    now = django.utils.timezone.now()
+    rows = Product.objects.order_by('pk').values_list('pk', 'unit_price', 'quantity').iterator(chunk_size=5000)
+    batch = []
+    for pk, unit_price, quantity in rows:
+        batch.append(ProductHistory(product_id=pk, recorded_at=now, unit_price=unit_price, quantity=quantity))
+        if len(batch) == 5000:
+            ProductHistory.objects.bulk_create(batch)
+            batch = []
+    ProductHistory.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_similar_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'recorded_at'], name='product_history_idx'), models.Index(fields=['recorded_at'], name='product_history_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductHistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('price_open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_close', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity_low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity_high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity_close', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('changes', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='history_rollup_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'resolution', 'bucket'), name='product_history_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(record_current_values, migrations.RunPython.noop),
+    ]
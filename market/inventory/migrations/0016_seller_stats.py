@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_seller_stats(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    SellerStats = apps.get_model('inventory', 'SellerStats')
+    stock_value = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=4))
+    totals = Product.objects.order_by().values('owner_id', 'unit').annotate(
+        products=Count('pk'), stock_value=Sum(stock_value), rating_sum=Sum('rating_sum'),
+        rating_count=Sum('rating_count'), units_sold=Sum('units_sold'),
+    )
+    SellerStats.objects.bulk_create([SellerStats(**row) for row in totals.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_product_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(choices=[('l', 'litre'), ('kg', 'kilogram'), ('m2', 'm²'), ('pcs', 'piece'), ('pack', 'pack')], max_length=10)),
+                ('products', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('rating_count', models.BigIntegerField(default=0)),
+                ('units_sold', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'unit'), name='seller_stats_owner_unit_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_seller_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:50
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_seller_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='quantity',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
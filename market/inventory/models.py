@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from users.models import CustomUser
 
 class Product(models.Model):
@@ -14,7 +15,84 @@ class Product(models.Model):
     name = models.CharField(max_length=100)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     unit = models.CharField(max_length=10, choices=Unit.choices)
-    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    # Maintained by the Rating signals, rebuilt by `manage.py rebuild_rating_counters`.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    # Leaderboard scores (inventory.leaderboards); rebuilt by `manage.py rebuild_leaderboards`.
+    # rating_score is a Bayesian average: every product starts with RATING_PRIOR_WEIGHT
+    # votes of RATING_PRIOR_MEAN, so one 5-star rating doesn't outrank a hundred 4.8s.
+    RATING_PRIOR_MEAN = 3
+    RATING_PRIOR_WEIGHT = 5
+    rating_score = models.FloatField(default=RATING_PRIOR_MEAN, editable=False)
+    units_sold = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    # Sum of Cart.held over all lines; maintained by inventory.reservations.
+    reserved = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Set by the Rating signals; `manage.py rebuild_similar_products --incremental` refreshes these.
+    ratings_changed_at = models.DateTimeField(null=True, editable=False)
+    # Bumped by save() and by every queryset.update() that touches a product (ETag source).
+    updated_at = models.DateTimeField(auto_now=True)
+
+    RATING_COUNTER_FIELDS = ('rating_sum', 'rating_count')
+    COUNTER_FIELDS = RATING_COUNTER_FIELDS + ('reserved', 'rating_score', 'units_sold', 'ratings_changed_at')
+
+    class Meta:
+        # Access paths of ProductFilter; every listing query is ordered by -id.
+        indexes = [
+            models.Index(fields=['unit', '-id'], name='product_unit_id_idx'),
+            models.Index(fields=['unit', 'unit_price'], name='product_unit_price_idx'),
+            models.Index(fields=['unit', 'quantity'], name='product_unit_quantity_idx'),
+            models.Index(fields=['unit_price'], name='product_price_idx'),
+            models.Index(fields=['quantity'], name='product_quantity_idx'),
+            # Leaderboards and the matching listing sorts.
+            models.Index(fields=['-rating_score', '-id'], name='product_rating_score_idx'),
+            models.Index(fields=['-units_sold', '-id'], name='product_units_sold_idx'),
+            models.Index(fields=['ratings_changed_at'], name='product_ratings_changed_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(reserved__gte=0), name='product_reserved_non_negative'),
+        ]
+
+    # Remembered as loaded so post_save receivers can tell what changed (price and stock
+    # history, seller stats).
+    TRACKED_FIELDS = ('owner_id', 'unit', 'unit_price', 'quantity')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in cls.TRACKED_FIELDS):
+            instance._loaded_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS}
+
+    def save(self, *args, **kwargs):
+        # Counters are only ever changed with F() updates; a stale instance must not overwrite them.
+        if self.pk is not None and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_state = self.tracked_state()
+
+    @property
+    def available(self):
+        """Stock not held by anyone's cart."""
+        return self.quantity - self.reserved
+
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @property
+    def rating_stars(self):
+        if not self.rating_count:
+            return 0
+        return int(round(self.rating_sum / self.rating_count))
 
 
 class Rating(models.Model):
@@ -23,6 +101,21 @@ class Rating(models.Model):
     value = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ('product', 'user')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'value' in field_names:
+            instance._loaded_value = instance.value
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the row and the Product counters updated by post_save in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Rating({self.product_id}, {self.user_id})={self.value}"
 
@@ -37,12 +130,211 @@ class Cart(models.Model):
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1, validators=[MinValueValidator(0.01)])
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.IN_CART)
     added_at = models.DateTimeField(auto_now_add=True)
+    # Stock reserved for this line until held_until; see inventory.reservations.
+    held = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    held_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
-        unique_together = ('user', 'product', 'status')
+        # Only one open line per product; purchased rows accumulate as history.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'product'],
+                condition=models.Q(status='in_cart'),
+                name='unique_in_cart_product',
+            ),
+        ]
         indexes = [
             models.Index(fields=['user', 'status']),
+            models.Index(fields=['held_until'], condition=models.Q(held__gt=0), name='cart_active_hold_idx'),
         ]
 
     def __str__(self):
         return f"Cart({self.user.username}, {self.product.name}, {self.quantity})"
+
+
+class Order(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Order({self.pk}, {self.user_id}, {self.total})"
+
+
+class OrderLine(models.Model):
+    """A purchased product with its price, unit and name as they were at checkout."""
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='order_lines')
+    product_name = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit = models.CharField(max_length=10, choices=Product.Unit.choices)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'order']),
+        ]
+
+    @property
+    def subtotal(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"OrderLine({self.order_id}, {self.product_name}, {self.quantity})"
+
+
+class CartNotification(models.Model):
+    """Outbox row for the "added to cart" email, drained by `manage.py send_cart_notifications`."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENDING = 'sending', 'Sending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+        SKIPPED = 'skipped', 'Skipped'
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='cart_notifications')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # While SENDING: when the claiming worker's lease runs out and the row may be claimed again.
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"CartNotification({self.user_id}, {self.product_id}, {self.status})"
+
+
+class SimilarProduct(models.Model):
+    """
+    One of a product's nearest neighbours by item-item rating similarity, computed
+    offline by `manage.py rebuild_similar_products` (inventory.recommendations).
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # The detail page reads a product's neighbours in rank order with this index alone.
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='similar_product_rank_unique'),
+        ]
+        indexes = [
+            # Incremental refreshes find the lists that mention a changed product.
+            models.Index(fields=['similar'], name='similar_product_similar_idx'),
+        ]
+
+    def __str__(self):
+        return f"SimilarProduct({self.product_id}, #{self.rank}: {self.similar_id})"
+
+
+class SimilarityRun(models.Model):
+    """A run of `manage.py rebuild_similar_products`; incremental runs start from the last finished one."""
+
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True)
+    incremental = models.BooleanField(default=False)
+    products = models.PositiveIntegerField(default=0)
+    ratings = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"SimilarityRun({self.started_at:%Y-%m-%d %H:%M}, {self.products} products)"
+
+
+class ProductHistory(models.Model):
+    """Append-only: a product's price and stock right after a change (see inventory.history)."""
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    recorded_at = models.DateTimeField(default=timezone.now)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # Range queries per product; compaction and retention scan by time.
+            models.Index(fields=['product', 'recorded_at'], name='product_history_idx'),
+            models.Index(fields=['recorded_at'], name='product_history_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"ProductHistory({self.product_id}, {self.recorded_at:%Y-%m-%d %H:%M}, {self.unit_price}, {self.quantity})"
+
+
+class ProductHistoryRollup(models.Model):
+    """ProductHistory downsampled to one row per product per hour or day, by `manage.py compact_product_history`."""
+
+    class Resolution(models.TextChoices):
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    resolution = models.CharField(max_length=4, choices=Resolution.choices)
+    # Start of the hour or day, UTC.
+    bucket = models.DateTimeField()
+    price_open = models.DecimalField(max_digits=10, decimal_places=2)
+    price_low = models.DecimalField(max_digits=10, decimal_places=2)
+    price_high = models.DecimalField(max_digits=10, decimal_places=2)
+    price_close = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity_low = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity_high = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity_close = models.DecimalField(max_digits=10, decimal_places=2)
+    changes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the index for range queries per product.
+            models.UniqueConstraint(fields=['product', 'resolution', 'bucket'], name='product_history_rollup_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket'], name='history_rollup_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"ProductHistoryRollup({self.product_id}, {self.resolution} {self.bucket:%Y-%m-%d %H:%M})"
+
+
+class SellerStats(models.Model):
+    """
+    A seller's catalogue totals for one unit of measurement, read by the dashboard.
+    Kept current by inventory.seller_stats; rebuilt by `manage.py rebuild_seller_stats`.
+    """
+
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='seller_stats')
+    unit = models.CharField(max_length=10, choices=Product.Unit.choices)
+    products = models.IntegerField(default=0)
+    # Sum of unit_price * quantity.
+    stock_value = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.BigIntegerField(default=0)
+    units_sold = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'unit'], name='seller_stats_owner_unit_unique'),
+        ]
+
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    def __str__(self):
+        return f"SellerStats({self.owner_id}, {self.unit}, {self.products} products)"
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import CartNotification
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_cart_notification(cart_item):
+    return CartNotification.objects.create(
+        user_id=cart_item.user_id,
+        product_id=cart_item.product_id,
+        quantity=cart_item.quantity,
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.CART_NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1))
+
+
+def _build_message(user, notifications, template, connection):
+    items = [
+        {
+            'product_name': n.product.name,
+            'product_price': n.product.unit_price,
+            'product_unit': n.product.get_unit_display(),
+            'quantity': n.quantity,
+            'total_price': n.product.unit_price * n.quantity,
+        }
+        for n in notifications
+    ]
+    context = {
+        'user_first_name': user.name or user.email,
+        'items': items,
+        'grand_total': sum(item['total_price'] for item in items),
+        'cart_url': f"{settings.SITE_URL}/inventory/cart/",
+    }
+    names = ", ".join(item['product_name'] for item in items)
+    message = EmailMultiAlternatives(
+        subject="🛒 Товар додано в кошик" if len(items) == 1 else "🛒 Товари додано в кошик",
+        body=f"Додано в кошик: {names}",
+        from_email=settings.EMAIL_HOST_USER,
+        to=[user.email],
+        connection=connection,
+    )
+    message.attach_alternative(template.render(context), 'text/html')
+    return message
+
+
+def _claim(batch_size, now):
+    """
+    Mark the due notifications of up to `batch_size` users SENDING under a lease, in a
+    short transaction of its own. Rows of a worker that died mid-send are claimable
+    again once their lease has run out. Returns them grouped by user.
+    """
+    window = timedelta(seconds=settings.CART_NOTIFICATION_DIGEST_WINDOW)
+    due = CartNotification.objects.filter(
+        Q(status=CartNotification.Status.PENDING, next_attempt_at__lte=now)
+        | Q(status=CartNotification.Status.SENDING, lease_expires_at__lte=now)
+    )
+    with transaction.atomic():
+        user_ids = list(
+            due.values('user').annotate(first_at=Min('created_at')).filter(first_at__lte=now - window)
+            .order_by('first_at').values_list('user', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return {}
+        # skip_locked lets several workers drain the queue without claiming the same rows.
+        notifications = list(
+            due.filter(user__in=user_ids)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('user', 'product')
+            .order_by('user_id', 'created_at')
+        )
+        CartNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            status=CartNotification.Status.SENDING,
+            lease_expires_at=now + timedelta(seconds=settings.CART_NOTIFICATION_LEASE),
+        )
+    by_user = defaultdict(list)
+    for notification in notifications:
+        by_user[notification.user].append(notification)
+    return by_user
+
+
+def _send(by_user):
+    """Send one digest per user over a single SMTP connection; returns (sent, failed, skipped)."""
+    sent, failed, skipped = [], [], []
+    template = get_template('emails/cart_notification.html')
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for user, batch in by_user.items():
+                if not user.email:
+                    skipped.extend(batch)
+                    continue
+                try:
+                    _build_message(user, batch, template, connection).send()
+                except Exception as e:
+                    logger.warning(f"Не вдалося надіслати email {user.email}: {e}")
+                    failed.extend((n, str(e)) for n in batch)
+                else:
+                    sent.extend(batch)
+    except Exception as e:
+        # Connection could not be opened (or closed cleanly): everything unsent is retried.
+        logger.error(f"Помилка SMTP з'єднання: {e}", exc_info=True)
+        done = {n.pk for n in sent} | {n.pk for n in skipped} | {n.pk for n, _ in failed}
+        failed.extend((n, str(e)) for batch in by_user.values() for n in batch if n.pk not in done)
+    return sent, failed, skipped
+
+
+def send_pending_notifications(batch_size=200, now=None):
+    """
+    Send one digest email per user whose oldest pending notification is older than
+    CART_NOTIFICATION_DIGEST_WINDOW, all over a single SMTP connection.
+
+    Rows are claimed and their outcome recorded in two short transactions; SMTP runs
+    between them, so a slow mail server holds no locks. Failed digests are retried with
+    exponential backoff up to CART_NOTIFICATION_MAX_ATTEMPTS.
+    Returns counts of sent, failed and skipped notification rows.
+    """
+    now = now or timezone.now()
+    result = {'sent': 0, 'failed': 0, 'skipped': 0}
+    by_user = _claim(batch_size, now)
+    if not by_user:
+        return result
+
+    sent, failed, skipped = _send(by_user)
+
+    with transaction.atomic():
+        if sent:
+            CartNotification.objects.filter(pk__in=[n.pk for n in sent]).update(
+                status=CartNotification.Status.SENT, sent_at=now, attempts=F('attempts') + 1, lease_expires_at=None
+            )
+        if skipped:
+            CartNotification.objects.filter(pk__in=[n.pk for n in skipped]).update(
+                status=CartNotification.Status.SKIPPED, lease_expires_at=None
+            )
+        for notification, error in failed:
+            notification.attempts += 1
+            notification.last_error = error
+            notification.next_attempt_at = now + retry_delay(notification.attempts)
+            notification.lease_expires_at = None
+            if notification.attempts >= settings.CART_NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = CartNotification.Status.FAILED
+            else:
+                notification.status = CartNotification.Status.PENDING
+        CartNotification.objects.bulk_update(
+            [n for n, _ in failed], ['attempts', 'last_error', 'next_attempt_at', 'lease_expires_at', 'status']
+        )
+
+    result.update(sent=len(sent), failed=len(failed), skipped=len(skipped))
+    return result
@@ -0,0 +1,181 @@
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _encode(direction, value):
+    raw = f'{direction}:{value}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor):
+    """(direction, value string) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, value = base64.urlsafe_b64decode(padded.encode()).decode().split(':', 1)
+        return direction, value
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset ordered by a descending unique key without COUNT(*) or OFFSET.
+
+    Every page is a `WHERE key < x ORDER BY key DESC LIMIT n + 1` (or the mirrored query
+    when walking backwards), so page 1000 costs the same as page 1. With `score` the
+    order is (score DESC, key DESC), for leaderboard sorts, and the cursor carries both.
+    """
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, per_page, key='id', score=None):
+        self.queryset = queryset.order_by()
+        self.per_page = per_page
+        self.key = key
+        self.score = score
+
+    @staticmethod
+    def encode_cursor(direction, value):
+        if isinstance(value, tuple):
+            value = '~'.join(map(str, value))
+        return _encode(direction, value)
+
+    def decode_cursor(self, cursor):
+        decoded = _decode(cursor)
+        if decoded is None or decoded[0] not in (self.NEXT, self.PREVIOUS):
+            return None
+        direction, value = decoded
+        try:
+            if self.score is None:
+                return direction, int(value)
+            score, key = value.rsplit('~', 1)
+            return direction, (self.queryset.model._meta.get_field(self.score).to_python(score), int(key))
+        except (ValueError, ValidationError):
+            return None
+
+    def _key_of(self, row):
+        # Rows are model instances, or dicts when the queryset was built with .values().
+        get = row.__getitem__ if isinstance(row, dict) else lambda name: getattr(row, name)
+        return get(self.key) if self.score is None else (get(self.score), get(self.key))
+
+    def _after(self, value, lookup):
+        """Rows past `value` in the `lookup` ('lt' or 'gt') direction."""
+        if self.score is None:
+            return Q(**{f'{self.key}__{lookup}': value})
+        score, key = value
+        # The first, redundant bound lets an index on (score, key) serve the range.
+        return Q(**{f'{self.score}__{lookup}e': score}) & (
+            Q(**{f'{self.score}__{lookup}': score}) | Q(**{self.score: score, f'{self.key}__{lookup}': key})
+        )
+
+    def _ordering(self, descending):
+        fields = [self.key] if self.score is None else [self.score, self.key]
+        return [f'-{name}' if descending else name for name in fields]
+
+    def _page_query(self, cursor):
+        decoded = self.decode_cursor(cursor)
+        if decoded is None:
+            direction, value = self.NEXT, None
+        else:
+            direction, value = decoded
+
+        if direction == self.NEXT:
+            qs = self.queryset.order_by(*self._ordering(descending=True))
+            if value is not None:
+                qs = qs.filter(self._after(value, 'lt'))
+        else:
+            qs = self.queryset.filter(self._after(value, 'gt')).order_by(*self._ordering(descending=False))
+        return direction, value, qs[:self.per_page + 1]
+
+    def _make_page(self, direction, value, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == self.PREVIOUS:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage([])
+
+        first_key = self._key_of(rows[0])
+        last_key = self._key_of(rows[-1])
+        if direction == self.NEXT:
+            has_next, has_previous = has_more, value is not None
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(self.NEXT, last_key) if has_next else None,
+            previous_cursor=self.encode_cursor(self.PREVIOUS, first_key) if has_previous else None,
+        )
+
+    def get_page(self, cursor=None):
+        """Return the page for `cursor`; unknown or malformed cursors give the first page."""
+        direction, value, qs = self._page_query(cursor)
+        return self._make_page(direction, value, list(qs))
+
+    async def aget_page(self, cursor=None):
+        direction, value, qs = self._page_query(cursor)
+        return self._make_page(direction, value, [row async for row in qs])
+
+
+class OffsetCursorPaginator:
+    """
+    CursorPage pages for orderings a keyset on one column can't follow, such as
+    search rank or leaderboard scores: the cursor carries a page number and the
+    queryset keeps its own ordering. Results end after `max_results` rows, so the
+    OFFSET stays bounded; no COUNT(*) is run.
+    """
+
+    PAGE = 'o'
+
+    def __init__(self, queryset, per_page, max_results):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.max_results = max_results
+
+    def get_page(self, cursor=None):
+        """Return the page for `cursor`; unknown, malformed or out-of-range cursors give the first page."""
+        decoded = _decode(cursor)
+        number = 1
+        if decoded is not None and decoded[0] == self.PAGE and decoded[1].isascii() and decoded[1].isdigit():
+            number = max(int(decoded[1]), 1)
+        if (number - 1) * self.per_page >= self.max_results:
+            number = 1
+        bottom = (number - 1) * self.per_page
+        top = min(bottom + self.per_page, self.max_results)
+        # One extra row tells whether there is a next page.
+        rows = list(self.queryset[bottom:top + 1])
+        has_next = len(rows) > top - bottom and top < self.max_results
+        return CursorPage(
+            rows[:top - bottom],
+            next_cursor=_encode(self.PAGE, number + 1) if has_next else None,
+            previous_cursor=_encode(self.PAGE, number - 1) if number > 1 else None,
+        )
@@ -0,0 +1,201 @@
+"""
+Item-item collaborative filtering for the "similar products" block on the detail page.
+
+`manage.py rebuild_similar_products` loads every rating into NumPy arrays, scores
+product pairs by adjusted cosine similarity (each rating centred on its user's
+mean, so a generous rater doesn't make everything look alike), and stores the
+best SIMILAR_PRODUCTS_K neighbours of each product as SimilarProduct rows. The
+web process only reads those rows and never imports this module.
+
+Memory grows with the number of ratings, never with products squared: the ratings
+are held twice as compressed sparse rows (by product and by user, ~24 bytes per
+rating), and similarities are accumulated a block of products at a time, each
+block small enough to expand to about `max_pairs` co-rating pairs.
+
+NumPy is an optional dependency: `pip install "marketplace[recommendations]"`.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Product, Rating, SimilarityRun, SimilarProduct
+
+logger = logging.getLogger(__name__)
+
+# Damps scores backed by few co-raters: a pair rated by n users keeps n / (n + SHRINKAGE).
+SHRINKAGE = 10
+
+
+def _ranges(starts, counts):
+    """Concatenation of range(start, start + count) for each pair, without a Python loop."""
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+def _csr(rows, cols, values, n_rows):
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order], values[order]
+
+
+class RatingMatrix:
+    """The product x user rating matrix, centred per user, in sparse form."""
+
+    def __init__(self, product_ids, user_ids, values):
+        self.product_ids, products = np.unique(product_ids, return_inverse=True)
+        _, users = np.unique(user_ids, return_inverse=True)
+        self.ratings = len(values)
+        n_users = int(users.max()) + 1 if len(users) else 0
+        counts = np.bincount(users, minlength=n_users)
+        means = np.bincount(users, weights=values, minlength=n_users) / np.maximum(counts, 1)
+        centred = (values - means[users]).astype(np.float32)
+        # A rating equal to its user's mean adds nothing to any dot product.
+        kept = centred != 0
+        products, users, centred = products[kept], users[kept], centred[kept]
+        self.norms = np.sqrt(np.bincount(products, weights=centred.astype(np.float64) ** 2, minlength=len(self.product_ids)))
+        self.by_product = _csr(products, users, centred, len(self.product_ids))
+        self.by_user = _csr(users, products, centred, n_users)
+        # Pairs a product expands to: the ratings of everyone who rated it.
+        user_degree = np.diff(self.by_user[0])
+        self.cost = np.bincount(products, weights=user_degree[users], minlength=len(self.product_ids)).astype(np.int64)
+
+    @classmethod
+    def load(cls, chunk_size=100_000):
+        """Read the ratings table in primary-key chunks into preallocated arrays."""
+        last_pk = Rating.objects.aggregate(last=Max('pk'))['last'] or 0
+        ratings = Rating.objects.filter(pk__lte=last_pk).order_by('pk')
+        total = ratings.count()
+        product_ids = np.empty(total, dtype=np.int64)
+        user_ids = np.empty(total, dtype=np.int64)
+        values = np.empty(total, dtype=np.float32)
+        n, after = 0, 0
+        while True:
+            rows = list(ratings.filter(pk__gt=after).values_list('pk', 'product_id', 'user_id', 'value')[:chunk_size])
+            if not rows:
+                break
+            # Rows added since the count can't land here (pk <= last_pk); deleted ones only shrink it.
+            chunk = np.array(rows, dtype=np.int64)[:total - n]
+            product_ids[n:n + len(chunk)] = chunk[:, 1]
+            user_ids[n:n + len(chunk)] = chunk[:, 2]
+            values[n:n + len(chunk)] = chunk[:, 3]
+            n += len(chunk)
+            after = rows[-1][0]
+            if len(rows) < chunk_size or n == total:
+                break
+        return cls(product_ids[:n], user_ids[:n], values[:n])
+
+    def indexes(self, pks):
+        """Dense indexes of the product `pks` that have ratings; -1 for those that don't."""
+        pks = np.asarray(pks, dtype=np.int64)
+        found = np.searchsorted(self.product_ids, pks)
+        found[found == len(self.product_ids)] = 0
+        return np.where(self.product_ids[found] == pks, found, -1) if len(self.product_ids) else np.full(len(pks), -1)
+
+    def neighbours(self, block, k):
+        """
+        The top `k` neighbours of the products at dense indexes `block`, as parallel
+        arrays of position in block, neighbour index, score and rank.
+        """
+        product_ptr, product_users, product_values = self.by_product
+        user_ptr, user_products, user_values = self.by_user
+        n = len(self.product_ids)
+
+        counts = product_ptr[block + 1] - product_ptr[block]
+        entries = _ranges(product_ptr[block], counts)
+        position = np.repeat(np.arange(len(block), dtype=np.int64), counts)
+        users, values = product_users[entries], product_values[entries]
+        degree = user_ptr[users + 1] - user_ptr[users]
+        pairs = _ranges(user_ptr[users], degree)
+
+        keys = np.repeat(position, degree) * n + user_products[pairs]
+        products = np.repeat(values, degree) * user_values[pairs]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        dots = np.bincount(inverse, weights=products)
+        support = np.bincount(inverse)
+        position, other = np.divmod(keys, n)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = dots / (self.norms[block[position]] * self.norms[other]) * (support / (support + SHRINKAGE))
+        kept = (other != block[position]) & (score > 0)
+        position, other, score = position[kept], other[kept], score[kept]
+
+        order = np.lexsort((-score, position))
+        position, other, score = position[order], other[order], score[order]
+        rank = np.arange(len(position)) - np.searchsorted(position, position)
+        kept = rank < k
+        return position[kept], other[kept], score[kept], rank[kept]
+
+
+def _blocks(indexes, cost, max_pairs, batch_size):
+    """Split `indexes` into runs of at most `batch_size` that each expand to about `max_pairs` pairs."""
+    for start in range(0, len(indexes), batch_size):
+        batch = indexes[start:start + batch_size]
+        cumulative = np.cumsum(cost[batch])
+        yield from np.split(batch, np.flatnonzero(np.diff(cumulative // max_pairs)) + 1)
+
+
+def _write(matrix, pks, k, max_pairs, batch_size):
+    """Replace the neighbour lists of product `pks`; products without ratings get none."""
+    pks = np.asarray(sorted(pks), dtype=np.int64)
+    indexes = matrix.indexes(pks)
+    unrated = pks[indexes < 0].tolist()
+    for start in range(0, len(unrated), batch_size):
+        SimilarProduct.objects.filter(product_id__in=unrated[start:start + batch_size]).delete()
+    written = 0
+    for block in _blocks(indexes[indexes >= 0], matrix.cost, max_pairs, batch_size):
+        position, other, score, rank = matrix.neighbours(block, k)
+        block_pks = matrix.product_ids[block]
+        rows = [
+            SimilarProduct(product_id=int(block_pks[p]), similar_id=int(matrix.product_ids[o]), rank=int(r), score=float(s))
+            for p, o, r, s in zip(position, other, rank, score)
+        ]
+        with transaction.atomic():
+            SimilarProduct.objects.filter(product_id__in=block_pks.tolist()).delete()
+            SimilarProduct.objects.bulk_create(rows, batch_size=1000)
+        written += len(block)
+        logger.info("Similar products: %s products written", written)
+    return len(pks)
+
+
+def products_to_refresh(since):
+    """Products whose ratings changed since `since`, and the products that list one of them."""
+    changed = set(Product.objects.filter(ratings_changed_at__gte=since).values_list('pk', flat=True))
+    listing = set()
+    changed_list = list(changed)
+    for start in range(0, len(changed_list), 1000):
+        listing.update(
+            SimilarProduct.objects.filter(similar_id__in=changed_list[start:start + 1000])
+            .values_list('product_id', flat=True).distinct()
+        )
+    return changed | listing
+
+
+def rebuild(incremental=False, k=None, max_pairs=2_000_000, batch_size=1000):
+    """
+    Recompute neighbour lists: every product's, or with `incremental` only those
+    products_to_refresh() since the last finished run (all of them if there is none).
+
+    An incremental run rescores a changed product against everything, but a product
+    that *became* similar to it is only picked up by the next full run, so schedule
+    one now and then. Returns the SimilarityRun.
+    """
+    k = k or settings.SIMILAR_PRODUCTS_K
+    last = SimilarityRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    run = SimilarityRun.objects.create(started_at=timezone.now(), incremental=incremental and last is not None)
+    # Ratings are read after started_at, so a change during the run is caught by the next one too.
+    if run.incremental:
+        pks = products_to_refresh(last.started_at)
+    else:
+        pks = Product.objects.values_list('pk', flat=True)
+    pks = list(pks)
+    matrix = RatingMatrix.load()
+    run.ratings = matrix.ratings
+    run.products = _write(matrix, pks, k, max_pairs, batch_size)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['ratings', 'products', 'finished_at'])
+    return run
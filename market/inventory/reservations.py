@@ -0,0 +1,215 @@
+"""
+Time-limited stock holds for cart lines.
+
+Putting a product in the cart reserves it: Cart.held is what the line holds and
+Product.reserved is the sum over all lines, so available stock is
+`quantity - reserved` without aggregating carts per request. Every change to a
+hold moves both with one conditional UPDATE, which is what keeps two carts from
+holding the same units. Holds last STOCK_HOLD_SECONDS from the last change to
+the line; `manage.py release_expired_holds` gives expired ones back in bulk, and
+checkout turns the buyer's holds into the sale.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import add_to_cart_line, evict_product, forget_cart
+from .models import Cart, Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product, available):
+        super().__init__(f"Only {available} of {product} available")
+        self.product = product
+        self.available = available
+
+
+def line_available():
+    """Expression for a Cart row: its own hold plus the product's unreserved stock."""
+    return ExpressionWrapper(
+        F('held') + F('product__quantity') - F('product__reserved'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def hold_expiry(now=None):
+    return (now or timezone.now()) + timedelta(seconds=settings.STOCK_HOLD_SECONDS)
+
+
+def _adjust_reserved(product_id, delta, now):
+    """Move Product.reserved by `delta`, refusing to reserve more than is available."""
+    if delta == 0:
+        return True
+    products = Product.objects.filter(pk=product_id)
+    if delta > 0:
+        products = products.filter(quantity__gte=F('reserved') + delta)
+    return products.update(reserved=F('reserved') + delta, updated_at=now) == 1
+
+
+def hold(user, product, quantity, relative=False):
+    """
+    Set `user`'s cart line for `product` to `quantity` (or add `quantity` to it when
+    `relative`) and hold exactly that much.
+
+    Raises InsufficientStock, leaving the line as it was, when other carts' holds
+    leave too little. Expired holds on the product are released first in that
+    case, so a lapsed reservation never blocks a sale.
+    """
+    quantity = Decimal(quantity)
+    shortage = None
+    with transaction.atomic():
+        line = (
+            Cart.objects.select_for_update()
+            .filter(user=user, product=product, status=Cart.Status.IN_CART)
+            .first()
+        )
+        held = line.held if line is not None else Decimal(0)
+        if relative and line is not None:
+            quantity += line.quantity
+        now = timezone.now()
+        delta = quantity - held
+        if not _adjust_reserved(product.pk, delta, now):
+            release_expired_holds(now=now, product_ids=[product.pk])
+            if not _adjust_reserved(product.pk, delta, now):
+                available = (
+                    Product.objects.filter(pk=product.pk).values_list(F('quantity') - F('reserved'), flat=True).first()
+                )
+                shortage = InsufficientStock(product, max(available or 0, 0) + held)
+        if shortage is None:
+            if line is None:
+                # create() rather than update(): the cart notification hangs off post_save.
+                line = Cart.objects.create(
+                    user=user, product=product, quantity=quantity, held=quantity, held_until=hold_expiry(now)
+                )
+            else:
+                line.quantity = line.held = quantity
+                line.held_until = hold_expiry(now)
+                line.save(update_fields=['quantity', 'held', 'held_until'])
+        transaction.on_commit(lambda: evict_product(product.pk))
+    # Raised outside the transaction so the expired holds released above stay released.
+    if shortage is not None:
+        raise shortage
+    return line
+
+
+def add_to_hold(user, product, by=1):
+    """
+    Add `by` to `user`'s line for `product`, holding it too.
+
+    When the line exists and is fully held this is two conditional UPDATEs and no
+    reads: the line grows with F() expressions and the product's reservation grows
+    only if the stock is there. Anything else (a new line, a lapsed hold, not enough
+    stock) is rolled back and handled by hold().
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        grown = Cart.objects.filter(
+            user=user, product=product, status=Cart.Status.IN_CART, held=F('quantity')
+        ).update(quantity=F('quantity') + by, held=F('held') + by, held_until=hold_expiry(now))
+        if grown and _adjust_reserved(product.pk, by, now):
+            # update() sends no post_save, so the cached cart is patched here.
+            transaction.on_commit(lambda: (evict_product(product.pk), add_to_cart_line(user.pk, product.pk, by)))
+            return
+        transaction.set_rollback(True)
+    hold(user, product, by, relative=True)
+
+
+def release(line):
+    """Delete a cart line and give its hold back."""
+    with transaction.atomic():
+        held = (
+            Cart.objects.select_for_update().filter(pk=line.pk, status=Cart.Status.IN_CART)
+            .values_list('held', flat=True).first()
+        )
+        if held is None:
+            return
+        if held:
+            _adjust_reserved(line.product_id, -held, timezone.now())
+        Cart.objects.filter(pk=line.pk).delete()
+        transaction.on_commit(lambda: evict_product(line.product_id))
+
+
+def reconcile(user):
+    """
+    Clamp `user`'s lines that ask for more than they can have (a lapsed hold, or
+    stock cut below what carts hold) to what is available, never below zero. Holds
+    shrink with their lines and lines left with nothing are deleted.
+    Returns (clamped, removed) line counts.
+    """
+    with transaction.atomic():
+        lines = list(
+            Cart.objects.select_for_update()
+            .filter(user=user, status=Cart.Status.IN_CART, quantity__gt=line_available())
+            .annotate(clamped=Greatest(line_available(), Value(Decimal(0)), output_field=DecimalField(max_digits=10, decimal_places=2)))
+            .order_by('product_id')
+            .values_list('pk', 'product_id', 'held', 'clamped')
+        )
+        if not lines:
+            return 0, 0
+        released = defaultdict(Decimal)
+        quantities, holds, removed = {}, {}, []
+        for pk, product_id, held, clamped in lines:
+            released[product_id] += held - min(held, clamped)
+            if clamped > 0:
+                quantities[pk], holds[pk] = clamped, min(held, clamped)
+            else:
+                removed.append(pk)
+        released = {pk: amount for pk, amount in released.items() if amount}
+        if released:
+            Product.objects.filter(pk__in=released).update(
+                reserved=F('reserved') - _per_product(released), updated_at=timezone.now()
+            )
+        if quantities:
+            Cart.objects.filter(pk__in=quantities).update(quantity=_per_product(quantities), held=_per_product(holds))
+        if removed:
+            Cart.objects.filter(pk__in=removed).delete()
+        transaction.on_commit(lambda: ([evict_product(pk) for pk in released], forget_cart(user.pk)))
+    return len(quantities), len(removed)
+
+
+def _per_product(mapping):
+    """CASE id WHEN ... THEN ... END over `mapping` of product id -> quantity."""
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in mapping.items()],
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def release_expired_holds(now=None, product_ids=None, batch_size=1000):
+    """
+    Release holds whose time is up, a batch of lines at a time: one UPDATE for the
+    products and one for the lines per batch. The lines stay in the cart, unheld.
+    Returns the number of lines released.
+    """
+    now = now or timezone.now()
+    expired = Cart.objects.filter(status=Cart.Status.IN_CART, held__gt=0, held_until__lte=now)
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    released = 0
+    while True:
+        with transaction.atomic():
+            # Cart rows first, then products: the same lock order as hold() and checkout().
+            lines = list(
+                expired.select_for_update(skip_locked=True)
+                .order_by('product_id')
+                .values_list('pk', 'product_id', 'held')[:batch_size]
+            )
+            if not lines:
+                return released
+            per_product = defaultdict(Decimal)
+            for _, product_id, held in lines:
+                per_product[product_id] += held
+            Product.objects.filter(pk__in=per_product).update(
+                reserved=F('reserved') - _per_product(per_product), updated_at=now
+            )
+            Cart.objects.filter(pk__in=[pk for pk, _, _ in lines]).update(held=0, held_until=None)
+            transaction.on_commit(lambda ids=list(per_product): [evict_product(pk) for pk in ids])
+        released += len(lines)
+        if len(lines) < batch_size:
+            return released
@@ -0,0 +1,138 @@
+"""
+Per-seller totals for the dashboard: one SellerStats row per owner and unit.
+
+Rows are moved by deltas in the same transactions that change products, ratings
+and stock, so the dashboard reads a few rows instead of aggregating a seller's
+catalogue. A rating counts towards the product's current owner and unit, and a
+deleted product's ratings are taken off by their own (cascaded) deletions.
+`manage.py rebuild_seller_stats` recomputes the rows with one INSERT ... SELECT.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Sum, Value, When
+
+from .models import Product, SellerStats
+
+STAT_FIELDS = ('products', 'stock_value', 'rating_sum', 'rating_count', 'units_sold')
+COUNTERS = ('rating_sum', 'rating_count', 'units_sold')
+
+
+def apply(owner_id, unit, **deltas):
+    """Add `deltas` to the owner's row for `unit`, creating the row when a product arrives in it."""
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    changes = {name: F(name) + value for name, value in deltas.items()}
+    rows = SellerStats.objects.filter(owner_id=owner_id, unit=unit)
+    if rows.update(**changes) or deltas.get('products', 0) <= 0:
+        # Nothing to take away from a row that doesn't exist (e.g. its owner is being deleted).
+        return
+    SellerStats.objects.bulk_create([SellerStats(owner_id=owner_id, unit=unit)], ignore_conflicts=True)
+    rows.update(**changes)
+
+
+def apply_many(deltas):
+    """
+    Add `deltas`, {(owner_id, unit): {field: delta}}, to existing rows with one UPDATE.
+    For changes to products that already exist, so their rows do too.
+    """
+    if not deltas:
+        return
+    fields = {name for values in deltas.values() for name in values}
+    changes = {
+        name: F(name) + Case(
+            *[When(owner_id=owner_id, unit=unit, then=Value(values.get(name, 0))) for (owner_id, unit), values in deltas.items()],
+            default=Value(0),
+            output_field=SellerStats._meta.get_field(name),
+        )
+        for name in fields
+    }
+    rows = reduce(or_, (Q(owner_id=owner_id, unit=unit) for owner_id, unit in deltas))
+    SellerStats.objects.filter(rows).update(**changes)
+
+
+def _negated(values):
+    return {name: -value for name, value in values.items()}
+
+
+def product_saved(product, created, previous):
+    """Apply a saved product; `previous` is its Product.tracked_state() as loaded, if known."""
+    stock_value = product.unit_price * product.quantity
+    if created:
+        apply(product.owner_id, product.unit, products=1, stock_value=stock_value)
+        return
+    if previous is None:
+        rebuild(owner_ids=[product.owner_id])
+        return
+    old_value = previous['unit_price'] * previous['quantity']
+    if (previous['owner_id'], previous['unit']) == (product.owner_id, product.unit):
+        apply(product.owner_id, product.unit, stock_value=stock_value - old_value)
+        return
+    # Moved to another owner or unit: its counters go with it. They are never on
+    # the instance reliably (see Product.save), so read them.
+    counters = Product.objects.filter(pk=product.pk).values(*COUNTERS).get()
+    apply(previous['owner_id'], previous['unit'], products=-1, stock_value=-old_value, **_negated(counters))
+    apply(product.owner_id, product.unit, products=1, stock_value=stock_value, **counters)
+
+
+def product_deleted(product):
+    # Ratings are deleted (and taken off) one by one before their product.
+    apply(
+        product.owner_id, product.unit,
+        products=-1, stock_value=-(product.unit_price * product.quantity), units_sold=-product.units_sold,
+    )
+
+
+def rating_changed(product_id, sum_delta, count_delta=0):
+    """One UPDATE: the row is found through the product's owner and unit."""
+    product = Product.objects.filter(pk=product_id, owner_id=OuterRef('owner_id'), unit=OuterRef('unit'))
+    SellerStats.objects.filter(Exists(product)).update(
+        rating_sum=F('rating_sum') + sum_delta,
+        rating_count=F('rating_count') + count_delta,
+    )
+
+
+def products_sold(lines):
+    """Apply a checkout: `lines` are (owner_id, unit, unit_price, quantity) of the products sold."""
+    deltas = defaultdict(lambda: {'stock_value': 0, 'units_sold': 0})
+    for owner_id, unit, unit_price, quantity in lines:
+        deltas[owner_id, unit]['stock_value'] -= unit_price * quantity
+        deltas[owner_id, unit]['units_sold'] += quantity
+    apply_many(deltas)
+
+
+def rebuild(owner_ids=None):
+    """
+    Recompute every row (or those of `owner_ids`) from Product with one
+    INSERT ... SELECT ... GROUP BY. Returns the number of rows written.
+    """
+    products = Product.objects.all()
+    stats = SellerStats.objects.all()
+    if owner_ids is not None:
+        owner_ids = list(owner_ids)
+        products = products.filter(owner_id__in=owner_ids)
+        stats = stats.filter(owner_id__in=owner_ids)
+    stock_value = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=4))
+    totals = (
+        products.order_by().values('owner_id', 'unit')
+        .annotate(
+            products=Count('pk'), stock_value=Sum(stock_value), rating_sum=Sum('rating_sum'),
+            rating_count=Sum('rating_count'), units_sold=Sum('units_sold'),
+        )
+        .values_list('owner_id', 'unit', *STAT_FIELDS)
+    )
+    select, params = totals.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(SellerStats._meta.get_field(name).column) for name in ('owner', 'unit', *STAT_FIELDS))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Writers wait until the rebuild commits and then apply their deltas on
+            # top, so a change is never both counted by the SELECT and applied again.
+            cursor.execute(f'LOCK TABLE {quote(SellerStats._meta.db_table)} IN EXCLUSIVE MODE')
+        stats.delete()
+        cursor.execute(f'INSERT INTO {quote(SellerStats._meta.db_table)} ({columns}) {select}', params)
+        return cursor.rowcount
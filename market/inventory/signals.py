@@ -1,50 +1,125 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
+from django.utils import timezone
 import logging
 
-from .models import Cart
+from .cache import bump_listing_version, evict_product, set_cart_line
+from .history import record
+from .leaderboards import BOARDS, rating_score, refresh_entries
+from .models import Cart, Product, Rating
+from .notifications import enqueue_cart_notification
+from .seller_stats import product_deleted, product_saved, rating_changed
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Cart)
 def send_cart_notification_email(sender, instance, created, **kwargs):
+    # Only queue the email here; `manage.py send_cart_notifications` renders and sends it.
     if created and instance.status == Cart.Status.IN_CART:
-        try:
-            user = instance.user
-            product = instance.product
-            
-            if not user.email:
-                logger.warning(f"Користувач {user.username} не має email адреси")
-                return
-            
-            context = {
-                'user_first_name': instance.user.name or instance.user.username or instance.user.email,
-                'product_name': product.name,
-                'product_price': product.unit_price,
-                'product_unit': product.get_unit_display(),
-                'quantity': instance.quantity,
-                'total_price': product.unit_price * instance.quantity,
-                'cart_url': f"{settings.SITE_URL}/inventory/cart/",
-            }
-            
-            html_message = render_to_string('emails/cart_notification.html', context)
-            send_mail(
-                subject="🛒 Товар додано в кошик",
-                message=f"Товар {product.name} додано в кошик", 
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=True,
-            )
-            
-            logger.info(f"Email відправлено користувачу {user.email} про додавання {product.name} в кошик")
-            
-        except Exception as e:
-            logger.error(f"Помилка при відправці email: {str(e)}", exc_info=True)
+        enqueue_cart_notification(instance)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def update_cached_cart(sender, instance, **kwargs):
+    # Purchased rows are history; deleting one must not drop an open line for the same product.
+    if instance.status != Cart.Status.IN_CART:
+        return
+    quantity = None if kwargs.get('signal') is post_delete else instance.quantity
+    user_id, product_id = instance.user_id, instance.product_id
+    transaction.on_commit(lambda: set_cart_line(user_id, product_id, quantity))
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None or hasattr(instance, '_loaded_value'):
+        return
+    instance._loaded_value = (
+        Rating.objects.filter(pk=instance.pk).values_list('value', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Rating)
+def apply_rating_to_product(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_loaded_value', None)
+    if previous is None:
+        Product.objects.filter(pk=instance.product_id).update(
+            rating_sum=F('rating_sum') + instance.value,
+            rating_count=F('rating_count') + 1,
+            rating_score=rating_score(instance.value, 1),
+            ratings_changed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        rating_changed(instance.product_id, instance.value, 1)
+    elif previous != instance.value:
+        Product.objects.filter(pk=instance.product_id).update(
+            rating_sum=F('rating_sum') + (instance.value - previous),
+            rating_score=rating_score(instance.value - previous),
+            ratings_changed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        rating_changed(instance.product_id, instance.value - previous)
+    instance._loaded_value = instance.value
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_product(sender, instance, **kwargs):
+    # Runs inside the deletion transaction, including cascades from CustomUser.
+    value = getattr(instance, '_loaded_value', None) or instance.value
+    Product.objects.filter(pk=instance.product_id).update(
+        rating_sum=F('rating_sum') - value,
+        rating_count=F('rating_count') - 1,
+        rating_score=rating_score(-value, -1),
+        ratings_changed_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    rating_changed(instance.product_id, -value, -1)
+
+
+@receiver(post_save, sender=Product)
+def record_product_history(sender, instance, created, raw, update_fields, **kwargs):
+    if raw or (update_fields is not None and not {'unit_price', 'quantity'} & set(update_fields)):
+        return
+    previous = getattr(instance, '_loaded_state', None)
+    current = (instance.unit_price, instance.quantity)
+    if created or previous is None or (previous['unit_price'], previous['quantity']) != current:
+        record([(instance.pk, *current)])
+
+
+@receiver(post_save, sender=Product)
+def update_seller_stats(sender, instance, created, raw, update_fields, **kwargs):
+    if raw or (update_fields is not None and not {'owner', *Product.TRACKED_FIELDS} & set(update_fields)):
+        return
+    product_saved(instance, created, getattr(instance, '_loaded_state', None))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_seller_stats(sender, instance, **kwargs):
+    product_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_listing(sender, instance, **kwargs):
+    # Any product write can change which rows a filter matches, so listing pages go too.
+    pk = instance.pk
+    transaction.on_commit(lambda: (evict_product(pk), bump_listing_version()))
+    if kwargs.get('signal') is post_delete:
+        transaction.on_commit(lambda: [refresh_entries(board, [pk]) for board in BOARDS])
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_rated_product(sender, instance, **kwargs):
+    # Ratings don't affect filter membership; only the product's cached row and its
+    # top-rated entry are stale.
+    product_id = instance.product_id
+    transaction.on_commit(lambda: (evict_product(product_id), refresh_entries('top_rated', [product_id])))
 
 
 def ready():
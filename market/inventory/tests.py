@@ -1,3 +1,1442 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import csv
+from datetime import timedelta
+from decimal import Decimal
+import importlib.util
+from inspect import iscoroutinefunction
+from io import StringIO
+from itertools import combinations
+import json
+from pathlib import Path
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.contrib.sessions.models import Session
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from market.profiling import RequestProfile, request_stats
+from market.sessions import REFRESHED_AT_KEY, SessionStore
+from users.models import CustomUser
+from .bulk import _delete_dependents, _delete_where, delete_products, price_change, stock_change, update_products
+from .cache import acart_summary, cart_summary, get_cart_lines, get_products, listing_cache_stats
+from .catalog_io import PRODUCT_COLUMNS, export_rows
+from .checkout import CheckoutConflict, checkout
+from .filters import ProductFilter
+from .facets import compute_facets
+from .history import compact
+from .pagination import KeysetPaginator
+from .search import PostgresSearchBackend, SimpleSearchBackend, get_search_backend
+from .seller_stats import rebuild as rebuild_seller_stats
+from .models import (
+    Cart, CartNotification, Order, OrderLine, Product, ProductHistory, ProductHistoryRollup, Rating, SellerStats,
+    SimilarProduct,
+)
+from .leaderboards import rebuild_scores, top_product_ids
+from .notifications import send_pending_notifications
+from .reservations import InsufficientStock, add_to_hold, hold, release, release_expired_holds
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class RatingCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        cls.alice = CustomUser.objects.create_user('alice@example.com', 'pass', name='Alice', surname='One')
+        cls.bob = CustomUser.objects.create_user('bob@example.com', 'pass', name='Bob', surname='One')
+        cls.product = Product.objects.create(owner=cls.owner, name='Flour', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=8)
+
+    def assertCounters(self, rating_sum, rating_count):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.rating_sum, product.rating_count), (rating_sum, rating_count))
+        prior = Product.RATING_PRIOR_MEAN * Product.RATING_PRIOR_WEIGHT
+        self.assertAlmostEqual(product.rating_score, (rating_sum + prior) / (rating_count + Product.RATING_PRIOR_WEIGHT))
+
+    def test_counters_follow_create_change_and_delete(self):
+        Rating.objects.create(product=self.product, user=self.alice, value=5)
+        Rating.objects.create(product=self.product, user=self.bob, value=3)
+        self.assertCounters(8, 2)
+        Rating.objects.update_or_create(product=self.product, user=self.alice, defaults={'value': 1})
+        self.assertCounters(4, 2)
+        Rating.objects.update_or_create(product=self.product, user=self.alice, defaults={'value': 1})
+        self.assertCounters(4, 2)
+        Rating.objects.get(product=self.product, user=self.bob).delete()
+        self.assertCounters(1, 1)
+
+    def test_deleting_a_user_takes_their_ratings_off(self):
+        Rating.objects.create(product=self.product, user=self.alice, value=5)
+        Rating.objects.create(product=self.product, user=self.bob, value=2)
+        self.bob.delete()
+        self.assertCounters(5, 1)
+
+    def test_rebuild_fixes_drifted_counters(self):
+        Rating.objects.create(product=self.product, user=self.alice, value=4)
+        Rating.objects.create(product=self.product, user=self.bob, value=2)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=40, rating_count=9, rating_score=0)
+        call_command('rebuild_rating_counters', stdout=StringIO())
+        self.assertCounters(6, 2)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        # Scores tie in pairs, so ordering by score alone would be ambiguous.
+        cls.products = Product.objects.bulk_create([
+            Product(owner=owner, name=f'Product {i}', unit_price=1, unit=Product.Unit.PIECE, quantity=1, units_sold=i // 2)
+            for i in range(7)
+        ])
+
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return pages
+
+    def ids(self, page):
+        return [row['pk'] if isinstance(row, dict) else row.pk for row in page]
+
+    def test_next_and_previous_round_trip(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3)
+        pages = self.walk(paginator)
+        expected = sorted((p.pk for p in self.products), reverse=True)
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+        for before, after in zip(pages, pages[1:]):
+            self.assertEqual(self.ids(paginator.get_page(after.previous_cursor)), self.ids(before))
+        self.assertIsNone(paginator.get_page(pages[1].previous_cursor).previous_cursor)
+
+    def test_ties_on_the_score_are_broken_by_key(self):
+        paginator = KeysetPaginator(Product.objects.values('pk', 'units_sold'), 2, key='pk', score='units_sold')
+        pages = self.walk(paginator)
+        expected = [p.pk for p in sorted(self.products, key=lambda p: (p.units_sold, p.pk), reverse=True)]
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+        for before, after in zip(pages, pages[1:]):
+            self.assertEqual(self.ids(paginator.get_page(after.previous_cursor)), self.ids(before))
+
+    def test_dict_rows_from_values(self):
+        page = KeysetPaginator(Product.objects.values('pk', 'name'), 2, key='pk').get_page()
+        self.assertEqual(page.object_list[0], {'pk': self.products[-1].pk, 'name': 'Product 6'})
+        self.assertEqual(
+            self.ids(KeysetPaginator(Product.objects.values('pk'), 2, key='pk').get_page(page.next_cursor)),
+            [self.products[-3].pk, self.products[-4].pk],
+        )
+
+    def test_invalid_cursors_give_the_first_page(self):
+        first = self.ids(KeysetPaginator(Product.objects.all(), 3).get_page())
+        tampered = KeysetPaginator.encode_cursor('x', 5)
+        for cursor in ('!!!', 'bm90LWEtY3Vyc29y', tampered, KeysetPaginator.encode_cursor('n', 'abc')):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.ids(KeysetPaginator(Product.objects.all(), 3).get_page(cursor)), first)
+                scored = KeysetPaginator(Product.objects.all(), 3, score='units_sold')
+                self.assertEqual(len(scored.get_page(cursor)), 3)
+        response = self.client.get(reverse('inventory:api_products'), {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 200)
+
+
+class NamePrefixSearchBackend:
+    """Stand-in selected through PRODUCT_SEARCH_BACKEND: exact prefix matches only."""
+
+    def search(self, queryset, query):
+        return queryset.filter(name__startswith=query)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        for name in ('Apple juice', 'Green apple', 'Pineapple', 'Flour'):
+            Product.objects.create(owner=owner, name=name, unit_price=1, unit=Product.Unit.PIECE, quantity=1)
+
+    def names(self, data):
+        return list(ProductFilter(data, queryset=Product.objects.order_by('-id')).qs.values_list('name', flat=True))
+
+    def test_prefix_matches_rank_above_substring_matches(self):
+        products = SimpleSearchBackend().search(Product.objects.all(), ' apple ')
+        self.assertEqual(list(products.values_list('name', flat=True)), ['Apple juice', 'Pineapple', 'Green apple'])
+        self.assertEqual(list(products.values_list('search_rank', flat=True)), [2, 1, 1])
+
+    def test_filter_searches_by_name(self):
+        with override_settings(PRODUCT_SEARCH_BACKEND='inventory.search.SimpleSearchBackend'):
+            self.assertEqual(self.names({'name': 'apple'}), ['Apple juice', 'Pineapple', 'Green apple'])
+            self.assertEqual(len(self.names({'name': '  '})), 4)
+
+    def test_query_without_words_matches_literally(self):
+        Product.objects.create(owner=CustomUser.objects.get(), name='Juice 100%', unit_price=1, unit=Product.Unit.PIECE, quantity=1)
+        for backend in (SimpleSearchBackend(), PostgresSearchBackend()):
+            with self.subTest(backend=type(backend).__name__):
+                products = backend.search(Product.objects.all(), '%')
+                self.assertEqual(list(products.values_list('name', flat=True)), ['Juice 100%'])
+                self.assertFalse(backend.search(Product.objects.all(), '++').exists())
+
+    def test_backend_is_chosen_by_setting(self):
+        with override_settings(PRODUCT_SEARCH_BACKEND='inventory.tests.NamePrefixSearchBackend'):
+            self.assertIsInstance(get_search_backend(), NamePrefixSearchBackend)
+            self.assertEqual(self.names({'name': 'Green'}), ['Green apple'])
+        with override_settings(PRODUCT_SEARCH_BACKEND=None):
+            expected = PostgresSearchBackend if connection.vendor == 'postgresql' else SimpleSearchBackend
+            self.assertIsInstance(get_search_backend(), expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        cls.products = Product.objects.bulk_create([
+            Product(owner=cls.owner, name=f'Product {i}', unit_price=10 + i, unit=Product.Unit.KILOGRAM, quantity=5)
+            for i in range(6)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeat_request_is_served_without_queries(self):
+        url = reverse('inventory:products') + '?unit=kg'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['products']), 4)
+        self.assertEqual(listing_cache_stats()['hits'], 1)
+        self.assertEqual(listing_cache_stats()['misses'], 1)
+
+    def test_equivalent_filters_share_an_entry(self):
+        self.client.get(reverse('inventory:products') + '?min_price=10&name=')
+        self.client.get(reverse('inventory:products') + '?min_price=10.00')
+        self.assertEqual(listing_cache_stats()['hits'], 1)
+
+    def test_product_save_invalidates_listing(self):
+        url = reverse('inventory:products')
+        self.client.get(url)
+        product = Product.objects.get(pk=self.products[-1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed'
+            product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['products'][0].name, 'Renamed')
+        self.assertEqual(listing_cache_stats()['misses'], 2)
+
+    def test_rating_only_evicts_the_rated_product(self):
+        url = reverse('inventory:products')
+        self.client.get(url)
+        product = Product.objects.get(pk=self.products[-1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(product=product, user=self.owner, value=4)
+        # Listing page still cached; only the rated product is re-read.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.context['products'][0].avg_rating, 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        Product.objects.bulk_create([
+            Product(owner=cls.owner, name='Flour', unit_price=Decimal('12.50'), unit=Product.Unit.KILOGRAM, quantity=40),
+            Product(owner=cls.owner, name='Sugar', unit_price=Decimal('30.00'), unit=Product.Unit.KILOGRAM, quantity=5),
+            Product(owner=cls.owner, name='Milk', unit_price=Decimal('8.00'), unit=Product.Unit.LITRE, quantity=120),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_facets_follow_the_filter_in_one_query(self):
+        product_filter = ProductFilter({'max_price': '20'}, queryset=Product.objects.all())
+        with self.assertNumQueries(1):
+            facets = compute_facets(product_filter)
+        counts = {value: count for value, _, count in facets['units']}
+        self.assertEqual(counts, {'l': 1, 'kg': 1, 'm2': 0, 'pcs': 0, 'pack': 0})
+        self.assertEqual(facets['count'], 2)
+        # The price range ignores the price filter, so the slider can be widened again.
+        self.assertEqual((facets['min_price'], facets['max_price']), (Decimal('8.00'), Decimal('30.00')))
+        self.assertEqual((facets['min_quantity'], facets['max_quantity']), (40, 120))
+
+    def test_each_facet_ignores_only_its_own_filter(self):
+        facets = compute_facets(ProductFilter({'unit': 'kg', 'min_price': '10'}, queryset=Product.objects.all()))
+        counts = {value: count for value, _, count in facets['units']}
+        # Unit counts ignore the unit filter, but milk is below the price bound.
+        self.assertEqual(counts, {'l': 0, 'kg': 2, 'm2': 0, 'pcs': 0, 'pack': 0})
+        self.assertEqual(facets['count'], 2)
+        self.assertEqual((facets['min_price'], facets['max_price']), (Decimal('12.50'), Decimal('30.00')))
+        self.assertEqual((facets['min_quantity'], facets['max_quantity']), (5, 40))
+
+    def test_no_matches_leave_bounds_empty(self):
+        facets = compute_facets(ProductFilter({'name': 'nothing like it'}, queryset=Product.objects.all()))
+        self.assertEqual(facets['count'], 0)
+        self.assertIsNone(facets['max_price'])
+
+    def test_listing_bounds_sliders_and_caches_facets(self):
+        url = reverse('inventory:products')
+        response = self.client.get(url + '?sort=top_rated')
+        self.assertEqual(response.context['facets']['max_price'], Decimal('30.00'))
+        self.assertContains(response, 'id="min_quantity_range" type="range" min="5" max="120"')
+        self.assertContains(response, '<option value="kg">kilogram (2)</option>', html=True)
+        # Sorting doesn't change which products match, so the facets are shared.
+        with mock.patch('inventory.facets._grouped') as grouped:
+            response = self.client.get(url)
+        grouped.assert_not_called()
+        self.assertEqual(response.context['facets']['count'], 3)
+
+    def test_product_change_refreshes_facets(self):
+        url = reverse('inventory:products')
+        self.client.get(url)
+        product = Product.objects.get(name='Sugar')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.unit_price = Decimal('45.00')
+            product.save()
+        self.assertEqual(self.client.get(url).context['facets']['max_price'], Decimal('45.00'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CART_NOTIFICATION_DIGEST_WINDOW=60, CART_NOTIFICATION_MAX_ATTEMPTS=2)
+class CartNotificationQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'Product {i}', unit_price=10, unit=Product.Unit.PIECE, quantity=5)
+            for i in range(2)
+        ])
+
+    def add_to_cart(self):
+        for product in self.products:
+            Cart.objects.create(user=self.user, product=product)
+
+    def test_adding_to_cart_only_enqueues(self):
+        self.add_to_cart()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(CartNotification.objects.filter(status=CartNotification.Status.PENDING).count(), 2)
+
+    def test_adds_within_window_are_sent_as_one_digest(self):
+        self.add_to_cart()
+        self.assertEqual(send_pending_notifications()['sent'], 0)
+
+        result = send_pending_notifications(now=timezone.now() + timedelta(seconds=61))
+        self.assertEqual(result['sent'], 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Product 1', mail.outbox[0].alternatives[0][0])
+        self.assertFalse(CartNotification.objects.filter(status=CartNotification.Status.PENDING).exists())
+
+    def test_failed_send_is_retried_with_backoff(self):
+        self.add_to_cart()
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('smtp down')):
+            self.assertEqual(send_pending_notifications(now=later)['failed'], 2)
+            self.assertEqual(send_pending_notifications(now=later)['failed'], 0)
+            send_pending_notifications(now=later + timedelta(hours=1))
+        self.assertEqual(CartNotification.objects.filter(status=CartNotification.Status.FAILED).count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_rows_are_claimed_before_smtp_runs(self):
+        self.add_to_cart()
+        statuses = []
+
+        def send(message):
+            statuses.extend(CartNotification.objects.values_list('status', flat=True))
+            return 1
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', autospec=True, side_effect=send):
+            send_pending_notifications(now=timezone.now() + timedelta(seconds=61))
+        self.assertEqual(statuses, [CartNotification.Status.SENDING] * 2)
+        self.assertFalse(CartNotification.objects.exclude(status=CartNotification.Status.SENT).exists())
+        self.assertFalse(CartNotification.objects.filter(lease_expires_at__isnull=False).exists())
+
+    def test_abandoned_claim_is_retried_once_its_lease_runs_out(self):
+        self.add_to_cart()
+        later = timezone.now() + timedelta(seconds=61)
+        # A worker that claimed the rows and died before recording the outcome.
+        CartNotification.objects.update(status=CartNotification.Status.SENDING, lease_expires_at=later + timedelta(seconds=30))
+        self.assertEqual(send_pending_notifications(now=later)['sent'], 0)
+        self.assertEqual(send_pending_notifications(now=later + timedelta(seconds=30))['sent'], 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.apples = Product.objects.create(owner=cls.user, name='Apples', unit_price=2, unit=Product.Unit.KILOGRAM, quantity=10)
+        cls.milk = Product.objects.create(owner=cls.user, name='Milk', unit_price=1, unit=Product.Unit.LITRE, quantity=1)
+
+    def test_checkout_decrements_stock_and_empties_cart(self):
+        Cart.objects.create(user=self.user, product=self.apples, quantity=3)
+        Cart.objects.create(user=self.user, product=self.milk, quantity=1)
+        result = checkout(self.user)
+        self.assertTrue(result.ok)
+        self.assertEqual(Product.objects.get(pk=self.apples.pk).quantity, 7)
+        self.assertEqual(Product.objects.get(pk=self.milk.pk).quantity, 0)
+        self.assertFalse(Cart.objects.filter(user=self.user, status=Cart.Status.IN_CART).exists())
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total, Decimal('7.00'))
+        self.assertEqual(
+            sorted(order.lines.values_list('product_name', 'unit_price', 'quantity')),
+            [('Apples', Decimal('2.00'), Decimal('3.00')), ('Milk', Decimal('1.00'), Decimal('1.00'))],
+        )
+
+    def test_same_product_can_be_bought_twice(self):
+        for _ in range(2):
+            Cart.objects.create(user=self.user, product=self.apples, quantity=1)
+            self.assertTrue(checkout(self.user).ok)
+        self.assertEqual(Cart.objects.filter(user=self.user, status=Cart.Status.PURCHASED).count(), 2)
+        self.assertEqual(self.apples.order_lines.count(), 2)
+
+    def test_shortfall_leaves_everything_untouched(self):
+        Cart.objects.create(user=self.user, product=self.apples, quantity=3)
+        Cart.objects.create(user=self.user, product=self.milk, quantity=2)
+        result = checkout(self.user)
+        self.assertFalse(result.ok)
+        self.assertEqual([(s.name, s.requested, s.available) for s in result.shortfalls], [('Milk', 2, 1)])
+        self.assertEqual(Product.objects.get(pk=self.apples.pk).quantity, 10)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_lines_for_nothing_are_refused(self):
+        Cart.objects.create(user=self.user, product=self.apples, quantity=3)
+        Cart.objects.bulk_create([Cart(user=self.user, product=self.milk, quantity=-1)])
+        result = checkout(self.user)
+        self.assertFalse(result.ok)
+        self.assertEqual([(s.name, s.requested) for s in result.shortfalls], [('Milk', -1)])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.milk.pk).quantity, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user('alice@example.com', 'pass', name='Alice', surname='One')
+        cls.bob = CustomUser.objects.create_user('bob@example.com', 'pass', name='Bob', surname='Two')
+        cls.product = Product.objects.create(owner=cls.alice, name='Flour', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=5)
+
+    def reserved(self):
+        return Product.objects.get(pk=self.product.pk).reserved
+
+    def test_holds_are_exclusive(self):
+        hold(self.alice, self.product, 4)
+        with self.assertRaises(InsufficientStock) as raised:
+            hold(self.bob, self.product, 2)
+        self.assertEqual(raised.exception.available, 1)
+        self.assertFalse(Cart.objects.filter(user=self.bob).exists())
+        hold(self.alice, self.product, 1, relative=True)
+        self.assertEqual(self.reserved(), 5)
+
+    def test_shrinking_and_removing_give_stock_back(self):
+        line = hold(self.alice, self.product, 4)
+        hold(self.alice, self.product, 2)
+        self.assertEqual(self.reserved(), 2)
+        release(line)
+        self.assertEqual(self.reserved(), 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_expired_holds_are_released_in_bulk_and_on_demand(self):
+        hold(self.alice, self.product, 5)
+        Cart.objects.update(held_until=timezone.now() - timedelta(seconds=1))
+        hold(self.bob, self.product, 3)
+        self.assertEqual(self.reserved(), 3)
+        self.assertEqual(Cart.objects.get(user=self.alice).held, 0)
+
+        Cart.objects.filter(user=self.bob).update(held_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_holds(batch_size=1), 1)
+        self.assertEqual(self.reserved(), 0)
+
+    def test_checkout_turns_holds_into_the_sale(self):
+        hold(self.alice, self.product, 2)
+        hold(self.bob, self.product, 3)
+        self.assertTrue(checkout(self.alice).ok)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.quantity, product.reserved), (3, 3))
+        self.assertTrue(checkout(self.bob).ok)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AddToCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.product = Product.objects.create(owner=cls.user, name='Flour', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('inventory:add_to_cart', args=[self.product.pk])
+
+    def line(self):
+        return Cart.objects.values_list('quantity', 'held').get(user=self.user)
+
+    def test_get_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_replayed_idempotency_key_is_applied_once(self):
+        for _ in range(2):
+            self.client.post(self.url, {'idempotency_key': 'abc'})
+        self.assertEqual(self.line(), (1, 1))
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='def')
+        self.assertEqual(self.line(), (2, 2))
+
+    def test_increment_is_bounded_by_stock(self):
+        hold(self.user, self.product, 1)
+        self.client.get(reverse('inventory:products'))
+        # user, product, then the cart line and the reservation grown in place; no reads
+        # of the line (the other two are the savepoint the test transaction adds)
+        with self.assertNumQueries(6):
+            self.client.post(self.url)
+        self.client.post(self.url)
+        self.assertEqual(self.line(), (2, 2))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).reserved, 2)
+
+    @override_settings(ADD_TO_CART_BURST=2, ADD_TO_CART_RATE=0.01)
+    def test_token_bucket_limits_each_user(self):
+        statuses = [self.client.post(self.url).status_code for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertIn('Retry-After', self.client.post(self.url))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 20
+
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        self.product = Product.objects.create(owner=owner, name='Scarce', unit_price=1, unit=Product.Unit.PIECE, quantity=5)
+        self.users = [
+            CustomUser.objects.create_user(f'buyer{i}@example.com', 'pass', name='Buyer', surname=str(i))
+            for i in range(self.buyers)
+        ]
+        Cart.objects.bulk_create([Cart(user=u, product=self.product, quantity=2) for u in self.users])
+
+    def test_stock_never_goes_negative(self):
+        def buy(user):
+            try:
+                return checkout(user).ok
+            except CheckoutConflict:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.buyers) as pool:
+            results = list(pool.map(buy, self.users))
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count(True), 2)
+        self.assertEqual(self.product.quantity, Decimal('1'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'Product {i}', unit_price=2, unit=Product.Unit.PIECE, quantity=3)
+            for i in range(10)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_cart(self, size, quantity=1):
+        Cart.objects.bulk_create([Cart(user=self.user, product=p, quantity=quantity) for p in self.products[:size]])
+
+    def test_query_count_is_constant_in_cart_size(self):
+        # user, cart lines (with subtotals and total); the session comes from the cache
+        self.client.get(reverse('inventory:cart'))
+        for size in (1, 10):
+            Cart.objects.all().delete()
+            self.fill_cart(size)
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('inventory:cart'))
+            self.assertEqual(response.context['total'], Decimal(2 * size))
+
+    def test_over_stock_lines_are_flagged_not_written(self):
+        self.fill_cart(2, quantity=5)
+        response = self.client.get(reverse('inventory:cart'))
+        self.assertTrue(response.context['has_over_stock'])
+        self.assertEqual(set(Cart.objects.values_list('quantity', flat=True)), {Decimal(5)})
+
+        self.client.post(reverse('inventory:reconcile_cart'))
+        self.assertEqual(set(Cart.objects.values_list('quantity', flat=True)), {Decimal(3)})
+
+    def test_reconcile_after_stock_cut_below_holds(self):
+        other = CustomUser.objects.create_user('other@example.com', 'pass', name='Other', surname='Two')
+        product = Product.objects.create(owner=self.user, name='Boards', unit_price=10, unit=Product.Unit.PIECE, quantity=5)
+        hold(self.user, product, 3)
+        hold(other, product, 2)
+        Product.objects.filter(pk=product.pk).update(quantity=1)
+
+        # Nothing is left for the first line: it goes, and so does its hold.
+        self.client.post(reverse('inventory:reconcile_cart'))
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(Product.objects.get(pk=product.pk).reserved, 2)
+
+        self.client.force_login(other)
+        self.client.post(reverse('inventory:reconcile_cart'))
+        line = Cart.objects.get(user=other)
+        self.assertEqual((line.quantity, line.held), (1, 1))
+        self.assertEqual(Product.objects.get(pk=product.pk).reserved, 1)
+
+    def test_stock_cannot_be_edited_below_holds(self):
+        product = self.products[0]
+        hold(self.user, product, 2)
+        response = self.client.post(reverse('inventory:edit_product', args=[product.pk]), {
+            'name': product.name, 'unit_price': 2, 'unit': product.unit, 'quantity': 1, 'owner': self.user.pk,
+        })
+        self.assertFormError(response.context['form'], 'quantity', "2.00 are held in carts; stock can't go below that.")
+        self.assertEqual(Product.objects.get(pk=product.pk).quantity, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartBadgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.apples = Product.objects.create(owner=cls.user, name='Apples', unit_price=2, unit=Product.Unit.KILOGRAM, quantity=10)
+        cls.milk = Product.objects.create(owner=cls.user, name='Milk', unit_price=1, unit=Product.Unit.LITRE, quantity=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_badge_costs_no_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(self.user, self.apples, 3)
+        cart_summary(self.user.pk)
+        with self.assertNumQueries(0):
+            summary = cart_summary(self.user.pk)
+        self.assertEqual(summary, {'count': 1, 'total': Decimal('6.00')})
+        self.assertEqual(async_to_sync(acart_summary)(self.user.pk), summary)
+
+    def test_cart_changes_patch_the_cached_lines(self):
+        get_cart_lines(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(self.user, self.apples, 3)
+            line = hold(self.user, self.milk, 1)
+            add_to_hold(self.user, self.apples, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            release(line)
+        with self.assertNumQueries(0):
+            lines = get_cart_lines(self.user.pk)
+        self.assertEqual(lines, {self.apples.pk: Decimal(5)})
+        self.assertEqual(lines, dict(self.user.cart_items.filter(status=Cart.Status.IN_CART).values_list('product_id', 'quantity')))
+
+    def test_checkout_empties_the_badge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(self.user, self.apples, 3)
+        cart_summary(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(checkout(self.user).ok)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_summary(self.user.pk), {'count': 0, 'total': 0})
+
+    def test_price_change_reaches_the_total(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(self.user, self.apples, 3)
+        cart_summary(self.user.pk)
+        product = Product.objects.get(pk=self.apples.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.unit_price = Decimal('2.50')
+            product.save()
+        self.assertEqual(cart_summary(self.user.pk)['total'], Decimal('7.50'))
+
+    def test_navbar_shows_the_badge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hold(self.user, self.apples, 3)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('inventory:products'))
+        self.assertContains(response, '<span class="badge bg-success">1</span>', html=True)
+
+
+@contextmanager
+def async_routing(enabled=True):
+    """Route the read views as ASYNC_VIEWS=`enabled` does at startup, whatever the settings say."""
+    def reload_urls():
+        importlib.reload(importlib.import_module('inventory.urls'))
+        importlib.reload(importlib.import_module('market.urls'))
+        clear_url_caches()
+
+    try:
+        with override_settings(ASYNC_VIEWS=enabled):
+            reload_urls()
+            yield
+    finally:
+        reload_urls()
+
+
+def streamed(response):
+    """The body of a streaming response, whether its iterator is sync or async."""
+    if response.is_async:
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(read)()
+    return b''.join(response.streaming_content)
+
+
+def _comparable(response):
+    # Per-request tokens aside, both views must render the same page.
+    content = re.sub(r'name="csrfmiddlewaretoken" value="[^"]*"', '', response.content.decode())
+    return re.sub(r'name="idempotency_key" value="[0-9a-f]+-', '', content)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+        cls.products = Product.objects.bulk_create([
+            Product(owner=cls.user, name=f'Product {i}', unit_price=2 + i, unit=Product.Unit.PIECE, quantity=3)
+            for i in range(6)
+        ])
+        Rating.objects.create(product=cls.products[0], user=cls.user, value=4)
+        SimilarProduct.objects.create(product=cls.products[0], similar=cls.products[1], rank=0, score=0.5)
+        Cart.objects.create(user=cls.user, product=cls.products[2], quantity=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def fetch(self, method, url, data=None):
+        """The sync view's response, then the async view's."""
+        with async_routing(False):
+            self.assertFalse(iscoroutinefunction(resolve(url).func))
+            sync_response = getattr(self.client, method)(url, data)
+        with async_routing():
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+            async_response = async_to_sync(getattr(self.async_client, method))(url, data)
+        return sync_response, async_response
+
+    def assertSamePage(self, sync_response, async_response, keys):
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        for key in keys:
+            with self.subTest(key=key):
+                sync_value, async_value = sync_response.context[key], async_response.context[key]
+                if hasattr(sync_value, 'object_list'):
+                    sync_value, async_value = list(sync_value), list(async_value)
+                self.assertEqual(async_value, sync_value)
+        self.assertEqual(_comparable(async_response), _comparable(sync_response))
+
+    def test_products(self):
+        for query in ({}, {'unit': 'pcs', 'sort': 'top_rated'}, {'name': 'Product 1'}):
+            with self.subTest(query=query):
+                sync_response, async_response = self.fetch('get', reverse('inventory:products'), query)
+                self.assertSamePage(sync_response, async_response, ['products', 'facets', 'leaderboards'])
+        self.assertEqual(len(async_response.context['products']), 1)
+
+    def test_product_detail(self):
+        url = reverse('inventory:product_detail', args=[self.products[0].pk])
+        sync_response, async_response = self.fetch('get', url)
+        self.assertSamePage(sync_response, async_response, ['product', 'avg_rating', 'user_rating', 'similar'])
+        self.assertEqual(async_response.context['user_rating'].value, 4)
+        self.assertEqual([entry.similar for entry in async_response.context['similar']], [self.products[1]])
+
+    def test_rating_post(self):
+        url = reverse('inventory:product_detail', args=[self.products[0].pk])
+        with async_routing():
+            response = async_to_sync(self.async_client.post)(url, {'rating': 2})
+        self.assertEqual(response.context['user_rating'].value, 2)
+        self.assertEqual(response.context['avg_rating'], 2)
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((product.rating_sum, product.rating_count), (2, 1))
+        # The page after the POST is the one the sync view shows for the same state.
+        sync_response, async_response = self.fetch('get', url)
+        self.assertSamePage(sync_response, async_response, ['product', 'avg_rating', 'user_rating'])
+
+    def test_export_streams_from_an_async_iterator(self):
+        sync_response, async_response = self.fetch('get', reverse('inventory:export_products'), {'unit': 'pcs'})
+        self.assertTrue(async_response.is_async)
+        content = streamed(async_response)
+        self.assertEqual(content, streamed(sync_response))
+        self.assertEqual(len(list(csv.reader(StringIO(content.decode())))), 1 + len(self.products))
+
+    def test_cart(self):
+        sync_response, async_response = self.fetch('get', reverse('inventory:cart'))
+        self.assertSamePage(sync_response, async_response, ['cart_items', 'total', 'has_over_stock'])
+        self.assertEqual(async_response.context['total'], Decimal('8.00'))
+        self.assertContains(async_response, '<span class="badge bg-success">1</span>', html=True)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "EXPLAIN output is PostgreSQL-specific")
+class ProductFilterQueryPlanTests(TestCase):
+    catalog_size = 50_000
+    filter_values = {
+        'unit': Product.Unit.LITRE,
+        'min_price': 100,
+        'max_price': 110,
+        'min_quantity': 500,
+        'max_quantity': 520,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        rng = random.Random(0)
+        units = [choice for choice, _ in Product.Unit.choices]
+        Product.objects.bulk_create(
+            [
+                Product(
+                    owner=owner,
+                    name=f'Product {i}',
+                    unit=rng.choice(units),
+                    unit_price=Decimal(rng.randrange(0, 100_000)) / 100,
+                    quantity=rng.randrange(0, 10_000) / 10,
+                )
+                for i in range(cls.catalog_size)
+            ],
+            batch_size=5_000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE inventory_product')
+
+    # Migration 0010 (filters) and 0009 (name search).
+    filter_indexes = (
+        'product_unit_id_idx', 'product_unit_price_idx', 'product_unit_quantity_idx',
+        'product_price_idx', 'product_quantity_idx',
+    )
+    search_indexes = ('inventory_product_name_tsv_idx', 'inventory_product_name_trgm_idx')
+
+    def explain(self, data, limit=None):
+        queryset = ProductFilter(data, queryset=Product.objects.order_by('-id')).qs
+        return (queryset[:limit] if limit else queryset).explain()
+
+    def assertUsesIndex(self, plan, names):
+        self.assertNotIn('Seq Scan on inventory_product', plan)
+        self.assertTrue(any(name in plan for name in names), plan)
+
+    def test_filter_combinations_use_indexes(self):
+        # Without a LIMIT, so a backward scan of the primary key can't stand in for them.
+        # Unit alone matches a fifth of the catalog, which a full scan rightly serves.
+        for size in range(1, len(self.filter_values) + 1):
+            for names in combinations(self.filter_values, size):
+                if names == ('unit',):
+                    continue
+                with self.subTest(filters=names):
+                    plan = self.explain({name: self.filter_values[name] for name in names})
+                    self.assertUsesIndex(plan, self.filter_indexes)
+
+    def test_unit_page_uses_unit_id_index(self):
+        plan = self.explain({'unit': Product.Unit.LITRE}, limit=5)
+        self.assertUsesIndex(plan, ['product_unit_id_idx'])
+
+    def test_name_search_uses_search_indexes(self):
+        for data in ({'name': 'Product 4242'}, {'name': 'duct 4242', 'unit': Product.Unit.LITRE}):
+            with self.subTest(filters=data):
+                self.assertUsesIndex(self.explain(data), self.search_indexes)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        cls.product = Product.objects.create(owner=cls.user, name='Flour', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=8)
+
+    def test_detail_revalidates_with_etag(self):
+        url = reverse('inventory:api_product_detail', args=[self.product.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['name'], 'Flour')
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Rating.objects.create(product=self.product, user=self.user, value=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['avg_rating'], 5)
+
+    def test_list_etag_changes_when_a_product_changes(self):
+        url = reverse('inventory:api_products') + '?unit=kg'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Product.objects.filter(pk=self.product.pk).update(name='Rye flour', updated_at=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['name'], 'Rye flour')
+
+    def test_search_results_keep_relevance_order_across_pages(self):
+        for name in ('Green apple', 'Apple juice', 'Pineapple'):
+            Product.objects.create(owner=self.user, name=name, unit_price=1, unit=Product.Unit.PIECE, quantity=1)
+        url = reverse('inventory:api_products')
+        with mock.patch('inventory.api.API_PAGE_SIZE', 2):
+            first = self.client.get(url, {'name': 'apple'}).json()
+            second = self.client.get(url, {'name': 'apple', 'cursor': first['next']}).json()
+        # Prefix matches first, then newest.
+        self.assertEqual([row['name'] for row in first['results']], ['Apple juice', 'Pineapple'])
+        self.assertEqual([row['name'] for row in second['results']], ['Green apple'])
+        self.assertIsNone(second['next'])
+        self.assertIsNotNone(second['previous'])
+
+    def test_sort_pages_by_score_then_id(self):
+        other = CustomUser.objects.create_user('rater@example.com', 'pass', name='Rater', surname='One')
+        products = [
+            Product.objects.create(owner=self.user, name=f'Product {i}', unit_price=1, unit=Product.Unit.PIECE, quantity=1)
+            for i in range(3)
+        ]
+        Rating.objects.create(product=products[0], user=other, value=5)
+        # Flour, products[1] and products[2] tie on the prior score and fall back to newest first.
+        expected = [products[0].pk, products[2].pk, products[1].pk, self.product.pk]
+        url = reverse('inventory:api_products')
+        seen, cursor, pages = [], None, []
+        with mock.patch('inventory.api.API_PAGE_SIZE', 1):
+            while True:
+                page = self.client.get(url, {'sort': 'top_rated', 'cursor': cursor or ''}).json()
+                pages.append(page)
+                seen += [row['id'] for row in page['results']]
+                cursor = page['next']
+                if cursor is None:
+                    break
+            back = self.client.get(url, {'sort': 'top_rated', 'cursor': pages[-1]['previous']}).json()
+        self.assertEqual(seen, expected)
+        self.assertEqual([row['id'] for row in back['results']], [expected[-2]])
+        self.assertIn('rating_score', pages[0]['results'][0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user('staff@example.com', 'pass', name='Staff', surname='One', is_staff=True)
+        cls.product = Product.objects.create(owner=cls.staff, name='Flour', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=8)
+
+    def setUp(self):
+        request_stats.reset()
+
+    def test_records_queries_and_timings_per_url_name(self):
+        self.client.get(reverse('inventory:api_product_detail', args=[self.product.pk]))
+        self.client.force_login(self.staff)
+        rows = self.client.get(reverse('request_stats') + '?format=json').json()['views']
+        row = next(row for row in rows if row['view'] == 'inventory:api_product_detail')
+        self.assertEqual(row['requests'], 1)
+        self.assertEqual(row['queries_max'], 1)
+        self.assertGreater(row['wall_ms_p50'], 0)
+        self.assertEqual(row['n_plus_one'], 0)
+
+    def test_repeated_sql_shape_is_flagged(self):
+        profile = RequestProfile()
+        for _ in range(5):
+            profile.add_query('SELECT 1 FROM t WHERE id IN (%s, %s)', 0.001)
+        self.assertEqual(profile.shapes.most_common(1)[0], ('SELECT 1 FROM t WHERE id IN (...)', 5))
+
+    def test_stats_page_is_staff_only(self):
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('request_stats'))
+        self.assertContains(response, 'Request stats')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        cls.flour = Product.objects.create(owner=cls.owner, name='Flour', unit_price=10, unit=Product.Unit.KILOGRAM, quantity=5)
+        cls.milk = Product.objects.create(owner=cls.owner, name='Milk', unit_price=3, unit=Product.Unit.LITRE, quantity=8)
+
+    def setUp(self):
+        cache.clear()
+
+    def import_file(self, text, filename='products.csv'):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / filename
+        path.write_text(text, encoding='utf-8')
+        stderr = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_products', str(path), owner=self.owner.email, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_upsert_updates_inserts_and_records_only_changes(self):
+        self.import_file(
+            'id,name,unit_price,unit,quantity\n'
+            f'{self.flour.pk},Wholemeal flour,12.00,kg,5\n'
+            f'{self.milk.pk},Milk,3.00,l,8\n'
+            ',Sugar,4.50,kg,20\n'
+        )
+        self.assertEqual(Product.objects.get(pk=self.flour.pk).name, 'Wholemeal flour')
+        self.assertTrue(Product.objects.filter(name='Sugar', owner=self.owner).exists())
+        self.assertEqual(ProductHistory.objects.filter(product=self.flour).count(), 2)
+        self.assertEqual(ProductHistory.objects.filter(product=self.milk).count(), 1)
+        self.assertEqual(SellerStats.objects.get(owner=self.owner, unit=Product.Unit.KILOGRAM).products, 2)
+
+    def test_invalid_rows_are_reported_with_their_line(self):
+        errors = self.import_file(
+            'name,unit_price,unit,quantity\n'
+            'Salt,1.00,kg,3\n'
+            'Cheap,-5,kg,3\n'
+            'Negative,2.00,kg,-1\n'
+        )
+        self.assertIn('line 3: unit_price:', errors)
+        self.assertIn('line 4: quantity:', errors)
+        self.assertTrue(Product.objects.filter(name='Salt').exists())
+        self.assertFalse(Product.objects.filter(name__in=['Cheap', 'Negative']).exists())
+
+    def test_lines_that_are_not_json_objects_are_rejected(self):
+        errors = self.import_file(
+            '{"name": "Salt", "unit_price": "1.00", "unit": "kg", "quantity": 3}\n'
+            '{"name": "Pepper", \n'
+            '[1, 2]\n'
+            '{"name": "Rice", "unit_price": "2.00", "unit": "kg", "quantity": 4}\n',
+            filename='products.jsonl',
+        )
+        self.assertIn('line 2: Invalid JSON:', errors)
+        self.assertIn('line 3: Expected a JSON object, got list.', errors)
+        self.assertEqual(set(Product.objects.filter(name__in=['Salt', 'Rice']).values_list('name', flat=True)), {'Salt', 'Rice'})
+
+    def test_updated_products_are_evicted_from_the_cache(self):
+        self.assertEqual(get_products([self.flour.pk])[0].name, 'Flour')
+        self.import_file(f'id,name,unit_price,unit,quantity\n{self.flour.pk},Rye flour,10.00,kg,5\n')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_products([self.flour.pk])[0].name, 'Rye flour')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'pass', name='Owner', surname='One')
+        rater = CustomUser.objects.create_user('rater@example.com', 'pass', name='Rater', surname='One')
+        cls.flour = Product.objects.create(owner=cls.owner, name='Flour, rye', unit_price=3, unit=Product.Unit.KILOGRAM, quantity=8)
+        cls.sugar = Product.objects.create(owner=cls.owner, name='Sugar', unit_price=5, unit=Product.Unit.KILOGRAM, quantity=2)
+        cls.milk = Product.objects.create(owner=cls.owner, name='Milk', unit_price=1, unit=Product.Unit.LITRE, quantity=9)
+        Rating.objects.create(product=cls.flour, user=cls.owner, value=5)
+        Rating.objects.create(product=cls.flour, user=rater, value=4)
+
+    def export(self, query=None):
+        response = self.client.get(reverse('inventory:export_products'), query or {})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(StringIO(streamed(response).decode())))
+
+    def test_streams_header_and_filtered_rows(self):
+        rows = self.export({'unit': 'kg', 'max_price': '4'})
+        self.assertEqual(rows, [
+            ['id', 'name', 'unit_price', 'unit', 'quantity', 'avg_rating', 'rating_count'],
+            [str(self.flour.pk), 'Flour, rye', '3.00', 'kg', '8.00', '4.5', '2'],
+        ])
+
+    def test_unrated_products_have_no_average(self):
+        rows = self.export({'unit': 'kg'})
+        self.assertEqual([row[1] for row in rows[1:]], ['Sugar', 'Flour, rye'])
+        self.assertEqual(rows[1][5:], ['', '0'])
+
+    def test_export_rows_match_the_import_columns(self):
+        rows = list(export_rows(Product.objects.filter(unit=Product.Unit.KILOGRAM)))
+        self.assertEqual([list(row) for row in rows], [PRODUCT_COLUMNS] * 2)
+        self.assertEqual(rows[0]['id'], self.flour.pk)
+        self.assertEqual(rows[0]['owner'], self.owner.pk)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_reports_every_scenario_and_rolls_back(self):
+        out = StringIO()
+        call_command(
+            'benchmark', users=5, products=30, carts=2, iterations=2,
+            baseline='/nonexistent/baseline.json', stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertIn('purchase', report['scenarios'])
+        for name, result in report['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['rps'], 0)
+        self.assertFalse(Product.objects.exists())
+
+    def test_on_commit_hooks_run_after_each_request(self):
+        with mock.patch('inventory.checkout.clear_cart') as clear_cart:
+            call_command(
+                'benchmark', users=5, products=30, carts=2, iterations=2, scenario=['purchase'],
+                baseline='/nonexistent/baseline.json', stdout=StringIO(), stderr=StringIO(),
+            )
+        # Two warm-up purchases and two timed ones, each with a refilled cart.
+        self.assertEqual(clear_cart.call_count, 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SlidingSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='One')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('inventory:products'))
+
+    def expire_date(self):
+        return Session.objects.get(session_key=self.client.session.session_key).expire_date
+
+    def test_requests_do_not_write_the_session(self):
+        expire_date = self.expire_date()
+        with self.assertNumQueries(2):  # user and cart lines; no session read or write
+            self.client.get(reverse('inventory:cart'))
+        self.assertEqual(self.expire_date(), expire_date)
+
+    def test_expiry_is_extended_once_below_the_threshold(self):
+        session = self.client.session
+        session[REFRESHED_AT_KEY] -= 2 * 24 * 60 * 60
+        session.save()
+        expire_date = self.expire_date()
+        response = self.client.get(reverse('inventory:cart'))
+        self.assertGreater(self.expire_date(), expire_date)
+        self.assertIn('sessionid', response.cookies)
+
+    def test_purge_removes_expired_rows_only(self):
+        Session.objects.create(session_key='stale', session_data='', expire_date=timezone.now() - timedelta(days=1))
+        self.assertEqual(SessionStore.clear_expired(batch_size=1), 1)
+        self.assertTrue(Session.objects.filter(session_key=self.client.session.session_key).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(f'user{i}@example.com', 'pass', name='User', surname=str(i)) for i in range(3)
+        ]
+        cls.flour, cls.sugar, cls.salt = [
+            Product.objects.create(owner=cls.users[0], name=name, unit_price=1, unit=Product.Unit.KILOGRAM, quantity=50)
+            for name in ('Flour', 'Sugar', 'Salt')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_scores_follow_ratings_and_purchases(self):
+        for user in self.users:
+            Rating.objects.create(product=self.sugar, user=user, value=5)
+        rating = Rating.objects.create(product=self.flour, user=self.users[0], value=5)
+        rating.value = 4
+        rating.save()
+        Cart.objects.create(user=self.users[1], product=self.salt, quantity=7)
+        Cart.objects.create(user=self.users[1], product=self.flour, quantity=2)
+        checkout(self.users[1])
+
+        incremental = dict(Product.objects.values_list('pk', 'rating_score'))
+        units_sold = dict(Product.objects.values_list('pk', 'units_sold'))
+        rebuild_scores()
+        self.assertEqual(dict(Product.objects.values_list('pk', 'rating_score')), incremental)
+        self.assertEqual(dict(Product.objects.values_list('pk', 'units_sold')), units_sold)
+        self.assertEqual(top_product_ids('top_rated', 5), [self.sugar.pk, self.flour.pk])
+        self.assertEqual(top_product_ids('best_selling', 5), [self.salt.pk, self.flour.pk])
+
+    def test_sort_option_and_widget(self):
+        Rating.objects.create(product=self.flour, user=self.users[0], value=5)
+        Rating.objects.create(product=self.salt, user=self.users[0], value=2)
+        response = self.client.get(reverse('inventory:products'), {'sort': 'top_rated'})
+        self.assertEqual([p.pk for p in response.context['products']], [self.flour.pk, self.sugar.pk, self.salt.pk])
+        self.assertEqual([p.pk for p in response.context['leaderboards']['top_rated']], [self.flour.pk, self.salt.pk])
+        self.assertContains(response, 'Top rated')
+
+    def test_sorted_listing_pages_past_the_numbered_pager(self):
+        for product, units_sold in ((self.flour, 5), (self.sugar, 9), (self.salt, 5)):
+            Product.objects.filter(pk=product.pk).update(units_sold=units_sold)
+        url = reverse('inventory:products')
+        pages, cursor = [], None
+        small_pages = {'PAGE_NUMBERS_MAX_RESULTS': 1, 'PRODUCTS_PER_PAGE': 1}
+        with mock.patch.multiple('inventory.views', **small_pages), mock.patch.multiple('inventory.async_views', **small_pages):
+            while True:
+                products = self.client.get(url, {'sort': 'best_selling', 'cursor': cursor or ''}).context['products']
+                pages.append(products)
+                cursor = products.next_cursor
+                if cursor is None:
+                    break
+            back = self.client.get(url, {'sort': 'best_selling', 'cursor': pages[-1].previous_cursor}).context['products']
+        self.assertEqual([p.pk for page in pages for p in page], [self.sugar.pk, self.salt.pk, self.flour.pk])
+        self.assertEqual([p.pk for p in back], [self.salt.pk])
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "NumPy is not installed")
+class SimilarProductTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        cls.users = [
+            CustomUser.objects.create_user(f'rater{i}@example.com', 'pass', name='Rater', surname=str(i)) for i in range(12)
+        ]
+        cls.products = [
+            Product.objects.create(owner=cls.users[0], name=f'Product {i}', unit_price=1, unit=Product.Unit.PIECE, quantity=5)
+            for i in range(8)
+        ]
+        Rating.objects.bulk_create([
+            Rating(product=product, user=user, value=rng.randint(1, 5))
+            for user in cls.users for product in cls.products if rng.random() < 0.6
+        ])
+        call_command('rebuild_rating_counters', stdout=StringIO())
+
+    def dense_neighbours(self, k):
+        import numpy as np
+        from .recommendations import SHRINKAGE
+
+        matrix = np.zeros((len(self.products), len(self.users)))
+        index = {p.pk: i for i, p in enumerate(self.products)}
+        columns = {u.pk: j for j, u in enumerate(self.users)}
+        for product_id, user_id, value in Rating.objects.values_list('product_id', 'user_id', 'value'):
+            matrix[index[product_id], columns[user_id]] = value
+        rated = matrix > 0
+        means = matrix.sum(axis=0) / np.maximum(rated.sum(axis=0), 1)
+        centred = np.where(rated, matrix - means, 0)
+        norms = np.linalg.norm(centred, axis=1)
+        support = ((centred != 0).astype(int) @ (centred != 0).T.astype(int))
+        scores = centred @ centred.T / np.outer(norms, norms) * support / (support + SHRINKAGE)
+        expected = {}
+        for i, product in enumerate(self.products):
+            ranked = sorted(
+                ((score, self.products[j].pk) for j, score in enumerate(scores[i]) if j != i and score > 1e-9),
+                key=lambda entry: -entry[0],
+            )
+            expected[product.pk] = ranked[:k]
+        return expected
+
+    def stored_neighbours(self):
+        stored = {p.pk: [] for p in self.products}
+        for entry in SimilarProduct.objects.order_by('product_id', 'rank'):
+            stored[entry.product_id].append((entry.score, entry.similar_id))
+        return stored
+
+    def assertNeighbours(self, stored, expected):
+        self.assertEqual(len(stored), len(expected))
+        for (score, _), (stored_score, _) in zip(expected, stored):
+            self.assertAlmostEqual(score, stored_score, places=5)
+
+    def test_chunked_job_matches_dense_similarity(self):
+        from .recommendations import rebuild
+
+        # Tiny blocks force many chunks; the result must not depend on them.
+        run = rebuild(k=3, max_pairs=10, batch_size=3)
+        self.assertEqual((run.products, run.ratings, run.incremental), (8, Rating.objects.count(), False))
+        stored = self.stored_neighbours()
+        for pk, expected in self.dense_neighbours(3).items():
+            self.assertNeighbours(stored[pk], expected)
+
+    def test_incremental_refresh_and_detail_page(self):
+        from .recommendations import rebuild
+
+        rebuild(k=3)
+        self.assertEqual(rebuild(k=3, incremental=True).products, 0)
+
+        changed = self.products[0]
+        Rating.objects.filter(product=changed).first().delete()
+        run = rebuild(k=3, incremental=True)
+        self.assertTrue(run.incremental)
+        self.assertGreaterEqual(run.products, 1)
+        self.assertNeighbours(self.stored_neighbours()[changed.pk], self.dense_neighbours(3)[changed.pk])
+
+        product = self.products[1]
+        neighbours = list(SimilarProduct.objects.filter(product=product).order_by('rank'))
+        response = self.client.get(reverse('inventory:product_detail', args=[product.pk]))
+        self.assertEqual(response.context['similar'], neighbours)
+        self.assertContains(response, 'Similar products')
+
+
+class ProductHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('seller@example.com', 'pass', name='Seller', surname='One')
+        cls.product = Product.objects.create(owner=cls.user, name='Tea', unit_price=5, unit=Product.Unit.PACK, quantity=20)
+
+    def history(self):
+        return list(ProductHistory.objects.filter(product=self.product).order_by('pk').values_list('unit_price', 'quantity'))
+
+    def test_price_and_stock_changes_are_appended(self):
+        self.client.force_login(self.user)
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = 'Green tea'
+        product.save()
+        self.client.post(reverse('inventory:edit_product', args=[self.product.pk]), {
+            'name': 'Green tea', 'unit_price': '6.50', 'unit': 'pack', 'quantity': '20', 'owner': self.user.pk,
+        })
+        Cart.objects.create(user=self.user, product=self.product, quantity=3)
+        checkout(self.user)
+        self.assertEqual(self.history(), [
+            (Decimal('5.00'), Decimal('20.00')), (Decimal('6.50'), Decimal('20.00')), (Decimal('6.50'), Decimal('17.00')),
+        ])
+
+    def add_point(self, recorded_at, unit_price, quantity):
+        ProductHistory.objects.create(product=self.product, recorded_at=recorded_at, unit_price=unit_price, quantity=quantity)
+
+    @override_settings(PRODUCT_HISTORY_RAW_RETENTION=24 * 60 * 60)
+    def test_compaction_and_range_queries(self):
+        ProductHistory.objects.all().delete()
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        self.add_point(day + timedelta(hours=1, minutes=5), 5, 20)
+        self.add_point(day + timedelta(hours=1, minutes=30), 7, 18)
+        self.add_point(day + timedelta(hours=1, minutes=50), 6, 15)
+        self.add_point(day + timedelta(hours=9), 4, 30)
+        self.add_point(day + timedelta(days=1, hours=2), 8, 10)
+
+        first = compact()
+        self.assertEqual(first, {'hourly': 3, 'daily': 2, 'raw_deleted': 5, 'hourly_deleted': 0})
+        hourly = ProductHistoryRollup.objects.get(resolution='hour', bucket=day + timedelta(hours=1))
+        self.assertEqual(
+            (hourly.price_open, hourly.price_low, hourly.price_high, hourly.price_close, hourly.quantity_close, hourly.changes),
+            (5, 5, 7, 6, 15, 3),
+        )
+        daily = ProductHistoryRollup.objects.get(resolution='day', bucket=day)
+        self.assertEqual((daily.price_open, daily.price_low, daily.price_high, daily.price_close, daily.changes), (5, 4, 7, 4, 4))
+        # Rerunning rewrites the newest buckets in place.
+        self.assertEqual(compact()['raw_deleted'], 0)
+        self.assertEqual(ProductHistoryRollup.objects.count(), 5)
+
+        url = reverse('inventory:api_product_history', args=[self.product.pk])
+        data = self.client.get(url, {'since': day.isoformat(), 'resolution': 'day'}).json()
+        self.assertEqual([point['price_close'] for point in data['points']], ['4.00', '8.00'])
+        self.assertEqual(data['current']['unit_price'], '5.00')
+        data = self.client.get(url, {'since': day.isoformat(), 'until': (day + timedelta(days=1)).isoformat()}).json()
+        self.assertEqual((data['resolution'], len(data['points'])), ('hour', 2))
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'resolution': 'minute'}).status_code, 400)
+
+
+class SellerStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user('seller@example.com', 'pass', name='Seller', surname='One')
+        cls.other = CustomUser.objects.create_user('other@example.com', 'pass', name='Other', surname='Two')
+        cls.buyer = CustomUser.objects.create_user('buyer@example.com', 'pass', name='Buyer', surname='Three')
+
+    def stats(self):
+        return sorted(
+            SellerStats.objects.exclude(products=0, rating_count=0, units_sold=0)
+            .values_list('owner_id', 'unit', 'products', 'stock_value', 'rating_sum', 'rating_count', 'units_sold')
+        )
+
+    def new_product(self, name, unit, unit_price, quantity):
+        return Product.objects.create(owner=self.seller, name=name, unit=unit, unit_price=unit_price, quantity=quantity)
+
+    def test_incremental_rows_match_a_rebuild(self):
+        milk = self.new_product('Milk', 'l', 2, 10)
+        juice = self.new_product('Juice', 'l', 3, 5)
+        nails = self.new_product('Nails', 'pcs', Decimal('0.10'), 1000)
+        Rating.objects.create(product=milk, user=self.buyer, value=4)
+        Rating.objects.create(product=nails, user=self.buyer, value=2)
+        Cart.objects.create(user=self.buyer, product=milk, quantity=3)
+        Cart.objects.create(user=self.buyer, product=nails, quantity=100)
+        checkout(self.buyer)
+
+        juice = Product.objects.get(pk=juice.pk)
+        juice.unit_price = 4
+        juice.save()
+        nails = Product.objects.get(pk=nails.pk)
+        nails.owner, nails.unit = self.other, Product.Unit.PACK
+        nails.save()
+        Product.objects.get(pk=milk.pk).delete()
+
+        incremental = self.stats()
+        self.assertEqual(incremental, [
+            (self.seller.pk, 'l', 1, Decimal('20'), 0, 0, Decimal('0')),
+            (self.other.pk, 'pack', 1, Decimal('90'), 2, 1, Decimal('100')),
+        ])
+        rebuild_seller_stats()
+        self.assertEqual(self.stats(), incremental)
+
+    def test_dashboard(self):
+        Product.objects.create(owner=self.seller, name='Rice', unit='kg', unit_price=3, quantity=4)
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('inventory:seller_dashboard'))
+        self.assertEqual(response.context['total_products'], 1)
+        self.assertEqual(response.context['stats'][0].stock_value, Decimal('12'))
+        self.assertContains(response, 'kilogram')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkOperationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user('seller@example.com', 'pass', name='Seller', surname='One')
+        cls.other = CustomUser.objects.create_user('other@example.com', 'pass', name='Other', surname='Two')
+        cls.products = [
+            Product.objects.create(owner=cls.seller, name=f'Board {i}', unit='m2', unit_price=10 + i, quantity=5)
+            for i in range(5)
+        ]
+        cls.foreign = Product.objects.create(owner=cls.other, name='Board X', unit='m2', unit_price=10, quantity=5)
+
+    def seller_stats(self):
+        return sorted(SellerStats.objects.exclude(products=0).values_list(
+            'owner_id', 'unit', 'products', 'stock_value', 'rating_sum', 'rating_count', 'units_sold',
+        ))
+
+    def assertSellerStatsConsistent(self):
+        incremental = self.seller_stats()
+        rebuild_seller_stats()
+        self.assertEqual(incremental, self.seller_stats())
+
+    def test_price_and_stock_updates(self):
+        hold(self.other, self.products[0], 3)
+        selection = Product.objects.filter(owner=self.seller)
+        progress = []
+        changed = update_products(selection, price=price_change(percent=10), chunk_size=2, progress=lambda *p: progress.append(p))
+        self.assertEqual(changed, 5)
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        self.assertEqual(
+            list(selection.order_by('pk').values_list('unit_price', flat=True)),
+            [Decimal('11.00'), Decimal('12.10'), Decimal('13.20'), Decimal('14.30'), Decimal('15.40')],
+        )
+        # Stock held by a cart can't be taken away.
+        update_products(selection, stock=stock_change(set_to=0))
+        self.assertEqual(list(selection.order_by('pk').values_list('quantity', flat=True)), [3, 0, 0, 0, 0])
+        self.assertEqual(ProductHistory.objects.filter(product=self.products[1]).count(), 3)
+        self.assertSellerStatsConsistent()
+
+    def test_delete_with_dependents(self):
+        buyer = self.other
+        Rating.objects.create(product=self.products[0], user=buyer, value=5)
+        Cart.objects.create(user=buyer, product=self.products[0], quantity=1)
+        checkout(buyer)
+        hold(buyer, self.products[1], 2)
+        Rating.objects.create(product=self.foreign, user=self.seller, value=3)
+
+        with self.assertNumQueries(15):
+            deleted = delete_products(Product.objects.filter(owner=self.seller), chunk_size=10)
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(Product.objects.values_list('pk', flat=True)), [self.foreign.pk])
+        self.assertEqual(Order.objects.get(user=buyer).lines.get().product_id, None)
+        self.assertFalse(Cart.objects.filter(product__isnull=True).exists())
+        self.assertEqual(Rating.objects.count(), 1)
+        self.assertSellerStatsConsistent()
+
+    def test_delete_cascades_past_first_level(self):
+        # A user's products and orders have dependents of their own: ratings by
+        # others, order lines. They must go too rather than fail or be orphaned.
+        Rating.objects.create(product=self.foreign, user=self.seller, value=3)
+        Cart.objects.create(user=self.other, product=self.products[0], quantity=1)
+        checkout(self.other)
+
+        _delete_dependents(CustomUser, [self.other.pk])
+        _delete_where(CustomUser, 'id', [self.other.pk])
+        self.assertFalse(CustomUser.objects.filter(pk=self.other.pk).exists())
+        self.assertFalse(Product.objects.filter(pk=self.foreign.pk).exists())
+        self.assertFalse(Rating.objects.exists())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLine.objects.exists())
+        self.assertEqual(Product.objects.filter(owner=self.seller).count(), 5)
+
+    def test_view_only_touches_own_products(self):
+        self.client.force_login(self.seller)
+        url = reverse('inventory:bulk_edit')
+        response = self.client.get(url, {'max_price': 11})
+        self.assertEqual(response.context['count'], 2)
+        self.client.post(f'{url}?max_price=11', {'action': 'price_amount', 'value': '-1'})
+        self.client.post(url, {'action': 'delete', 'ids': f'{self.products[4].pk},{self.foreign.pk}'})
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('unit_price', flat=True)),
+            [Decimal('9.00'), Decimal('10.00'), Decimal('12.00'), Decimal('13.00'), Decimal('10.00')],
+        )
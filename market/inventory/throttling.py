@@ -0,0 +1,59 @@
+"""
+Per-user request throttling and idempotency keys, both kept in the default cache.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+IDEMPOTENCY_TIMEOUT = 60 * 60
+
+
+class TokenBucket:
+    """
+    A token bucket per key: `capacity` requests in a burst, refilled at `rate` per
+    second. State is one cache entry of (tokens, timestamp) that expires once the
+    bucket would be full again.
+
+    The read and the write are separate cache calls, so truly simultaneous requests
+    from one user can both spend the same token; the limit is approximate by a few
+    requests, which is fine for keeping bots off an endpoint.
+    """
+
+    def __init__(self, name, capacity_setting, rate_setting):
+        self.name = name
+        self.capacity_setting = capacity_setting
+        self.rate_setting = rate_setting
+
+    def consume(self, key, now=None):
+        """Take a token for `key`; returns (allowed, seconds until the next token)."""
+        capacity = getattr(settings, self.capacity_setting)
+        rate = getattr(settings, self.rate_setting)
+        now = time.time() if now is None else now
+        cache_key = f'throttle:{self.name}:{key}'
+        tokens, updated_at = cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            return False, (1 - tokens) / rate
+        tokens -= 1
+        cache.set(cache_key, (tokens, now), timeout=int((capacity - tokens) / rate) + 1)
+        return True, 0
+
+
+add_to_cart_bucket = TokenBucket('add_to_cart', 'ADD_TO_CART_BURST', 'ADD_TO_CART_RATE')
+
+
+def _idempotency_cache_key(scope, key):
+    # Keys come from clients; hash them so any string makes a valid cache key.
+    return f'idempotency:{scope}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def claim_idempotency_key(scope, key):
+    """True the first time `key` is seen in `scope` within IDEMPOTENCY_TIMEOUT, False on replays."""
+    return cache.add(_idempotency_cache_key(scope, key), 1, timeout=IDEMPOTENCY_TIMEOUT)
+
+
+def forget_idempotency_key(scope, key):
+    """Let a key be retried, for requests that failed before doing anything."""
+    cache.delete(_idempotency_cache_key(scope, key))
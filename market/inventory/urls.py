@@ -1,18 +1,33 @@
+from django.conf import settings
 from django.urls import path
+from inventory import api as inventory_api
 from inventory import views as inventory_views
 
+if settings.ASYNC_VIEWS:
+    from inventory import async_views as read_views
+else:
+    read_views = inventory_views
+
 
 app_name = "inventory"
 
 urlpatterns = [
-    path('', inventory_views.products_view, name='products'),
-    path('<int:pk>/', inventory_views.product_detail_view, name='product_detail'),
+    path('', read_views.products_view, name='products'),
+    path('export.csv', read_views.export_products_csv_view, name='export_products'),
+    path('<int:pk>/', read_views.product_detail_view, name='product_detail'),
     path('add/', inventory_views.add_product_view, name='add_product'),
     path('<int:pk>/edit/', inventory_views.edit_product_view, name='edit_product'),
     path('<int:pk>/delete/', inventory_views.delete_product_view, name='delete_product'),
-    path('cart/', inventory_views.cart_view, name='cart'),
+    path('bulk/', inventory_views.bulk_edit_view, name='bulk_edit'),
+    path('dashboard/', inventory_views.seller_dashboard_view, name='seller_dashboard'),
+    path('cart/', read_views.cart_view, name='cart'),
     path('<int:pk>/add-to-cart/', inventory_views.add_to_cart_view, name='add_to_cart'),
     path('cart/<int:pk>/remove/', inventory_views.remove_from_cart_view, name='remove_from_cart'),
     path('cart/<int:pk>/update/', inventory_views.update_cart_quantity_view, name='update_cart_quantity'),
+    path('cart/reconcile/', inventory_views.reconcile_cart_view, name='reconcile_cart'),
     path('cart/purchase/', inventory_views.purchase_view, name='purchase'),
+    path('api/products/', inventory_api.product_list_api, name='api_products'),
+    path('api/products/<int:pk>/', inventory_api.product_detail_api, name='api_product_detail'),
+    path('api/products/<int:pk>/history/', inventory_api.product_history_api, name='api_product_history'),
+    path('api/cart/', inventory_api.cart_api, name='api_cart'),
 ]
\ No newline at end of file
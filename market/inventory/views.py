@@ -1,24 +1,68 @@
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .forms import ProductForm
-from .models import Product, Cart, Rating
-from .filters import ProductFilter
+from .bulk import run_action
+from .forms import BulkEditForm, ProductForm
+from .models import Product, Cart, Rating, SellerStats, SimilarProduct
+from .filters import SORT_COLUMNS, ProductFilter
+from .checkout import CheckoutConflict, checkout
+from .leaderboards import BOARDS, top_products
+from .reservations import InsufficientStock, add_to_hold, hold, line_available, reconcile, release
+from .throttling import add_to_cart_bucket, claim_idempotency_key, forget_idempotency_key
+from .pagination import CursorPage, KeysetPaginator
+from .catalog_io import stream_csv
+from .cache import get_listing_page, get_products, listing_cache_key, set_listing_page
+from .facets import get_facets
+from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Avg
+from django.db.models import BooleanField, DecimalField, ExpressionWrapper, F, FloatField, Q, Sum, Window
+from django.db.models.functions import Cast, NullIf, Round
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 import logging
+import math
+import uuid
 
 logger = logging.getLogger(__name__)
 
+PRODUCTS_PER_PAGE = 4
+PAGE_NUMBERS_MAX_RESULTS = 200
+EXPORT_COLUMNS = ['id', 'name', 'unit_price', 'unit', 'quantity', 'avg_rating', 'rating_count']
+EXPORT_CHUNK_SIZE = 2000
+
 def products_view(request):
     products = Product.objects.all().order_by('-id')
     product_filter = ProductFilter(request.GET, queryset=products)
     products = product_filter.qs
-    f = product_filter.form
+    _style_filter_form(product_filter.form)
+
+    cursor = request.GET.get('cursor')
+    page_number = request.GET.get('page', 1)
+    position = ('cursor', cursor) if cursor is not None else ('page', str(page_number))
+    cache_key = listing_cache_key(product_filter, position)
+    listing = get_listing_page(cache_key)
+    if listing is None:
+        listing = _build_listing(products, cursor, page_number)
+        set_listing_page(cache_key, listing)
+
+    facets = get_facets(product_filter)
+    _label_unit_choices(product_filter.form, facets)
+
+    page_obj, page_numbers = _listing_page(products, listing, get_products(listing['ids']))
+    leaderboards = {board: top_products(board) for board in BOARDS}
+    return render(request, 'inventory/products.html', {
+        'products': page_obj, 'filter': product_filter, 'page_numbers': page_numbers, 'form_key': uuid.uuid4().hex,
+        'leaderboards': leaderboards, 'facets': facets,
+    })
+
+
+def _style_filter_form(f):
     if 'name' in f.fields:
         f.fields['name'].widget.attrs.update({'class': 'form-control', 'placeholder': 'Search name'})
     if 'unit' in f.fields:
         f.fields['unit'].widget.attrs.update({'class': 'form-select'})
+    if 'sort' in f.fields:
+        f.fields['sort'].widget.attrs.update({'class': 'form-select', 'onchange': 'this.form.submit()'})
     if 'min_price' in f.fields:
         f.fields['min_price'].widget.attrs.update({'class': 'form-control form-control-sm', 'id': 'id_min_price', 'step': '0.01'})
     if 'max_price' in f.fields:
@@ -27,43 +71,116 @@ def products_view(request):
         f.fields['min_quantity'].widget.attrs.update({'class': 'form-control form-control-sm', 'id': 'id_min_quantity', 'step': '0.01'})
     if 'max_quantity' in f.fields:
         f.fields['max_quantity'].widget.attrs.update({'class': 'form-control form-control-sm', 'id': 'id_max_quantity', 'step': '0.01'})
-    
-    paginator = Paginator(products, 4)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-    elided_page_range = paginator.get_elided_page_range(
+
+
+def _label_unit_choices(f, facets):
+    """Append the number of matching products to each unit in the filter's select."""
+    if 'unit' not in f.fields:
+        return
+    # The field adds its own empty choice back.
+    f.fields['unit'].choices = [(value, f'{label} ({count})') for value, label, count in facets['units']]
+
+
+def _listing_page(products, listing, object_list):
+    """Rebuild the template's page object and page range from a cached listing."""
+    if listing['count'] is None:
+        return CursorPage(object_list, listing['next_cursor'], listing['previous_cursor']), None
+    paginator = Paginator(products, PRODUCTS_PER_PAGE)
+    paginator.count = listing['count']
+    page_obj = paginator.page(listing['number'])
+    page_obj.object_list = object_list
+    page_numbers = paginator.get_elided_page_range(
     number=page_obj.number,
     on_each_side=2,
     on_ends=1)
-    
-    for product in page_obj:
-        avg = product.ratings.aggregate(avg=Avg('value'))['avg']
-        if avg is not None:
-            product.avg_rating = round(avg, 1)
-            product.rating_count = int(round(avg))
-            product.has_rating = True
-        else:
-            product.avg_rating = 0
-            product.rating_count = 0
-            product.has_rating = False
-    
-    return render(request, 'inventory/products.html', {'products': page_obj, 'filter': product_filter, 'page_numbers': elided_page_range})
+    return page_obj, page_numbers
+
+
+def _build_listing(products, cursor, page_number):
+    """Resolve one listing page to plain ids and pager state so it can be cached."""
+    # Search results are ordered by rank, which keyset pagination on -id can't follow.
+    if 'search_rank' in products.query.annotations:
+        paginator = Paginator(products, PRODUCTS_PER_PAGE)
+        page_obj = paginator.get_page(page_number)
+        return {'ids': list(page_obj.object_list.values_list('pk', flat=True)), 'count': paginator.count, 'number': page_obj.number}
+    # Small result sets keep the numbered pager; anything larger switches to keyset
+    # pagination so deep pages never pay for COUNT(*) or an OFFSET scan. Leaderboard
+    # sorts page on (score, id) the same way, so they run to the last product too.
+    if cursor is None:
+        bounded_count = products[:PAGE_NUMBERS_MAX_RESULTS + 1].count()
+        if bounded_count <= PAGE_NUMBERS_MAX_RESULTS:
+            paginator = Paginator(products, PRODUCTS_PER_PAGE)
+            paginator.count = bounded_count
+            page_obj = paginator.get_page(page_number)
+            return {'ids': list(page_obj.object_list.values_list('pk', flat=True)), 'count': bounded_count, 'number': page_obj.number}
+    return _cursor_listing(_keyset_paginator(products).get_page(cursor))
+
+
+def _keyset_paginator(products):
+    score = _score_column(products)
+    fields = ['pk'] if score is None else ['pk', score]
+    return KeysetPaginator(products.values(*fields), PRODUCTS_PER_PAGE, key='pk', score=score)
+
+
+def _cursor_listing(page_obj):
+    return {
+        'ids': [row['pk'] for row in page_obj],
+        'count': None,
+        'next_cursor': page_obj.next_cursor,
+        'previous_cursor': page_obj.previous_cursor,
+    }
+
+
+def _score_column(products):
+    """The leaderboard column a listing is sorted by, or None when it is newest first."""
+    ordering = tuple(products.query.order_by)
+    return next((column for column in SORT_COLUMNS.values() if ordering == (f'-{column}', '-id')), None)
+
+
+def _export_rows(request):
+    products = ProductFilter(request.GET, queryset=Product.objects.all().order_by('-id')).qs
+    # The average is computed in the SELECT from the maintained counters, and rows come
+    # off a server-side cursor, so memory stays flat however many products match.
+    return products.annotate(
+        avg_rating=Round(Cast('rating_sum', FloatField()) / NullIf('rating_count', 0), 2),
+    ).values_list(*EXPORT_COLUMNS)
+
+
+def _export_response(content):
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="products.csv"'
+    return response
+
+
+def export_products_csv_view(request):
+    rows = _export_rows(request).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return _export_response(stream_csv(EXPORT_COLUMNS, rows))
+
+
+def _similar_products(pk):
+    # One lookup on the (product, rank) index; neighbours are precomputed by inventory.recommendations.
+    return (
+        SimilarProduct.objects.filter(product_id=pk).select_related('similar')
+        .order_by('rank')[:settings.SIMILAR_PRODUCTS_SHOWN]
+    )
 
 
 def product_detail_view(request, pk):
     product = get_object_or_404(Product, pk=pk)
+    user_rating = None
     if request.method == 'POST' and request.user.is_authenticated:
         rating_value = int(request.POST.get('rating'))
         if 1 <= rating_value <= 5:
             
-            Rating.objects.update_or_create(product=product, user=request.user, defaults={'value': rating_value})
-    avg = product.ratings.aggregate(avg=Avg('value'))['avg']
-    avg_rating = round(avg, 2) if avg is not None else None
-    user_rating = None
-    if request.user.is_authenticated:
+            user_rating, _ = Rating.objects.update_or_create(product=product, user=request.user, defaults={'value': rating_value})
+            product.refresh_from_db(fields=['rating_sum', 'rating_count'])
+    if request.user.is_authenticated and user_rating is None:
         user_rating = product.ratings.filter(user=request.user).first()
+    similar = list(_similar_products(pk))
 
-    return render(request, 'inventory/product_detail.html', {'product': product, 'avg_rating': avg_rating, 'user_rating': user_rating})
+    return render(request, 'inventory/product_detail.html', {
+        'product': product, 'avg_rating': product.avg_rating, 'user_rating': user_rating, 'similar': similar,
+    })
 
 @login_required
 def add_product_view(request):
@@ -101,40 +218,86 @@ def delete_product_view(request, pk):
     return render(request, 'inventory/confirm_delete.html', {'object': product})
 
 
+@login_required
+def bulk_edit_view(request):
+    # Sellers change their own products: an id list or everything matching the filter in the query string.
+    products = Product.objects.filter(owner=request.user).order_by('-id')
+    product_filter = ProductFilter(request.GET, queryset=products)
+    _style_filter_form(product_filter.form)
+    form = BulkEditForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        ids = form.cleaned_data['ids']
+        selection = products.filter(pk__in=ids) if ids is not None else product_filter.qs
+        action = form.cleaned_data['action']
+        count = run_action(action, form.cleaned_data['value'], selection)
+        messages.success(request, f"{'Deleted' if action == 'delete' else 'Updated'} {count} products")
+        return redirect(request.get_full_path())
+    selection = product_filter.qs
+    return render(request, 'inventory/bulk_edit.html', {
+        'form': form, 'filter': product_filter, 'count': selection.count(), 'preview': selection[:20],
+    })
+
+
 @login_required
 def cart_view(request):
-    cart_items = Cart.objects.filter(user=request.user, status=Cart.Status.IN_CART).select_related('product')
-    updated = False
-    for item in cart_items:
-        if item.quantity > item.product.quantity:
-            item.quantity = item.product.quantity
-            item.save()
-            updated = True
-        item.subtotal = item.product.unit_price * item.quantity
-    if updated:
-        messages.warning(request, 'Some quantities were adjusted due to stock changes.')
-    total = sum(item.subtotal for item in cart_items)
-    return render(request, 'inventory/cart.html', {'cart_items': cart_items, 'total': total})
+    # Subtotals, the cart total and over-stock flags all come back in this one query;
+    # viewing the cart never writes. Only lines whose hold lapsed can be over stock;
+    # clamping them is an explicit POST to reconcile_cart_view.
+    line_subtotal = ExpressionWrapper(F('product__unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=4))
+    cart_items = list(
+        Cart.objects.filter(user=request.user, status=Cart.Status.IN_CART)
+        .select_related('product')
+        .annotate(
+            subtotal=line_subtotal,
+            total=Window(Sum(line_subtotal)),
+            available=line_available(),
+            over_stock=ExpressionWrapper(Q(quantity__gt=line_available()), output_field=BooleanField()),
+        )
+        .order_by('added_at', 'pk')
+    )
+    total = cart_items[0].total if cart_items else 0
+    has_over_stock = any(item.over_stock for item in cart_items)
+    return render(request, 'inventory/cart.html', {'cart_items': cart_items, 'total': total, 'has_over_stock': has_over_stock})
+
+
+@login_required
+def reconcile_cart_view(request):
+    if request.method == 'POST':
+        clamped, removed = reconcile(request.user)
+        if clamped:
+            messages.warning(request, 'Some quantities were adjusted due to stock changes.')
+        if removed:
+            messages.warning(request, 'Items that are out of stock were removed from your cart.')
+    return redirect('inventory:cart')
 
 
 @login_required
+@require_POST
 def add_to_cart_view(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    if product.quantity <= 0:
-        messages.error(request, f'{product.name} is out of stock')
+    allowed, retry_after = add_to_cart_bucket.consume(request.user.pk)
+    if not allowed:
+        response = HttpResponse('Too many add-to-cart requests, please slow down.', status=429, content_type='text/plain')
+        response['Retry-After'] = str(math.ceil(retry_after))
+        return response
+    # Double submits and retries carry the same key and are applied once.
+    idempotency_key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    scope = f'add_to_cart:{request.user.pk}'
+    if idempotency_key and not claim_idempotency_key(scope, idempotency_key):
         return redirect('inventory:products')
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user,
-        product=product,
-        status=Cart.Status.IN_CART,
-        defaults={'quantity': 1}
-    )
-    if not created:
-        if cart_item.quantity >= product.quantity:
+
+    product = get_object_or_404(Product.objects.only('pk', 'name'), pk=pk)
+    try:
+        add_to_hold(request.user, product)
+    except InsufficientStock as e:
+        if e.available > 0:
             messages.error(request, f'Cannot add more {product.name}, not enough stock')
-            return redirect('inventory:products')
-        cart_item.quantity += 1
-        cart_item.save()
+        else:
+            messages.error(request, f'{product.name} is out of stock')
+        return redirect('inventory:products')
+    except Exception:
+        if idempotency_key:
+            forget_idempotency_key(scope, idempotency_key)
+        raise
     messages.success(request, f'{product.name} added to cart')
     
     return redirect('inventory:products')
@@ -142,10 +305,9 @@ def add_to_cart_view(request, pk):
 
 @login_required
 def remove_from_cart_view(request, pk):
-    cart_item = get_object_or_404(Cart, pk=pk, user=request.user, status=Cart.Status.IN_CART)
-    product_name = cart_item.product.name
-    cart_item.delete()
-    messages.success(request, f'{product_name} removed from cart')
+    cart_item = get_object_or_404(Cart.objects.select_related('product'), pk=pk, user=request.user, status=Cart.Status.IN_CART)
+    release(cart_item)
+    messages.success(request, f'{cart_item.product.name} removed from cart')
     return redirect('inventory:cart')
 
 
@@ -157,34 +319,40 @@ def update_cart_quantity_view(request, pk):
             new_quantity = int(request.POST.get('quantity', 1))
             if new_quantity < 1:
                 messages.error(request, 'Quantity must be at least 1')
-            elif new_quantity > cart_item.product.quantity:
-                messages.error(request, f'Only {cart_item.product.quantity} available')
             else:
-                cart_item.quantity = new_quantity
-                cart_item.save()
+                hold(request.user, cart_item.product, new_quantity)
                 messages.success(request, 'Quantity updated')
         except ValueError:
             messages.error(request, 'Invalid quantity')
+        except InsufficientStock as e:
+            messages.error(request, f'Only {e.available} available')
     return redirect('inventory:cart')
 
 
 @login_required
 def purchase_view(request):
     if request.method == 'POST':
-        cart_items = Cart.objects.filter(user=request.user, status=Cart.Status.IN_CART).select_related('product')
-        insufficient_stock = []
-        for item in cart_items:
-            if item.quantity > item.product.quantity:
-                insufficient_stock.append(item.product.name)
-        if insufficient_stock:
-            messages.error(request, f'Insufficient stock for: {", ".join(insufficient_stock)}. Please update quantities.')
+        try:
+            result = checkout(request.user)
+        except CheckoutConflict:
+            messages.error(request, 'Stock changed while you were checking out. Please try again.')
             return redirect('inventory:cart')
-        
-        
-        for item in cart_items:
-            item.product.quantity -= item.quantity
-            item.product.save()
-            item.delete()  
-        
-        messages.success(request, 'Purchase completed successfully')
-    return redirect('inventory:cart')
\ No newline at end of file
+        if result.shortfalls:
+            names = ", ".join(s.name for s in result.shortfalls)
+            messages.error(request, f'Insufficient stock for: {names}. Please update quantities.')
+        elif result.purchased:
+            messages.success(request, f'Purchase completed successfully (order #{result.order.pk})')
+    return redirect('inventory:cart')
+
+
+@login_required
+def seller_dashboard_view(request):
+    # Totals are precomputed per unit (inventory.seller_stats): one small query, whatever the catalogue size.
+    stats = list(SellerStats.objects.filter(owner=request.user, products__gt=0).order_by('unit'))
+    rating_sum = sum(row.rating_sum for row in stats)
+    rating_count = sum(row.rating_count for row in stats)
+    return render(request, 'inventory/dashboard.html', {
+        'stats': stats,
+        'total_products': sum(row.products for row in stats),
+        'avg_rating': round(rating_sum / rating_count, 2) if rating_count else None,
+    })
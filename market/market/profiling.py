@@ -0,0 +1,212 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestProfilingMiddleware records, per URL name, wall time, query count, DB time and
+template render time for a rolling window of recent requests, and flags requests
+that repeat the same SQL shape often enough to look like N+1 queries. Stats are
+per process and kept in memory; `request_stats_view` shows them to staff.
+"""
+from collections import Counter, deque
+from contextvars import ContextVar
+import logging
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+_current_profile = ContextVar('request_profile', default=None)
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'db_time', 'template_time', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        # Params are bound separately, so the SQL is already its own shape bar IN lists.
+        self.shapes[_IN_LIST.sub('IN (...)', sql)] += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_wrapper(conn):
+    # Equivalent to a permanent `conn.execute_wrapper(_record_query)`; it is a no-op
+    # outside a profiled request, and async views' queries run on other threads'
+    # connections, so it is attached to every connection rather than per request.
+    if _record_query not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def _instrument_new_connection(sender, connection, **kwargs):
+    if getattr(settings, 'REQUEST_PROFILING', False):
+        install_query_wrapper(connection)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        if profile is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """The stock Django template backend, with top-level renders timed."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name).template, self)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class RequestStats:
+    """Bounded rolling samples per URL name; memory is window x number of routes."""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, wall, profile, n_plus_one_sql=None):
+        with self._lock:
+            entry = self._views.get(view_name)
+            if entry is None:
+                entry = self._views[view_name] = {
+                    'requests': 0,
+                    'n_plus_one': 0,
+                    'last_n_plus_one_sql': None,
+                    'samples': deque(maxlen=self.window),
+                }
+            entry['requests'] += 1
+            entry['samples'].append((wall, profile.db_time, profile.template_time, profile.queries))
+            if n_plus_one_sql is not None:
+                entry['n_plus_one'] += 1
+                entry['last_n_plus_one_sql'] = n_plus_one_sql[:500]
+
+    def snapshot(self):
+        with self._lock:
+            entries = [(name, dict(entry, samples=list(entry['samples']))) for name, entry in self._views.items()]
+        rows = []
+        for name, entry in sorted(entries):
+            samples = entry['samples']
+            walls = sorted(s[0] for s in samples)
+            dbs = sorted(s[1] for s in samples)
+            rows.append({
+                'view': name,
+                'requests': entry['requests'],
+                'window': len(samples),
+                'wall_ms_p50': _percentile(walls, 0.50) * 1000,
+                'wall_ms_p95': _percentile(walls, 0.95) * 1000,
+                'wall_ms_p99': _percentile(walls, 0.99) * 1000,
+                'db_ms_p50': _percentile(dbs, 0.50) * 1000,
+                'db_ms_p95': _percentile(dbs, 0.95) * 1000,
+                'template_ms_avg': sum(s[2] for s in samples) / len(samples) * 1000,
+                'queries_avg': sum(s[3] for s in samples) / len(samples),
+                'queries_max': max(s[3] for s in samples),
+                'n_plus_one': entry['n_plus_one'],
+                'last_n_plus_one_sql': entry['last_n_plus_one_sql'],
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+request_stats = RequestStats(getattr(settings, 'REQUEST_PROFILING_WINDOW', 500))
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.REQUEST_PROFILING_N_PLUS_ONE_THRESHOLD
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        install_query_wrapper(connection)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+            self.finish(request, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+            self.finish(request, profile, time.perf_counter() - start)
+
+    def finish(self, request, profile, wall):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match and match.view_name else '<unresolved>'
+        n_plus_one_sql = None
+        if profile.shapes:
+            sql, repeats = profile.shapes.most_common(1)[0]
+            if repeats >= self.threshold:
+                n_plus_one_sql = sql
+                logger.warning(f"Possible N+1 in {view_name}: {repeats}x {sql[:200]}")
+        request_stats.record(view_name, wall, profile, n_plus_one_sql)
+
+
+@staff_member_required
+def request_stats_view(request):
+    rows = request_stats.snapshot()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'views': rows})
+    return render(request, 'profiling/stats.html', {'rows': rows})
@@ -0,0 +1,60 @@
+"""
+Session engine and middleware: sessions are read from the cache (database as the
+durable copy) and only written when they change or their expiry needs extending.
+
+SESSION_SAVE_EVERY_REQUEST gave a 14-day sliding expiry at the cost of an UPDATE on
+django_session for every request. SlidingSessionMiddleware keeps the sliding
+expiry but only re-saves a session once less than SESSION_REFRESH_THRESHOLD
+seconds of it remain, so an active user costs one session write per
+SESSION_COOKIE_AGE - SESSION_REFRESH_THRESHOLD seconds instead of one per request.
+
+Saves are write-through (Django's cached_db engine), not write-behind: the rows
+that remain are logins, messages and a daily refresh, too few for deferring them
+to pay off. Write-behind would keep them only in the cache until a flush, so a
+Redis restart or an eviction would log users out, and it would need a flusher
+process. With write-through the database stays authoritative and reads still come
+from the cache.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils import timezone
+
+REFRESHED_AT_KEY = '_refreshed_at'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'market.sessions'
+
+    @classmethod
+    def clear_expired(cls, batch_size=5000):
+        """Delete expired rows in batches so cleanup never holds long locks; returns the count."""
+        model = cls.get_model_class()
+        expired = model.objects.filter(expire_date__lt=timezone.now()).order_by()
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+
+
+class SlidingSessionMiddleware(SessionMiddleware):
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key is not None:
+            self.refresh_expiry(session)
+        return super().process_response(request, response)
+
+    @staticmethod
+    def refresh_expiry(session):
+        # Sessions that failed to load (expired, unknown key) stay empty and unsaved.
+        if not session.keys() or session.get_expire_at_browser_close():
+            return
+        now = int(time.time())
+        remaining = session.get(REFRESHED_AT_KEY, 0) + session.get_expiry_age() - now
+        if session.modified or remaining < settings.SESSION_REFRESH_THRESHOLD:
+            # Marks the session modified, so SessionMiddleware saves it and re-sends the cookie.
+            session[REFRESHED_AT_KEY] = now
@@ -54,7 +54,8 @@ INSTALLED_APPS += [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "market.profiling.RequestProfilingMiddleware",
+    "market.sessions.SlidingSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -66,7 +67,8 @@ ROOT_URLCONF = "market.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Stock DjangoTemplates with render time reported to the profiling middleware.
+        "BACKEND": "market.profiling.ProfilingDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -74,6 +76,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "inventory.context_processors.cart",
             ],
         },
     },
@@ -81,6 +84,14 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "market.wsgi.application"
 
+# Route the catalog/cart read views to inventory.async_views (set by market/asgi.py)
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
+# Per-view query/timing stats from market.profiling, shown to staff at /_stats/
+REQUEST_PROFILING = config("REQUEST_PROFILING", default=True, cast=bool)
+REQUEST_PROFILING_WINDOW = 500  # samples kept per URL name for the percentiles
+REQUEST_PROFILING_N_PLUS_ONE_THRESHOLD = 5  # same SQL shape this many times in one request
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -96,6 +107,21 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": config("REDIS_URL", default="redis://127.0.0.1:6379/1"),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # A Redis outage degrades to cache misses instead of 500s.
+            "IGNORE_EXCEPTIONS": True,
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -150,8 +176,11 @@ LOGIN_REDIRECT_URL = '/users/profile/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Session settings
+SESSION_ENGINE = "market.sessions"  # cache first, django_session as the durable copy
 SESSION_COOKIE_AGE = 14 * 24 * 60 * 60  # 14 днів
-SESSION_SAVE_EVERY_REQUEST = True
+# Sliding expiry without a write per request: re-save once less than this remains
+SESSION_REFRESH_THRESHOLD = 13 * 24 * 60 * 60
+SESSION_SAVE_EVERY_REQUEST = False
 SESSION_COOKIE_HTTPONLY = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_SAMESITE = "Lax"
@@ -164,5 +193,32 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 
+# Cart notifications are queued and sent by `manage.py send_cart_notifications`
+CART_NOTIFICATION_DIGEST_WINDOW = 2 * 60  # adds within this many seconds share one email
+CART_NOTIFICATION_RETRY_BASE = 60  # seconds, doubled on every failed attempt
+CART_NOTIFICATION_MAX_ATTEMPTS = 5
+CART_NOTIFICATION_LEASE = 10 * 60  # seconds a worker has to send what it claimed before others may retry it
+
+# Adding to the cart holds stock this long; `manage.py release_expired_holds` frees it afterwards
+STOCK_HOLD_SECONDS = 15 * 60
+# Add-to-cart token bucket per user: bursts of this many, refilled at ADD_TO_CART_RATE per second
+ADD_TO_CART_BURST = 20
+ADD_TO_CART_RATE = 2
+
+# Leaderboards (inventory.leaderboards): entries kept per board, and how stale a cached board may get
+LEADERBOARD_SIZE = 100
+LEADERBOARD_MAX_STALENESS = 5 * 60
+
+# "Similar products" (inventory.recommendations): neighbours stored per product by
+# `manage.py rebuild_similar_products`, and how many of them the detail page shows
+SIMILAR_PRODUCTS_K = 20
+SIMILAR_PRODUCTS_SHOWN = 6
+
+# Price and stock history (inventory.history): `manage.py compact_product_history` keeps raw
+# changes and hourly rollups this many seconds (daily rollups forever); API responses are capped
+PRODUCT_HISTORY_RAW_RETENTION = 7 * 24 * 60 * 60
+PRODUCT_HISTORY_HOURLY_RETENTION = 90 * 24 * 60 * 60
+PRODUCT_HISTORY_MAX_POINTS = 1000
+
 # Site URL for email links
 SITE_URL = "http://localhost:8000"
\ No newline at end of file
@@ -17,11 +17,13 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import include, path
-from inventory import views as inventory_views
+from inventory.urls import read_views
+from market.profiling import request_stats_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path('', inventory_views.products_view, name='home'),
+    path("_stats/", request_stats_view, name='request_stats'),
+    path('', read_views.products_view, name='home'),
     path("inventory/", include("inventory.urls")),
     path("users/", include("users.urls", namespace="auth")),
 ]
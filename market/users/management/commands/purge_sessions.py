@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired rows from django_session in batches. Cached copies expire on their own; "
+        "run this from cron (it replaces `clearsessions` for the market.sessions engine)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = SessionStore.clear_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions ({settings.SESSION_ENGINE})"))